@@ -1,5 +1,5 @@
 from django.contrib import admin
-from . models import CustomUser, Ticket, Parking, ParkingPrice, ParkingSection, ParkingSlot, Vehicle, Passes
+from . models import CustomUser, Ticket, Parking, ParkingPrice, ParkingSection, ParkingSlot, Vehicle, Passes, TicketArchive, PricingRule, ChangeLog, UsageRollup
 
 admin.site.register(CustomUser)
 admin.site.register(Ticket)
@@ -7,4 +7,8 @@ admin.site.register(Parking)
 admin.site.register(ParkingPrice)
 admin.site.register(ParkingSection)
 admin.site.register(ParkingSlot)
-admin.site.register(Vehicle)
\ No newline at end of file
+admin.site.register(Vehicle)
+admin.site.register(TicketArchive)
+admin.site.register(PricingRule)
+admin.site.register(ChangeLog)
+admin.site.register(UsageRollup)
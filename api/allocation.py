@@ -0,0 +1,297 @@
+import threading
+import time
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.utils import timezone
+from .models import ParkingSection, ParkingSlot
+from .occupancy import move_slot
+from .changes import record_slot_changes
+
+parking_logger = logging.getLogger(__name__)
+
+# Slot sizes a vehicle of a given size can use, smallest (best fit) first
+SIZE_FIT = {
+    "TWO": ("TWO", "FOUR-SMALL", "FOUR-LARGE"),
+    "FOUR-SMALL": ("FOUR-SMALL", "FOUR-LARGE"),
+    "FOUR-LARGE": ("FOUR-LARGE",),
+}
+
+
+def free_slots():
+    """Queryset of slots that can be handed out to a vehicle"""
+    return ParkingSlot.objects.filter(is_available=True, is_booked=False, is_reserved=False)
+
+
+def slot_availability(parking_id):
+    """Free slot counts of a parking per section, slot type and charging"""
+    return (
+        free_slots()
+        .filter(section__parking_id=parking_id)
+        .values("section_id", "type", "is_charging_available")
+        .annotate(free=Count("id"))
+        .order_by("section_id", "type", "is_charging_available")
+    )
+
+
+def is_slot_free(slot):
+    return slot.is_available and not slot.is_booked and not slot.is_reserved
+
+
+def candidate_buckets(vehicle):
+    """Ordered (slot type, charging) buckets to try for a vehicle.
+
+    Electric vehicles prefer charging slots, everybody else prefers to leave
+    them free, and within that the smallest slot that fits comes first.
+    """
+    charging_order = (True, False) if vehicle.is_electric else (False, True)
+    return [
+        (slot_type, charging)
+        for slot_type in SIZE_FIT.get(vehicle.vehicle_type, (vehicle.vehicle_type,))
+        for charging in charging_order
+    ]
+
+
+def candidate_slots(vehicle):
+    """Free slots that fit ``vehicle``, best candidates first"""
+    buckets = candidate_buckets(vehicle)
+    preference = Case(
+        *[
+            When(type=slot_type, is_charging_available=charging, then=Value(rank))
+            for rank, (slot_type, charging) in enumerate(buckets)
+        ],
+        output_field=IntegerField(),
+    )
+    return (
+        free_slots()
+        .filter(type__in={slot_type for slot_type, _ in buckets})
+        .order_by(preference, "slot_number")
+    )
+
+
+class FreeLists:
+    """Free slot ids per section, bucketed by slot type and charging availability.
+
+    A per-parking index keeps the sections that still have free slots in a
+    bucket, so a pop does not depend on the number of slots in the table.
+    Not thread safe; SlotAllocator guards it.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.parking_index = {}
+        self.slot_keys = {}
+
+    def add(self, slot_id, slot_number, section_id, slot_type, charging, parking_id):
+        key = (section_id, slot_type, charging)
+        self.buckets.setdefault(key, {})[slot_id] = slot_number
+        self.slot_keys[slot_id] = (key, parking_id)
+        self.parking_index.setdefault((parking_id, slot_type, charging), {})[section_id] = None
+
+    def discard(self, slot_id):
+        key, parking_id = self.slot_keys.pop(slot_id, (None, None))
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return
+        bucket.pop(slot_id, None)
+        if not bucket:
+            section_id, slot_type, charging = key
+            del self.buckets[key]
+            sections = self.parking_index.get((parking_id, slot_type, charging))
+            if sections is not None:
+                sections.pop(section_id, None)
+
+    def sync(self, slot, parking_id):
+        self.discard(slot.id)
+        if is_slot_free(slot):
+            self.add(slot.id, slot.slot_number, slot.section_id, slot.type, slot.is_charging_available, parking_id)
+
+    def pop(self, parking_id, section_id, slot_type, charging):
+        if section_id is None:
+            sections = self.parking_index.get((parking_id, slot_type, charging))
+            if not sections:
+                return None
+            section_id = next(iter(sections))
+        bucket = self.buckets.get((section_id, slot_type, charging))
+        if not bucket:
+            return None
+        slot_id = next(iter(bucket))
+        slot = {
+            "id": slot_id,
+            "slot_number": bucket[slot_id],
+            "section": section_id,
+            "type": slot_type,
+            "is_charging_available": charging,
+        }
+        self.discard(slot_id)
+        return slot
+
+
+class SlotAllocator:
+    """In-memory free lists of parking slots.
+
+    Allocation pops from the first non empty bucket of the FreeLists.
+    Every worker process holds its own copy, so the lists are rebuilt from
+    the database every ``SLOT_ALLOCATOR_REFRESH_SECONDS`` and every pick is
+    confirmed with a conditional UPDATE before it is handed out.
+
+    The lock only covers the in-memory lists. Rebuilds read the database
+    without it, allocations keep using the old lists meanwhile, and slot
+    changes seen during a rebuild are replayed onto the new lists.
+    """
+
+    def __init__(self, refresh_seconds=None):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._refresh_seconds = refresh_seconds
+        self._loaded_at = None
+        self._loading = False
+        self._generation = 0
+        self._pending = []
+        self._lists = FreeLists()
+        self._section_parking = {}
+
+    @property
+    def refresh_seconds(self):
+        if self._refresh_seconds is not None:
+            return self._refresh_seconds
+        return getattr(settings, "SLOT_ALLOCATOR_REFRESH_SECONDS", 30)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._generation += 1
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._fresh():
+                return
+            loaded = self._loaded_at is not None
+        # One rebuild at a time; only callers without any lists wait for it
+        if not self._load_lock.acquire(blocking=not loaded):
+            return
+        try:
+            with self._lock:
+                if self._fresh():
+                    return
+                self._loading = True
+                self._pending = []
+                generation = self._generation
+            try:
+                section_parking = dict(ParkingSection.objects.values_list("id", "parking_id"))
+                lists = FreeLists()
+                rows = free_slots().values_list("id", "slot_number", "section_id", "type", "is_charging_available")
+                for slot_id, slot_number, section_id, slot_type, charging in rows.iterator():
+                    lists.add(slot_id, slot_number, section_id, slot_type, charging, section_parking.get(section_id))
+            except Exception:
+                with self._lock:
+                    self._loading = False
+                raise
+            with self._lock:
+                # Replay what changed while the rows were read
+                for slot_id, slot, parking_id in self._pending:
+                    if slot is None:
+                        lists.discard(slot_id)
+                    else:
+                        lists.sync(slot, parking_id)
+                self._lists = lists
+                self._section_parking.update(section_parking)
+                self._pending = []
+                self._loading = False
+                self._loaded_at = time.monotonic() if generation == self._generation else None
+        finally:
+            self._load_lock.release()
+
+    def parking_for_section(self, section_id):
+        """Parking a section belongs to, None for an unknown section"""
+        with self._lock:
+            parking_id = self._section_parking.get(section_id)
+        if parking_id is None:
+            parking_id = ParkingSection.objects.values_list("parking_id", flat=True).filter(pk=section_id).first()
+            if parking_id is not None:
+                with self._lock:
+                    self._section_parking[section_id] = parking_id
+        return parking_id
+
+    def _tracking(self):
+        with self._lock:
+            return self._loaded_at is not None or self._loading
+
+    def sync(self, slot):
+        """Bring the free lists in line with a saved slot"""
+        if not self._tracking():
+            return
+        parking_id = self.parking_for_section(slot.section_id) if is_slot_free(slot) else None
+        with self._lock:
+            if self._loading:
+                self._pending.append((slot.id, slot, parking_id))
+            self._lists.sync(slot, parking_id)
+
+    def remove(self, slot_id):
+        with self._lock:
+            if self._loading:
+                self._pending.append((slot_id, None, None))
+            self._lists.discard(slot_id)
+
+    def _book(self, slot):
+        """Mark a popped slot booked, with its counters and change entry, in one transaction"""
+        with transaction.atomic():
+            # Another worker may have taken the slot since our last refresh
+            booked = free_slots().filter(pk=slot["id"]).update(is_booked=True, updated_at=timezone.now())
+            if not booked:
+                return False
+            move_slot((slot["section"], "free_slots"), (slot["section"], "occupied_slots"))
+            record_slot_changes(
+                [
+                    ParkingSlot(
+                        id=slot["id"],
+                        section_id=slot["section"],
+                        slot_number=slot["slot_number"],
+                        type=slot["type"],
+                        is_charging_available=slot["is_charging_available"],
+                        is_booked=True,
+                    )
+                ]
+            )
+        return True
+
+    def allocate(self, vehicle, parking_id=None, section_id=None):
+        """Book and return the best free slot for ``vehicle``, or None.
+
+        The slot is returned as a dict built from the free lists, and is
+        marked booked in the database before it is handed out.
+        """
+        self._ensure_loaded()
+        if section_id is not None:
+            section_parking = self.parking_for_section(section_id)
+            if parking_id is not None and section_parking != parking_id:
+                return None
+            parking_id = section_parking
+        for slot_type, charging in candidate_buckets(vehicle):
+            while True:
+                with self._lock:
+                    slot = self._lists.pop(parking_id, section_id, slot_type, charging)
+                if slot is None:
+                    break
+                try:
+                    booked = self._book(slot)
+                except Exception:
+                    # Nothing was written, so the slot is still free
+                    with self._lock:
+                        self._lists.add(
+                            slot["id"], slot["slot_number"], slot["section"], slot_type, charging,
+                            self._section_parking.get(slot["section"]),
+                        )
+                    raise
+                if booked:
+                    slot["is_booked"] = True
+                    return slot
+                parking_logger.info(f"Skipping stale free slot {slot['id']}")
+        return None
+
+
+slot_allocator = SlotAllocator()
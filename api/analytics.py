@@ -0,0 +1,153 @@
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.db.models import Count, FloatField, Func
+from django.utils import timezone
+from .models import ParkingSlot, Ticket
+
+# Dwell time histogram bin edges in minutes, the last bin is open ended
+DWELL_BINS = (0, 15, 30, 60, 120, 240, 480, 1440, np.inf)
+DWELL_PERCENTILES = (50, 90, 95, 99)
+
+
+class Epoch(Func):
+    """Seconds since 1970 of a datetime column, computed by the database"""
+
+    template = "EXTRACT(EPOCH FROM %(expressions)s)::double precision"
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Stored as UTC text, with six fraction digits when there are any
+        column, params = compiler.compile(self.source_expressions[0])
+        sql = f"(CAST(strftime(%s, {column}) AS REAL) + CAST(substr({column}, 21) AS REAL) / 1000000)"
+        return sql, ("%s", *params, *params)
+
+
+def load_intervals(start, end, parking=None, section=None, tickets=None):
+    """Stays overlapping ``[start, end)`` as columns.
+
+    Returns ``(entry, exit, closed, section_ids, sections)``: epoch seconds,
+    whether the ticket is closed, and each stay's index into the
+    ``sections`` array of section ids. Open tickets are treated as leaving
+    at the end of the window.
+    """
+    if tickets is None:
+        tickets = Ticket.objects.all()
+    tickets = tickets.filter(parking_slot__isnull=False, entry_time__lt=end).exclude(exit_time__lte=start)
+    if parking is not None:
+        tickets = tickets.filter(parking_slot__section__parking_id=parking)
+    if section is not None:
+        tickets = tickets.filter(parking_slot__section_id=section)
+    rows = tickets.annotate(entry=Epoch("entry_time"), exit=Epoch("exit_time")).values_list(
+        "entry", "exit", "parking_slot__section_id"
+    )
+
+    # Columns straight from the cursor rows, with no per-row Python work
+    entries, exits, section_ids = tuple(zip(*rows.iterator(chunk_size=10000))) or ((), (), ())
+    entry = np.array(entries, dtype=float)
+    # Open tickets have no exit, which NumPy reads as NaN
+    exit = np.array(exits, dtype=float)
+    closed = ~np.isnan(exit)
+    exit = np.where(closed, exit, end.timestamp())
+    sections, codes = np.unique(np.array(section_ids, dtype=object).astype(str), return_inverse=True)
+    return entry, exit, closed, codes, sections
+
+
+def dwell_stats(entry, exit, bins=DWELL_BINS):
+    """Histogram, percentiles and mean of stay lengths in minutes"""
+    minutes = (exit - entry) / 60
+    counts, edges = np.histogram(minutes, bins=bins)
+    if not len(minutes):
+        return {"count": 0, "mean": None, "percentiles": {}, "histogram": []}
+    return {
+        "count": int(len(minutes)),
+        "mean": round(float(minutes.mean()), 2),
+        "percentiles": {
+            f"p{q}": round(float(value), 2)
+            for q, value in zip(DWELL_PERCENTILES, np.percentile(minutes, DWELL_PERCENTILES))
+        },
+        "histogram": [
+            {"from": float(low), "to": None if np.isinf(high) else float(high), "count": int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], counts)
+        ],
+    }
+
+
+def peak_occupancy(entry, exit, groups, group_count):
+    """Peak concurrent stays per group and when it was first reached.
+
+    A sweep line over every entry (+1) and exit (-1) event, sorted by group,
+    time and with exits first, is one cumulative sum. Every group's events
+    add up to zero, so the running sum restarts at each group boundary
+    without any per-group loop. The three sort keys are packed into one
+    int64 (group, microsecond, exit first), which sorts about three times
+    faster than ``np.lexsort``.
+    """
+    peaks = np.zeros(group_count, dtype=np.int64)
+    peak_at = np.full(group_count, np.nan)
+    if not len(entry):
+        return peaks, peak_at
+    times = np.concatenate((entry, exit))
+    deltas = np.concatenate((np.ones(len(entry), dtype=np.int64), -np.ones(len(exit), dtype=np.int64)))
+    event_groups = np.concatenate((groups, groups)).astype(np.int64)
+    micros = np.round((times - times.min()) * 1e6).astype(np.int64)
+    span = int(micros.max()) + 1
+    if group_count * span * 2 < 2**62:
+        order = np.argsort((event_groups * span + micros) * 2 + (deltas > 0))
+    else:
+        order = np.lexsort((deltas, times, event_groups))
+    times, deltas, event_groups = times[order], deltas[order], event_groups[order]
+    running = np.cumsum(deltas)
+
+    present, starts = np.unique(event_groups, return_index=True)
+    peaks[present] = np.maximum.reduceat(running, starts)
+    at_peak = running == peaks[event_groups]
+    first_group, first_index = np.unique(event_groups[at_peak], return_index=True)
+    peak_at[first_group] = times[at_peak][first_index]
+    return peaks, peak_at
+
+
+def turnover(groups, group_count, slots, days):
+    """Stays started per slot per day for every group"""
+    started = np.bincount(groups, minlength=group_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = started / (slots * days)
+    return started, np.where(slots > 0, rates, np.nan)
+
+
+def ticket_analytics(start, end, parking=None, section=None, tickets=None):
+    """Dwell time distribution plus peak occupancy and turnover per section"""
+    entry, exit, closed, groups, sections = load_intervals(start, end, parking, section, tickets)
+    slot_counts = {
+        str(section_id): count
+        for section_id, count in ParkingSlot.objects.filter(section_id__in=sections.tolist())
+        .values("section_id")
+        .annotate(slots=Count("id"))
+        .values_list("section_id", "slots")
+    }
+    slots = np.array([slot_counts.get(section_id, 0) for section_id in sections.tolist()], dtype=float)
+
+    window_start = start.timestamp()
+    started_in_window = entry >= window_start
+    days = max((end - start).total_seconds() / 86400, 1 / 24)
+    peaks, peak_at = peak_occupancy(
+        np.maximum(entry, window_start), np.minimum(exit, end.timestamp()), groups, len(sections)
+    )
+    started, rates = turnover(groups[started_in_window], len(sections), slots, days)
+    return {
+        "from": start,
+        "to": end,
+        "dwell": dwell_stats(entry[closed & started_in_window], exit[closed & started_in_window]),
+        "sections": [
+            {
+                "section": section_id,
+                "slots": int(slots[index]),
+                "tickets": int(started[index]),
+                "peak_occupancy": int(peaks[index]),
+                "peak_at": None
+                if np.isnan(peak_at[index])
+                else timezone.localtime(datetime.fromtimestamp(peak_at[index], tz=dt_timezone.utc)),
+                "turnover_per_slot_day": None if np.isnan(rates[index]) else round(float(rates[index]), 3),
+            }
+            for index, section_id in enumerate(sections.tolist())
+        ],
+    }
@@ -0,0 +1,46 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Ticket, TicketArchive
+
+ARCHIVE_COLUMNS = (
+    "id",
+    "user_id",
+    "parking_slot_id",
+    "vehicle_id",
+    "parking_price_id",
+    "entry_time",
+    "exit_time",
+    "amount",
+)
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, "TICKET_ARCHIVE_AFTER_DAYS", 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable_tickets(cutoff):
+    """Closed tickets that left before ``cutoff``"""
+    return Ticket.objects.filter(exit_time__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one batch of closed tickets into TicketArchive, returns how many moved"""
+    with transaction.atomic():
+        rows = list(
+            archivable_tickets(cutoff)
+            .order_by("pk")
+            .select_for_update(skip_locked=True, of=("self",))
+            .values(*ARCHIVE_COLUMNS, parking_id=F("parking_slot__section__parking_id"))[:batch_size]
+        )
+        if not rows:
+            return 0
+        # ignore_conflicts makes a batch that was copied but not deleted safe to retry
+        TicketArchive.objects.bulk_create((TicketArchive(**row) for row in rows), ignore_conflicts=True)
+        Ticket.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+    return len(rows)
+
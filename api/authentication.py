@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from .cache import bump_version, get_version
+
+USER_LABEL = "api.customuser"
+
+
+class TokenCache:
+    """Bounded LRU of token key -> ``(user, token)`` with a TTL.
+
+    Entries remember the user's version from the Django cache, bumped by
+    signals on logout, password change and deactivation, so a worker drops
+    a stale entry on its next hit even when the change happened elsewhere.
+    That only holds when the cache is shared between workers; with a
+    ``TOKEN_CACHE_SECONDS`` of 0, the default for per-process backends,
+    nothing is cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def maxsize(self):
+        return getattr(settings, "TOKEN_CACHE_SIZE", 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, "TOKEN_CACHE_SECONDS", 300)
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        user, token, version, expires = entry
+        if time.monotonic() >= expires or get_version(USER_LABEL, user.pk) != version:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return user, token
+
+    def set(self, key, user, token):
+        if self.ttl <= 0:
+            return
+        entry = (user, token, get_version(USER_LABEL, user.pk), time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        bump_version(USER_LABEL, user_id)
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0].pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the token and user query on cache hits"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """One listener's bounded queue, fed from any thread"""
+
+    def __init__(self, broker, channel, loop, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        # Slow listeners lose their oldest events instead of growing without bound;
+        # they can catch up from the change feed with Last-Event-ID
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def drain(self):
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """In-process publish/subscribe of events keyed by channel (a parking id).
+
+    Publishers are usually sync code running in worker threads, so events
+    are handed to each subscriber's event loop with
+    ``call_soon_threadsafe``. One publish reaches every listener of the
+    channel in this process; each worker has its own broker.
+
+    ``poller`` names an async function of ``(broker, subscription)`` run
+    once per channel while the channel has listeners: it is started in the
+    event loop of the first listener, receives every event of the channel
+    through its own subscription and is cancelled with the last listener.
+    The parking streams use it to read the change feed once per worker for
+    the events written by other workers.
+    """
+
+    def __init__(self, poller=None):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._pollers = {}
+        self.poller = poller
+
+    @property
+    def queue_size(self):
+        return getattr(settings, "STREAM_QUEUE_SIZE", 1000)
+
+    def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(self, channel, loop, self.queue_size)
+        with self._lock:
+            listeners = self._subscriptions.setdefault(channel, set())
+            listeners.add(subscription)
+            running = self._pollers.get(channel)
+            if self.poller is not None and (running is None or running[0].done()):
+                if running is not None:
+                    listeners.discard(running[1])
+                feed = Subscription(self, channel, loop, self.queue_size)
+                listeners.add(feed)
+                self._pollers[channel] = (loop.create_task(import_string(self.poller)(self, feed)), feed)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        stop = None
+        with self._lock:
+            listeners = self._subscriptions.get(subscription.channel)
+            if listeners is None:
+                return
+            listeners.discard(subscription)
+            running = self._pollers.get(subscription.channel)
+            if running is not None and listeners <= {running[1]}:
+                del self._pollers[subscription.channel]
+                listeners.discard(running[1])
+                stop = running[0]
+            if not listeners:
+                del self._subscriptions[subscription.channel]
+        if stop is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is stop.get_loop():
+            stop.cancel()
+            return
+        try:
+            stop.get_loop().call_soon_threadsafe(stop.cancel)
+        except RuntimeError:
+            # Its loop is already closed, and the poller with it
+            pass
+
+    def listeners(self, channel):
+        with self._lock:
+            listeners = self._subscriptions.get(channel, set())
+            running = self._pollers.get(channel)
+            return len(listeners) - (running is not None and running[1] in listeners)
+
+    def publish(self, channel, event):
+        with self._lock:
+            listeners = list(self._subscriptions.get(channel, ()))
+        for subscription in listeners:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # The listener's loop is closed, its stream is gone
+                self.unsubscribe(subscription)
+
+
+broker = Broker(poller="api.streams.poll_feed")
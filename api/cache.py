@@ -0,0 +1,145 @@
+import hashlib
+from functools import partial
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+# Models whose list and detail responses are cached, by model label
+CATALOGUE_MODELS = ("api.parking", "api.parkingsection", "api.parkingprice")
+
+
+def version_key(label, pk=None):
+    return f"catalogue:{label}:version" if pk is None else f"catalogue:{label}:{pk}:version"
+
+
+def get_version(label, pk=None):
+    key = version_key(label, pk)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_version(label, pk=None, lists=True):
+    """Retire every cached response built from this model, or object, version.
+
+    With ``lists=False`` only the object's detail responses are retired.
+    """
+    cache.set(version_key(label, pk), uuid4().hex, None)
+    if pk is not None and lists:
+        cache.set(version_key(label), uuid4().hex, None)
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+class CatalogueCacheMixin:
+    """Cache list and detail GET responses of rarely changing models.
+
+    Cache keys embed a version per model and per object that signals replace
+    on every save or delete, so stale entries are never read and simply
+    expire. The key also serves as the ETag, so a matching
+    ``If-None-Match`` is answered with 304 before anything is loaded.
+    Responses with ``?expand=`` also depend on the other catalogue models.
+    """
+
+    def cache_key(self, request, pk=None):
+        label = self.get_queryset().model._meta.label_lower
+        versions = [get_version(label, pk)]
+        if "expand" in request.query_params:
+            versions += [get_version(other) for other in CATALOGUE_MODELS]
+        digest = hashlib.md5(
+            ":".join([label, str(pk), *versions, request.get_full_path()]).encode()
+        ).hexdigest()
+        return f"catalogue:{label}:response:{digest}"
+
+    def cached_response(self, request, pk, build):
+        key = self.cache_key(request, pk)
+        etag = f'"{key.rsplit(":", 1)[1]}"'
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        data = cache.get(key)
+        if data is None:
+            response = build()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, getattr(settings, "CATALOGUE_CACHE_SECONDS", 300))
+        return Response(data, headers={"ETag": etag})
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, None, lambda: super(CatalogueCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return self.cached_response(
+            request, pk, lambda: super(CatalogueCacheMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+
+class ConditionalGetMixin:
+    """ETag and Last-Modified for views over models with ``updated_at``.
+
+    Validators come from one cheap query (row count and latest
+    ``updated_at`` of the filtered list, or the object's ``updated_at``), so
+    an unchanged resource is answered with 304 without loading or
+    serializing any row. The row count makes deletions change the list
+    ETag; If-Modified-Since cannot see them and is only honoured on detail
+    views. Expanded responses depend on other tables and are not validated.
+    """
+
+    def conditional_response(self, request, validator, last_modified, build, honour_since=False):
+        etag = f'"{hashlib.md5(f"{validator}:{request.get_full_path()}".encode()).hexdigest()}"'
+        headers = {"ETag": etag}
+        if last_modified is not None:
+            headers["Last-Modified"] = http_date(last_modified.timestamp())
+
+        if "If-None-Match" in request.headers:
+            fresh = etag_matches(request, etag)
+        else:
+            since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+            fresh = honour_since and since is not None and last_modified is not None
+            fresh = fresh and int(last_modified.timestamp()) <= since
+        if fresh:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    def list(self, request, *args, **kwargs):
+        build = partial(super().list, request, *args, **kwargs)
+        if "expand" in request.query_params:
+            return build()
+        stats = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+            count=Count("pk"), last_modified=Max("updated_at")
+        )
+        validator = f"{stats['count']}:{stats['last_modified']}"
+        return self.conditional_response(request, validator, stats["last_modified"], build)
+
+    def retrieve(self, request, *args, **kwargs):
+        build = partial(super().retrieve, request, *args, **kwargs)
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if "expand" in request.query_params:
+            return build()
+        last_modified = (
+            self.get_queryset().filter(**{self.lookup_field: lookup})
+            .values_list("updated_at", flat=True).first()
+        )
+        if last_modified is None:
+            return build()
+        validator = f"{lookup}:{last_modified.isoformat()}"
+        return self.conditional_response(request, validator, last_modified, build, honour_since=True)
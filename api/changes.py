@@ -0,0 +1,118 @@
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .broker import broker
+from .models import ChangeLog, ParkingSlot, Ticket
+from .pricing import rate_tables
+
+SLOT_FIELDS = (
+    "id",
+    "section_id",
+    "slot_number",
+    "type",
+    "is_charging_available",
+    "is_booked",
+    "is_reserved",
+    "is_available",
+)
+TICKET_FIELDS = ("id", "parking_slot_id", "vehicle_id", "entry_time", "exit_time", "amount")
+
+
+def slot_change(slot, action="SAVE"):
+    return ChangeLog(
+        model="parking_slot",
+        object_id=str(slot.pk),
+        action=action,
+        parking_id=rate_tables.parking_for_section(slot.section_id),
+        data={field: getattr(slot, field) for field in SLOT_FIELDS},
+    )
+
+
+def ticket_change(ticket, action="SAVE"):
+    section_id = None
+    if Ticket.parking_slot.is_cached(ticket) and ticket.parking_slot is not None:
+        section_id = ticket.parking_slot.section_id
+    elif ticket.parking_slot_id is not None:
+        section_id = ParkingSlot.objects.filter(pk=ticket.parking_slot_id).values_list("section_id", flat=True).first()
+    return ChangeLog(
+        model="ticket",
+        object_id=str(ticket.pk),
+        action=action,
+        parking_id=rate_tables.parking_for_section(section_id) if section_id else None,
+        data={field: getattr(ticket, field) for field in TICKET_FIELDS},
+    )
+
+
+def change_event(change):
+    return {
+        "seq": change.seq,
+        "model": change.model,
+        "object_id": change.object_id,
+        "action": change.action,
+        "data": change.data,
+    }
+
+
+def publish_changes(changes):
+    """Hand committed changes to the stream listeners of their parking"""
+    for change in changes:
+        if change.parking_id is not None:
+            broker.publish(change.parking_id, change_event(change))
+
+
+def record_change(instance, action="SAVE"):
+    change = slot_change(instance, action) if isinstance(instance, ParkingSlot) else ticket_change(instance, action)
+    change.save()
+    transaction.on_commit(partial(publish_changes, [change]))
+
+
+def record_slot_changes(slots):
+    """Log slots changed behind the ORM's back (bulk_create, update())"""
+    changes = ChangeLog.objects.bulk_create((slot_change(slot) for slot in slots), batch_size=1000)
+    transaction.on_commit(partial(publish_changes, changes))
+
+
+def feed_position(parking_id=None, lag=None):
+    """Highest ``seq`` that ``changes_since`` would already serve"""
+    if lag is None:
+        lag = getattr(settings, "CHANGE_FEED_LAG_SECONDS", 5)
+    entries = ChangeLog.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=lag))
+    if parking_id is not None:
+        entries = entries.filter(parking_id=parking_id)
+    return entries.aggregate(seq=Max("seq"))["seq"] or 0
+
+
+def changes_since(seq, parking_id=None, limit=500, lag=None):
+    """Changes after ``seq``, keeping only the latest entry per object.
+
+    Returns ``(changes, last_seq, has_more)``; clients pass ``last_seq`` as
+    the next ``since``. A ``seq`` is drawn at INSERT, so a transaction that
+    commits late can make a lower ``seq`` visible after a higher one was
+    served. Entries younger than ``CHANGE_FEED_LAG_SECONDS`` are therefore
+    held back, and a batch stops at the first of them so ``last_seq`` never
+    passes a change that may still be in flight.
+    """
+    limit = max(limit, 1)
+    if lag is None:
+        lag = getattr(settings, "CHANGE_FEED_LAG_SECONDS", 5)
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    entries = ChangeLog.objects.filter(seq__gt=seq).order_by("seq")
+    if parking_id is not None:
+        entries = entries.filter(parking_id=parking_id)
+    entries = list(entries.values("seq", "model", "object_id", "action", "data", "created_at")[: limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    for position, entry in enumerate(entries):
+        if entry["created_at"] > cutoff:
+            entries, has_more = entries[:position], False
+            break
+    last_seq = entries[-1]["seq"] if entries else seq
+    latest = {}
+    for entry in entries:
+        del entry["created_at"]
+        latest.pop((entry["model"], entry["object_id"]), None)
+        latest[(entry["model"], entry["object_id"])] = entry
+    return list(latest.values()), last_seq, has_more
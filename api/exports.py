@@ -0,0 +1,134 @@
+import csv
+import zlib
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .models import Passes, Ticket
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# Exported columns as (header, values_list lookup)
+TICKET_COLUMNS = (
+    ("id", "id"),
+    ("user", "user_id"),
+    ("vehicle", "vehicle_id"),
+    ("vehicle_number", "vehicle__vehicle_number"),
+    ("parking", "parking_slot__section__parking_id"),
+    ("parking_slot", "parking_slot_id"),
+    ("parking_price", "parking_price_id"),
+    ("entry_time", "entry_time"),
+    ("exit_time", "exit_time"),
+    ("amount", "amount"),
+)
+PASS_COLUMNS = (
+    ("id", "id"),
+    ("user", "user_id"),
+    ("parking", "parking_id"),
+    ("vehicle", "vehicle_id"),
+    ("vehicle_number", "vehicle__vehicle_number"),
+    ("start_date", "start_date"),
+    ("end_date", "end_date"),
+    ("price", "price"),
+)
+
+
+def ticket_queryset(start=None, end=None, parking=None):
+    """Tickets that entered between ``start`` and ``end``"""
+    tickets = Ticket.objects.all()
+    if start is not None:
+        tickets = tickets.filter(entry_time__gte=start)
+    if end is not None:
+        tickets = tickets.filter(entry_time__lte=end)
+    if parking is not None:
+        tickets = tickets.filter(parking_slot__section__parking_id=parking)
+    return tickets
+
+
+def pass_queryset(start=None, end=None, parking=None):
+    """Passes valid at some point between ``start`` and ``end``"""
+    passes = Passes.objects.all()
+    if start is not None:
+        passes = passes.filter(end_date__gte=timezone.localdate(start))
+    if end is not None:
+        passes = passes.filter(start_date__lte=timezone.localdate(end))
+    if parking is not None:
+        passes = passes.filter(parking_id=parking)
+    return passes
+
+
+EXPORTS = {
+    "tickets": (TICKET_COLUMNS, ticket_queryset),
+    "passes": (PASS_COLUMNS, pass_queryset),
+}
+
+
+class Echo:
+    """File-like object whose write returns the line for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def encode_rows(columns, rows, output="csv", chunk_size=2000):
+    """Render rows as CSV or NDJSON text, ``chunk_size`` rows per chunk"""
+    headers = [header for header, _ in columns]
+    if output == "csv":
+        writer = csv.writer(Echo())
+        encode = writer.writerow
+        yield encode(headers)
+    else:
+        encoder = DjangoJSONEncoder()
+
+        def encode(row):
+            return encoder.encode(dict(zip(headers, row))) + "\n"
+
+    chunk = []
+    for row in rows:
+        chunk.append(encode(row))
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(kind, output="csv", compress=False, start=None, end=None, parking=None, chunk_size=2000):
+    """Chunks of an export of ``kind`` in constant memory.
+
+    Rows are read as tuples with ``values_list().iterator()``, which uses a
+    server-side cursor on PostgreSQL, and encoded ``chunk_size`` at a time.
+    """
+    columns, queryset = EXPORTS[kind]
+    rows = (
+        queryset(start, end, parking)
+        .order_by("pk")
+        .values_list(*[lookup for _, lookup in columns])
+        .iterator(chunk_size=chunk_size)
+    )
+    chunks = encode_rows(columns, rows, output, chunk_size)
+    return gzip_chunks(chunks) if compress else (chunk.encode() for chunk in chunks)
+
+
+async def iterate_in_thread(chunks):
+    """Serve a sync iterator to an ASGI response one chunk at a time.
+
+    Django would otherwise read a sync streaming iterator into memory before
+    sending it under ASGI. ``next`` runs thread sensitively so the database
+    cursor stays on the request's thread.
+    """
+    chunks = iter(chunks)
+    sentinel = object()
+    while True:
+        chunk = await sync_to_async(next)(chunks, sentinel)
+        if chunk is sentinel:
+            break
+        yield chunk
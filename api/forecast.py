@@ -0,0 +1,218 @@
+import threading
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from .analytics import load_intervals
+from .models import ParkingSection
+from .occupancy import section_counters
+from .rollups import period_start
+
+HOURS_PER_WEEK = 7 * 24
+# Exponential smoothing of each section's level and of its hour-of-week profile
+LEVEL_SMOOTHING = 0.2
+PROFILE_SMOOTHING = 0.3
+# Share of the gap between live and forecast occupancy still applied each hour ahead
+CORRECTION_DECAY = 0.5
+
+
+def model_key(parking_id):
+    return f"forecast:{parking_id}:model"
+
+
+def refit_lock_key(parking_id):
+    return f"forecast:{parking_id}:refitting"
+
+
+def hours_of_week(boundaries):
+    """Local hour of the week, Monday 00:00 being 0, of each epoch second in ``boundaries``"""
+    moments = (timezone.localtime(datetime.fromtimestamp(value, tz=dt_timezone.utc)) for value in boundaries)
+    return np.array([moment.weekday() * 24 + moment.hour for moment in moments], dtype=np.int64)
+
+
+def hourly_occupancy(entry, exit, groups, group_count, boundaries):
+    """Mean occupied slots per group in each hour between consecutive ``boundaries``.
+
+    The time integral of occupancy up to ``T`` is the sum of ``T - entry``
+    over entries before ``T`` minus the sum of ``T - exit`` over exits
+    before ``T``. Events are bucketed by the first boundary after them,
+    cumulated per group and evaluated at every boundary, so no stay is
+    split hour by hour.
+    """
+    origin = boundaries[0]
+    edges = boundaries - origin
+    times = np.concatenate((np.maximum(entry, boundaries[0]), np.minimum(exit, boundaries[-1]))) - origin
+    signs = np.concatenate((np.ones(len(entry)), -np.ones(len(exit))))
+    columns = len(edges)
+    flat = np.concatenate((groups, groups)) * columns + np.searchsorted(edges, times)
+    counts = np.bincount(flat, weights=signs, minlength=group_count * columns).reshape(group_count, columns)
+    sums = np.bincount(flat, weights=signs * times, minlength=group_count * columns).reshape(group_count, columns)
+    integral = np.cumsum(counts, axis=1) * edges - np.cumsum(sums, axis=1)
+    return np.diff(integral, axis=1) / np.diff(edges)
+
+
+def smooth(level, profile, observed, slots):
+    """Run the seasonal smoothing over ``observed`` hours, updating ``profile`` in place.
+
+    Every step is vectorised over sections; only the hours are looped.
+    """
+    for column, slot in zip(observed.T, slots):
+        season = profile[:, slot]
+        level = LEVEL_SMOOTHING * (column - season) + (1 - LEVEL_SMOOTHING) * level
+        profile[:, slot] = PROFILE_SMOOTHING * (column - level) + (1 - PROFILE_SMOOTHING) * season
+    return level
+
+
+def initial_model(observed, slots):
+    """Level and hour-of-week profile from plain averages of the history"""
+    level = observed.mean(axis=1)
+    totals = np.zeros((len(observed), HOURS_PER_WEEK))
+    np.add.at(totals.T, slots, observed.T)
+    seen = np.bincount(slots, minlength=HOURS_PER_WEEK)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profile = np.where(seen > 0, totals / seen - level[:, None], 0.0)
+    return level, profile
+
+
+def refit(parking_id, model=None, now=None):
+    """Fit a parking's section models, or bring ``model`` up to the last complete hour.
+
+    A model only ever reads the tickets of the hours it has not seen yet.
+    It is fitted from scratch over ``FORECAST_HISTORY_DAYS`` when there is
+    none, when the parking's sections changed or when it fell further
+    behind than the history.
+    """
+    until = period_start(now or timezone.now(), "HOUR").timestamp()
+    history = getattr(settings, "FORECAST_HISTORY_DAYS", 28) * 86400
+    sections = np.array(
+        sorted(str(pk) for pk in ParkingSection.objects.filter(parking_id=parking_id).values_list("id", flat=True)),
+        dtype=str,
+    )
+    if model is not None and (
+        model["sections"].tolist() != sections.tolist() or model["fitted_until"] < until - history
+    ):
+        model = None
+    start = until - history if model is None else model["fitted_until"]
+    if start >= until:
+        return model
+
+    boundaries = np.arange(start, until + 1, 3600.0)
+    entry, exit, _, codes, found = load_intervals(
+        datetime.fromtimestamp(start, tz=dt_timezone.utc),
+        datetime.fromtimestamp(until, tz=dt_timezone.utc),
+        parking=parking_id,
+    )
+    positions = np.searchsorted(sections, found)
+    matches = positions < len(sections)
+    matches[matches] = sections[positions[matches]] == found[matches]
+    groups = np.where(matches, positions, -1)[codes]
+    known = groups >= 0
+    observed = hourly_occupancy(entry[known], exit[known], groups[known], len(sections), boundaries)
+    slots = hours_of_week(boundaries[:-1])
+
+    if model is None:
+        level, profile = initial_model(observed, slots)
+    else:
+        level, profile = model["level"], model["profile"].copy()
+    level = smooth(level, profile, observed, slots)
+    return {"sections": sections, "level": level, "profile": profile, "fitted_until": until}
+
+
+def refresh_model(parking_id, now=None):
+    """Refit the parking's cached model now, as ``refit-forecasts`` does on its schedule"""
+    model = refit(parking_id, cache.get(model_key(parking_id)), now)
+    cache.set(model_key(parking_id), model, None)
+    return model
+
+
+def background_refit(parking_id, now):
+    try:
+        refresh_model(parking_id, now)
+    finally:
+        cache.delete(refit_lock_key(parking_id))
+        connection.close()
+
+
+def get_model(parking_id, now=None):
+    """The parking's model from the shared cache, None before it was first fitted.
+
+    Requests never wait for a fit. The first one to find the model missing
+    or behind the last complete hour takes a lock in the shared cache and
+    refits it in a background thread, every request meanwhile gets the
+    model as it is. Running ``refit-forecasts`` hourly keeps this off the
+    request path altogether.
+    """
+    model = cache.get(model_key(parking_id))
+    until = period_start(now or timezone.now(), "HOUR").timestamp()
+    if model is not None and model["fitted_until"] >= until:
+        return model
+    if cache.add(refit_lock_key(parking_id), True, getattr(settings, "FORECAST_REFIT_LOCK_SECONDS", 600)):
+        if getattr(settings, "FORECAST_REFIT_IN_BACKGROUND", True):
+            threading.Thread(target=background_refit, args=(parking_id, now), daemon=True).start()
+        else:
+            try:
+                model = refresh_model(parking_id, now)
+            finally:
+                cache.delete(refit_lock_key(parking_id))
+    return model
+
+
+def reset_forecasts(parking_ids):
+    cache.delete_many([model_key(parking_id) for parking_id in parking_ids])
+
+
+def parking_forecast(parking_id, hours=6, now=None):
+    """Expected occupied slots per section for each of the next ``hours`` hours.
+
+    The fitted level plus the profile of each coming hour of the week is
+    nudged towards the live counters by a correction that halves every
+    hour, then clipped to the section's usable slots. None while the
+    parking's model is being fitted for the first time.
+    """
+    now = now or timezone.now()
+    model = get_model(parking_id, now)
+    if model is None:
+        return None
+    current = period_start(now, "HOUR").timestamp()
+    boundaries = current + 3600.0 * np.arange(1, hours + 1)
+    slots = hours_of_week(boundaries)
+    counters = list(section_counters(parking_id))
+
+    index = {section_id: position for position, section_id in enumerate(model["sections"].tolist())}
+    rows = np.array([index.get(str(section["id"]), -1) for section in counters], dtype=np.int64)
+    fitted = rows >= 0
+    base = np.zeros((len(counters), hours))
+    base[fitted] = model["level"][rows[fitted], None] + model["profile"][rows[fitted][:, None], slots]
+    base_now = np.zeros(len(counters))
+    base_now[fitted] = model["level"][rows[fitted]] + model["profile"][rows[fitted], hours_of_week([current])[0]]
+    live = np.array([section["occupied_slots"] for section in counters], dtype=float)
+    capacity = np.array([section["occupied_slots"] + section["free_slots"] for section in counters], dtype=float)
+    decay = CORRECTION_DECAY ** np.arange(1, hours + 1)
+    expected = np.clip(base + (live - base_now)[:, None] * decay, 0, capacity[:, None])
+    free = capacity[:, None] - expected
+
+    starts = [timezone.localtime(datetime.fromtimestamp(value, tz=dt_timezone.utc)) for value in boundaries]
+    return {
+        "parking": parking_id,
+        "fitted_until": timezone.localtime(datetime.fromtimestamp(model["fitted_until"], tz=dt_timezone.utc)),
+        "forecast": [
+            {"from": start, "occupied": round(float(occupied), 1), "free": round(float(available), 1)}
+            for start, occupied, available in zip(starts, expected.sum(axis=0), free.sum(axis=0))
+        ],
+        "sections": [
+            {
+                "id": section["id"],
+                "name": section["name"],
+                "floor": section["floor"],
+                "occupied_slots": section["occupied_slots"],
+                "free_slots": section["free_slots"],
+                "forecast": [
+                    {"from": start, "occupied": round(float(occupied), 1), "free": round(float(available), 1)}
+                    for start, occupied, available in zip(starts, expected[position], free[position])
+                ],
+            }
+            for position, section in enumerate(counters)
+        ],
+    }
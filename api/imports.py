@@ -0,0 +1,196 @@
+import csv
+import json
+from itertools import islice
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from .models import Parking, Passes, Vehicle
+from .passes import invalidate_active_pass_numbers
+from .serializers import PassImportSerializer, VehicleImportSerializer
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+def read_rows(lines, input_format="csv"):
+    """``(line number, row dict)`` pairs from CSV or NDJSON lines.
+
+    Blank CSV cells are dropped so the serializer defaults apply; NDJSON
+    lines that are not JSON objects come through as None.
+    """
+    if input_format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ("", None)}
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+class BulkImporter:
+    """Validate rows in chunks and upsert each chunk with one bulk_create.
+
+    Subclasses turn validated rows into model instances with ``build``,
+    resolving foreign keys with one query per chunk, and name the unique
+    fields the upsert conflicts on. Rows that fail are collected in a report
+    instead of stopping the import; a later row with the same key as an
+    earlier one in the chunk wins.
+    """
+
+    model = None
+    serializer_class = None
+    unique_fields = ()
+    update_fields = ()
+
+    def __init__(self, user, chunk_size=1000, max_errors=1000):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.rows = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        # One serializer validates every row: building one per row deep copies its fields each time
+        self.serializer = self.serializer_class()
+
+    def error(self, number, errors):
+        self.error_count += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append({"row": number, "errors": errors})
+
+    def build(self, rows):
+        raise NotImplementedError
+
+    def key(self, instance):
+        return tuple(getattr(instance, field) for field in self.unique_fields)
+
+    def after_chunk(self, instances):
+        pass
+
+    def import_chunk(self, chunk):
+        valid = []
+        for number, row in chunk:
+            if row is None:
+                self.error(number, {"non_field_errors": ["Row is not a JSON object."]})
+                continue
+            try:
+                valid.append((number, self.serializer.run_validation(row)))
+            except ValidationError as exc:
+                self.error(number, exc.detail)
+
+        unique = {}
+        for number, instance in self.build(valid):
+            key = self.key(instance)
+            if key in unique:
+                self.error(unique[key][0], {"non_field_errors": [f"Replaced by row {number}."]})
+            unique[key] = (number, instance)
+        instances = [instance for _, instance in unique.values()]
+        if instances:
+            with transaction.atomic():
+                self.model.objects.bulk_create(
+                    instances,
+                    update_conflicts=True,
+                    unique_fields=self.unique_fields,
+                    update_fields=self.update_fields,
+                )
+            self.after_chunk(instances)
+        self.imported += len(instances)
+
+    def run(self, rows):
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.chunk_size)):
+            self.rows += len(chunk)
+            self.import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "failed": self.error_count,
+            "errors": self.errors,
+        }
+
+
+class VehicleImporter(BulkImporter):
+    model = Vehicle
+    serializer_class = VehicleImportSerializer
+    unique_fields = ["vehicle_number"]
+    update_fields = ["vehicle_type", "is_electric", "is_active", "updated_at"]
+
+    def build(self, rows):
+        numbers = {data["vehicle_number"] for _, data in rows}
+        owners = dict(Vehicle.objects.filter(vehicle_number__in=numbers).values_list("vehicle_number", "user_id"))
+        for number, data in rows:
+            owner = owners.get(data["vehicle_number"], self.user.id)
+            if owner != self.user.id and not self.user.is_superuser:
+                self.error(number, {"vehicle_number": ["Vehicle is registered to another user."]})
+                continue
+            yield number, Vehicle(user_id=owner, **data)
+
+
+class PassImporter(BulkImporter):
+    model = Passes
+    serializer_class = PassImportSerializer
+    unique_fields = ["vehicle", "parking", "start_date", "end_date"]
+    update_fields = ["price", "updated_at"]
+
+    def key(self, instance):
+        return instance.vehicle_id, instance.parking_id, instance.start_date, instance.end_date
+
+    def build(self, rows):
+        numbers = {data["vehicle_number"] for _, data in rows}
+        vehicles = {
+            vehicle_number: (vehicle_id, owner)
+            for vehicle_number, vehicle_id, owner in Vehicle.objects.filter(vehicle_number__in=numbers).values_list(
+                "vehicle_number", "id", "user_id"
+            )
+        }
+        parkings = set(Parking.objects.filter(pk__in={data["parking"] for _, data in rows}).values_list("id", flat=True))
+        # Owners of the passes the upsert would update, which other users must not touch
+        existing = {
+            (vehicle_id, parking_id, start_date, end_date): owner
+            for vehicle_id, parking_id, start_date, end_date, owner in Passes.objects.filter(
+                vehicle_id__in={vehicle_id for vehicle_id, _ in vehicles.values()}
+            ).values_list("vehicle_id", "parking_id", "start_date", "end_date", "user_id")
+        }
+        for number, data in rows:
+            vehicle_id, owner = vehicles.get(data["vehicle_number"], (None, None))
+            if vehicle_id is None:
+                self.error(number, {"vehicle_number": ["No vehicle with this number."]})
+                continue
+            if data["parking"] not in parkings:
+                self.error(number, {"parking": ["No parking with this id."]})
+                continue
+            key = (vehicle_id, data["parking"], data["start_date"], data["end_date"])
+            if not self.user.is_superuser:
+                if owner != self.user.id:
+                    self.error(number, {"vehicle_number": ["Vehicle is registered to another user."]})
+                    continue
+                if existing.get(key, self.user.id) != self.user.id:
+                    self.error(number, {"non_field_errors": ["A pass for this period belongs to another user."]})
+                    continue
+            instance = Passes(
+                user_id=owner,
+                vehicle_id=vehicle_id,
+                parking_id=data["parking"],
+                start_date=data["start_date"],
+                end_date=data["end_date"],
+                price=data["price"],
+            )
+            instance.vehicle_number = data["vehicle_number"]
+            yield number, instance
+
+    def after_chunk(self, instances):
+        # bulk_create sends no signals, so clear the gate's pass cache here
+        invalidate_active_pass_numbers({instance.vehicle_number for instance in instances})
+
+
+IMPORTERS = {
+    "vehicles": VehicleImporter,
+    "passes": PassImporter,
+}
@@ -0,0 +1,101 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from api.allocation import slot_allocator
+from api.cache import CATALOGUE_MODELS, bump_version
+from api.pricing import rate_tables
+from api.utils import parse_moment
+
+
+class PurgeCommand(BaseCommand):
+    """Base for the clear-* commands.
+
+    Matching rows are deleted in primary key chunks so each DELETE, and the
+    cascade collection Django does for it, stays small. Subclasses set the
+    model and which fields ``--before`` and ``--parking`` filter on.
+    """
+
+    model = None
+    date_field = None
+    parking_field = None
+
+    def add_arguments(self, parser):
+        if self.date_field:
+            parser.add_argument('--before', help=f'Only delete rows with {self.date_field} before this date or datetime')
+        if self.parking_field:
+            parser.add_argument('--parking', type=int, help='Only delete rows belonging to this parking')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per DELETE statement')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be deleted')
+        parser.add_argument(
+            '--truncate', action='store_true',
+            help='Empty the whole table with TRUNCATE ... CASCADE (PostgreSQL, no filters)',
+        )
+
+    def parse_before(self, value):
+        parsed = parse_moment(value)
+        if parsed is None:
+            raise CommandError(f'Invalid --before value: {value}')
+        return parsed
+
+    def get_queryset(self, options):
+        queryset = self.model.objects.all()
+        if options.get('before'):
+            queryset = queryset.filter(**{f'{self.date_field}__lt': self.parse_before(options['before'])})
+        if options.get('parking') is not None:
+            queryset = queryset.filter(**{self.parking_field: options['parking']})
+        return queryset
+
+    def truncate(self):
+        if connection.vendor != 'postgresql':
+            raise CommandError('--truncate needs a PostgreSQL database')
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE TABLE {connection.ops.quote_name(self.model._meta.db_table)} CASCADE')
+
+    def catalogue_ids(self):
+        return {label: set(apps.get_model(label).objects.values_list('pk', flat=True)) for label in CATALOGUE_MODELS}
+
+    def retire_caches(self, before):
+        """Do what the delete signals TRUNCATE skipped would have done.
+
+        ``before`` holds the catalogue ids read before truncating; the
+        detail responses of every id that is gone and the list responses of
+        every catalogue model are retired, as are the rate tables.
+        """
+        after = self.catalogue_ids()
+        for label, ids in before.items():
+            for pk in ids - after[label]:
+                bump_version(label, pk, lists=False)
+            bump_version(label)
+        rate_tables.invalidate()
+        slot_allocator.invalidate()
+
+    def handle(self, *args, **options):
+        name = self.model._meta.verbose_name_plural
+        filtered = options.get('before') or options.get('parking') is not None
+        if options['truncate'] and filtered:
+            raise CommandError('--truncate cannot be combined with --before or --parking')
+
+        queryset = self.get_queryset(options)
+        total = queryset.count()
+        if options['dry_run']:
+            self.stdout.write(f'{total} {name} rows would be deleted')
+            return
+
+        if options['truncate']:
+            catalogue = self.catalogue_ids()
+            self.truncate()
+            self.retire_caches(catalogue)
+            self.stdout.write(self.style.SUCCESS(f'Truncated {name} ({total} rows)'))
+            return
+
+        deleted = 0
+        while True:
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                self.model.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f'Deleted {deleted}/{total} {name} rows')
+        slot_allocator.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} {name} rows'))
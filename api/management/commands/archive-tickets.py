@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from api.archive import archive_batch, archive_cutoff, archivable_tickets
+
+
+class Command(BaseCommand):
+    help = 'Move closed tickets older than TICKET_ARCHIVE_AFTER_DAYS into the ticket archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive tickets that left more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tickets moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many tickets would be moved')
+
+    def handle(self, *args, **kwargs):
+        cutoff = archive_cutoff(kwargs['days'])
+        total = archivable_tickets(cutoff).count()
+        if kwargs['dry_run']:
+            self.stdout.write(f'{total} tickets closed before {cutoff:%Y-%m-%d %H:%M} would be archived')
+            return
+
+        moved = 0
+        while True:
+            batch = archive_batch(cutoff, kwargs['batch_size'])
+            if not batch:
+                break
+            moved += batch
+            self.stdout.write(f'Archived {moved}/{total} tickets')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} tickets closed before {cutoff:%Y-%m-%d %H:%M}'))
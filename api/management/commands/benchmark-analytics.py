@@ -0,0 +1,91 @@
+import time
+from datetime import timedelta
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.analytics import dwell_stats, load_intervals, peak_occupancy, turnover
+from api.models import Ticket
+
+
+def python_peaks(entry, exit, groups, group_count):
+    """Row by row sweep line, the baseline the vectorized version replaces"""
+    events = sorted(
+        [(group, start, 1) for group, start in zip(groups.tolist(), entry.tolist())]
+        + [(group, end, -1) for group, end in zip(groups.tolist(), exit.tolist())],
+        key=lambda event: (event[0], event[1], event[2]),
+    )
+    peaks = [0] * group_count
+    running = 0
+    for group, _, delta in events:
+        running += delta
+        peaks[group] = max(peaks[group], running)
+    return peaks
+
+
+def python_intervals(start, end):
+    """Row by row loading with a datetime conversion per value, the baseline of load_intervals"""
+    rows = (
+        Ticket.objects.filter(parking_slot__isnull=False, entry_time__lt=end)
+        .exclude(exit_time__lte=start)
+        .values_list('entry_time', 'exit_time', 'parking_slot__section_id')
+    )
+    entries, exits, section_ids = [], [], []
+    for entry_time, exit_time, section_id in rows.iterator(chunk_size=10000):
+        entries.append(entry_time.timestamp())
+        exits.append(np.nan if exit_time is None else exit_time.timestamp())
+        section_ids.append(section_id)
+    return np.array(entries, dtype=float), np.array(exits, dtype=float), section_ids
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the analytics functions on synthetic tickets, with a pure Python sweep line for comparison, '
+        'and the loading of the last --days of tickets from the database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=5_000_000)
+        parser.add_argument('--sections', type=int, default=200)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--python-sample', type=int, default=200_000, help='Tickets given to the Python baseline')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-database', action='store_true', help='Do not time loading from the database')
+
+    def timed(self, name, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.stdout.write(f'{name:<40}{time.perf_counter() - started:>10.3f} s')
+        return result
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        count, sections = options['tickets'], options['sections']
+        entry = rng.uniform(0, options['days'] * 86400, count)
+        exit = entry + rng.lognormal(np.log(90 * 60), 0.8, count)
+        groups = rng.integers(0, sections, count)
+        slots = rng.integers(20, 500, sections).astype(float)
+        self.stdout.write(f'{count} synthetic tickets in {sections} sections over {options["days"]} days')
+
+        self.timed('dwell_stats', dwell_stats, entry, exit)
+        peaks, _ = self.timed('peak_occupancy', peak_occupancy, entry, exit, groups, sections)
+        self.timed('turnover', turnover, groups, sections, slots, options['days'])
+
+        sample = min(options['python_sample'], count)
+        vectorized, _ = self.timed(
+            f'peak_occupancy ({sample} tickets)', peak_occupancy, entry[:sample], exit[:sample], groups[:sample], sections
+        )
+        baseline = self.timed(
+            f'python sweep line ({sample} tickets)', python_peaks, entry[:sample], exit[:sample], groups[:sample], sections
+        )
+        if list(vectorized) != baseline:
+            self.stderr.write(self.style.ERROR('Vectorized and Python peaks differ'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Peaks match the Python baseline, busiest section peaked at {peaks.max()}'))
+
+        if options['skip_database']:
+            return
+        end = timezone.now()
+        start = end - timedelta(days=options['days'])
+        entry, *_ = self.timed('load_intervals (database)', load_intervals, start, end)
+        self.timed('python row loader (database)', python_intervals, start, end)
+        self.stdout.write(f'{len(entry)} tickets of the last {options["days"]} days loaded from the database')
@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+from django.core.management.base import BaseCommand, CommandError
+
+# Hot read endpoints as (name, sync path, async path)
+ENDPOINTS = (
+    ('availability', 'parking/{parking}/availability', 'async/parking/{parking}/availability'),
+    ('occupancy', 'parking/{parking}/occupancy', 'async/parking/{parking}/occupancy'),
+    ('active pass', 'passes/active?{vehicle}', 'async/passes/active?{vehicle}'),
+    ('ticket', 'ticket/{ticket}', 'async/ticket/{ticket}'),
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare throughput and latency of the sync (WSGI) and async (ASGI) read endpoints. '
+        'Run the project under gunicorn sync workers and under uvicorn workers and pass both URLs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', required=True, help='Base URL of the WSGI deployment, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi', required=True, help='Base URL of the ASGI deployment, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--token', required=True, help='DRF token to authenticate with')
+        parser.add_argument('--parking', type=int, required=True)
+        parser.add_argument('--vehicle-number', required=True)
+        parser.add_argument('--ticket', type=int, required=True)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and deployment')
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def fetch(self, url, token):
+        request = Request(url, headers={'Authorization': f'Token {token}'})
+        started = time.perf_counter()
+        try:
+            with urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status == 200
+        except (HTTPError, URLError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    def run(self, url, options):
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(lambda _: self.fetch(url, options['token']), range(options['requests'])))
+            elapsed = time.perf_counter() - started
+        latencies = [latency for latency, _ in results]
+        return {
+            'rps': len(results) / elapsed,
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'errors': sum(not ok for _, ok in results),
+        }
+
+    def handle(self, *args, **options):
+        values = {
+            'parking': options['parking'],
+            'vehicle': urlencode({'vehicle_number': options['vehicle_number']}),
+            'ticket': options['ticket'],
+        }
+        self.stdout.write(f'{"endpoint":<14}{"server":<8}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for name, sync_path, async_path in ENDPOINTS:
+            for server, base, path in (('wsgi', options['wsgi'], sync_path), ('asgi', options['asgi'], async_path)):
+                url = f'{base.rstrip("/")}/api/{path.format(**values)}'
+                stats = self.run(url, options)
+                if stats['errors'] == options['requests']:
+                    raise CommandError(f'Every request to {url} failed')
+                self.stdout.write(
+                    f'{name:<14}{server:<8}{stats["rps"]:>10.1f}{stats["p50"]:>10.1f}'
+                    f'{stats["p99"]:>10.1f}{stats["errors"]:>8}'
+                )
@@ -0,0 +1,10 @@
+from api.models import ChangeLog
+from ._purge import PurgeCommand
+
+
+class Command(PurgeCommand):
+    help = 'Clear old entries of the slot and ticket change feed'
+
+    model = ChangeLog
+    date_field = 'created_at'
+    parking_field = 'parking_id'
@@ -0,0 +1,99 @@
+from uuid import uuid4
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from api.allocation import free_slots
+from api.models import CustomUser, Parking, ParkingSection, ParkingSlot, Passes, Ticket, Vehicle
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN ANALYZE on the hot lookup queries and fail on sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Insert this many synthetic slots, vehicles and tickets first; they are rolled back afterwards',
+        )
+
+    def seed(self, count):
+        user = CustomUser.objects.create_user(email=f'explain-{uuid4().hex}@example.com', password=None)
+        parking = Parking.objects.create(user=user, name='Explain', capacity=count)
+        sections = ParkingSection.objects.bulk_create(
+            ParkingSection(parking=parking, name=f'Section {number}', capacity=count)
+            for number in range(100)
+        )
+        ParkingSlot.objects.bulk_create(
+            (
+                ParkingSlot(
+                    section=sections[number % len(sections)],
+                    slot_number=f'X{number}',
+                    is_booked=number % 3 == 0,
+                )
+                for number in range(count)
+            ),
+            batch_size=1000,
+        )
+        vehicles = Vehicle.objects.bulk_create(
+            (Vehicle(user=user, vehicle_number=f'EXPLAIN-{number}') for number in range(count)),
+            batch_size=1000,
+        )
+        now = timezone.now()
+        Ticket.objects.bulk_create(
+            (
+                Ticket(user=user, vehicle=vehicle, exit_time=now if number % 10 else None)
+                for number, vehicle in enumerate(vehicles)
+            ),
+            batch_size=1000,
+        )
+        Passes.objects.bulk_create(
+            (
+                Passes(user=user, parking=parking, vehicle=vehicle, start_date=now.date(), end_date=now.date())
+                for vehicle in vehicles[::10]
+            ),
+            batch_size=1000,
+        )
+        with connection.cursor() as cursor:
+            for model in (ParkingSlot, Ticket, Passes):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def hot_queries(self):
+        """The canonical lookups every index in api.models is meant to serve"""
+        section = ParkingSection.objects.values_list('id', flat=True).first()
+        vehicle = Vehicle.objects.values_list('id', flat=True).first()
+        today = timezone.localdate()
+        return {
+            'free slots by section and type': free_slots().filter(section_id=section, type='FOUR-SMALL'),
+            'available slots by section and type': ParkingSlot.objects.filter(
+                section_id=section, is_available=True, type='FOUR-SMALL'
+            ),
+            'open tickets by vehicle': Ticket.objects.filter(vehicle_id=vehicle, exit_time__isnull=True),
+            'passes by vehicle and date': Passes.objects.filter(
+                vehicle_id=vehicle, start_date__lte=today, end_date__gte=today
+            ),
+        }
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE checks need a PostgreSQL database')
+
+        failures = []
+        try:
+            with transaction.atomic():
+                if kwargs['seed']:
+                    self.seed(kwargs['seed'])
+                for name, queryset in self.hot_queries().items():
+                    plan = queryset.explain(analyze=True)
+                    self.stdout.write(f'--- {name}\n{plan}\n')
+                    if 'Seq Scan' in plan:
+                        failures.append(name)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f'Sequential scan in: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index'))
@@ -0,0 +1,49 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from api.exports import EXPORT_FORMATS, EXPORTS, export_chunks
+from api.utils import parse_moment
+
+
+class Command(BaseCommand):
+    help = 'Stream tickets or passes to a CSV or NDJSON file in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--output', '-o', help='File to write, stdout when omitted')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--from', dest='start', help='Only rows from this date or datetime')
+        parser.add_argument('--to', dest='end', help='Only rows up to this date or datetime')
+        parser.add_argument('--parking', type=int, help='Only rows of this parking')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched and written at a time')
+
+    def parse(self, value, end_of_day=False):
+        if not value:
+            return None
+        parsed = parse_moment(value, end_of_day=end_of_day)
+        if parsed is None:
+            raise CommandError(f'Invalid date or datetime: {value}')
+        return parsed
+
+    def handle(self, *args, **options):
+        chunks = export_chunks(
+            options['kind'],
+            options['format'],
+            options['gzip'],
+            start=self.parse(options['start']),
+            end=self.parse(options['end'], end_of_day=True),
+            parking=options['parking'],
+            chunk_size=options['chunk_size'],
+        )
+        if options['output'] is None:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(options['output'], 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {written} bytes of {options["kind"]} to {options["output"]}'))
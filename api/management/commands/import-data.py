@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.imports import IMPORT_FORMATS, IMPORTERS, read_rows
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Upsert vehicles or passes from a CSV or NDJSON file and report the rows that failed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(IMPORTERS))
+        parser.add_argument('path', help='CSV or NDJSON file to import')
+        parser.add_argument('--user', required=True, help='Email of the user the rows are imported for')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows validated and written at a time')
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(email=options['user']).first()
+        if user is None:
+            raise CommandError(f'No user with email {options["user"]}')
+        input_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if input_format not in IMPORT_FORMATS:
+            raise CommandError('Pass --format csv or --format ndjson')
+
+        importer = IMPORTERS[options['kind']](user, chunk_size=options['chunk_size'], max_errors=None)
+        with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+            report = importer.run(read_rows(lines, input_format))
+        for error in report['errors']:
+            self.stderr.write(f'Row {error["row"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report["imported"]} of {report["rows"]} {options["kind"]} rows, {report["failed"]} failed'
+        ))
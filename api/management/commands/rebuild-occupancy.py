@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.occupancy import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount the free, occupied and reserved slot counters of every section'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parking', type=int, help='Only rebuild the sections of this parking')
+
+    def handle(self, *args, **kwargs):
+        updated = rebuild_counters(parking_id=kwargs['parking'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt occupancy counters for {updated} sections'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from api.forecast import refresh_model, reset_forecasts
+from api.models import Parking
+
+
+class Command(BaseCommand):
+    help = 'Bring the cached occupancy forecast models up to the last complete hour, meant to run hourly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parking', type=int, action='append', help='Only this parking, may be repeated')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Drop the cached models and fit them again from the ticket history',
+        )
+
+    def handle(self, *args, **kwargs):
+        parking_ids = kwargs['parking'] or list(Parking.objects.values_list('id', flat=True))
+        if kwargs['rebuild']:
+            reset_forecasts(parking_ids)
+            self.stdout.write('Cleared forecast models')
+        for parking_id in parking_ids:
+            refresh_model(parking_id)
+        self.stdout.write(self.style.SUCCESS(f'Refitted forecasts of {len(parking_ids)} parkings'))
@@ -0,0 +1,47 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.models import Ticket
+from api.pricing_rules import reprice_tickets
+from api.utils import parse_moment
+
+
+class Command(BaseCommand):
+    help = 'Re-price closed tickets with the current prices and pricing rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='Only tickets that entered on or after this date or datetime')
+        parser.add_argument('--to', dest='end', help='Only tickets that entered before this date or datetime')
+        parser.add_argument('--parking', type=int, help='Only tickets of this parking')
+        parser.add_argument('--apply', action='store_true', help='Store the new amounts on the tickets')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tickets updated per UPDATE statement')
+
+    def parse(self, value, option):
+        parsed = parse_moment(value)
+        if parsed is None:
+            raise CommandError(f'Invalid {option} value: {value}')
+        return parsed
+
+    def handle(self, *args, **kwargs):
+        tickets = Ticket.objects.all()
+        if kwargs['start']:
+            tickets = tickets.filter(entry_time__gte=self.parse(kwargs['start'], '--from'))
+        if kwargs['end']:
+            tickets = tickets.filter(entry_time__lt=self.parse(kwargs['end'], '--to'))
+        if kwargs['parking'] is not None:
+            tickets = tickets.filter(parking_slot__section__parking_id=kwargs['parking'])
+
+        ids, amounts, stored = reprice_tickets(tickets)
+        changed = ~np.isclose(stored, amounts)
+        self.stdout.write(
+            f'Priced {len(ids)} tickets for {amounts.sum():.2f} in total, {int(changed.sum())} amounts differ'
+        )
+
+        if kwargs['apply'] and changed.any():
+            updates = [
+                Ticket(id=pk, amount=amount)
+                for pk, amount in zip(ids[changed].tolist(), amounts[changed].tolist())
+            ]
+            with transaction.atomic():
+                Ticket.objects.bulk_update(updates, ['amount'], batch_size=kwargs['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Updated {len(updates)} ticket amounts'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from api.rollups import rebuild_rollups, roll_up
+
+
+class Command(BaseCommand):
+    help = 'Add tickets closed since the last run to the hourly and daily usage rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tickets counted per transaction')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Recount the periods after the last archived ticket, e.g. after reprice-tickets',
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['rebuild']:
+            recounted = rebuild_rollups(batch_size=kwargs['batch_size'])
+            self.stdout.write(f'Recounted {recounted} tickets into the rollups after the last archived ticket')
+        counted = roll_up(batch_size=kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {counted} closed tickets'))
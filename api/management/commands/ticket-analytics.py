@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.analytics import ticket_analytics
+from api.utils import parse_moment
+
+
+class Command(BaseCommand):
+    help = 'Print dwell time distribution, peak occupancy and turnover per section'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='Window start date or datetime, 7 days before --to by default')
+        parser.add_argument('--to', dest='end', help='Window end date or datetime, now by default')
+        parser.add_argument('--parking', type=int)
+        parser.add_argument('--section')
+
+    def parse(self, value, end_of_day=False):
+        parsed = parse_moment(value, end_of_day=end_of_day)
+        if parsed is None:
+            raise CommandError(f'Invalid date or datetime: {value}')
+        return parsed
+
+    def handle(self, *args, **options):
+        end = self.parse(options['end'], end_of_day=True) if options['end'] else timezone.now()
+        start = self.parse(options['start']) if options['start'] else end - timedelta(days=7)
+        report = ticket_analytics(start, end, parking=options['parking'], section=options['section'])
+
+        dwell = report['dwell']
+        self.stdout.write(f'Tickets closed: {dwell["count"]}, mean dwell {dwell["mean"]} min')
+        for name, value in dwell['percentiles'].items():
+            self.stdout.write(f'  {name}: {value} min')
+        for bucket in dwell['histogram']:
+            upper = bucket['to'] if bucket['to'] is not None else ''
+            self.stdout.write(f'  {bucket["from"]:>6.0f}-{upper:<6} {bucket["count"]}')
+
+        self.stdout.write(f'\n{"section":<38}{"slots":>7}{"tickets":>9}{"peak":>6}  {"peak at":<26}{"turnover":>9}')
+        for row in report['sections']:
+            peak_at = f'{row["peak_at"]:%Y-%m-%d %H:%M}' if row['peak_at'] else ''
+            turnover = row['turnover_per_slot_day'] if row['turnover_per_slot_day'] is not None else ''
+            self.stdout.write(
+                f'{row["section"]:<38}{row["slots"]:>7}{row["tickets"]:>9}{row["peak_occupancy"]:>6}  '
+                f'{peak_at:<26}{turnover:>9}'
+            )
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.middleware import csrf
+
+
+def is_token_only_request(request):
+    return getattr(settings, "API_TOKEN_ONLY", False) and request.path_info.startswith("/api/")
+
+
+class SkipOnTokenApiMixin:
+    """Bypass the middleware for /api/ requests when API_TOKEN_ONLY is on.
+
+    Pure token clients then pay nothing for sessions, CSRF, messages or
+    the session user; the admin and the HTML pages keep them.
+    """
+
+    def __call__(self, request):
+        if is_token_only_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(SkipOnTokenApiMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(SkipOnTokenApiMixin, auth_middleware.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(SkipOnTokenApiMixin, messages_middleware.MessageMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(SkipOnTokenApiMixin, csrf.CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if is_token_only_request(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:33
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def reopen_parked_tickets(apps, schema_editor):
+    """Clear the exit time auto_now stamped on tickets of vehicles still parked.
+
+    Before this migration every save set ``exit_time``, so it tells nothing
+    about check-out. The latest ticket of each booked slot is the vehicle
+    still in it; older tickets of that slot and tickets of free slots did
+    leave and keep their last saved time as exit.
+    """
+    Ticket = apps.get_model("api", "Ticket")
+    latest = (
+        Ticket.objects.filter(parking_slot=OuterRef("parking_slot"))
+        .order_by("-entry_time", "-id")
+        .values("id")[:1]
+    )
+    open_ids = (
+        Ticket.objects.filter(parking_slot__is_booked=True)
+        .annotate(latest_id=Subquery(latest))
+        .filter(id=models.F("latest_id"))
+        .values_list("id", flat=True)
+    )
+    Ticket.objects.filter(id__in=list(open_ids)).update(exit_time=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_remove_parking_area_remove_parking_size_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="amount",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="Amount Charged"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ticket",
+            name="exit_time",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Exit Time"),
+        ),
+        migrations.RunPython(reopen_parked_tickets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:34
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_slots(apps, schema_editor):
+    ParkingSection = apps.get_model("api", "ParkingSection")
+    ParkingSlot = apps.get_model("api", "ParkingSlot")
+    counts = ParkingSlot.objects.values("section_id").annotate(
+        occupied=Count("id", filter=Q(is_booked=True)),
+        reserved=Count("id", filter=Q(is_booked=False, is_reserved=True)),
+        free=Count(
+            "id", filter=Q(is_booked=False, is_reserved=False, is_available=True)
+        ),
+    )
+    for row in counts:
+        ParkingSection.objects.filter(pk=row["section_id"]).update(
+            free_slots=row["free"],
+            occupied_slots=row["occupied"],
+            reserved_slots=row["reserved"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_ticket_exit_time_amount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parkingsection",
+            name="free_slots",
+            field=models.IntegerField(default=0, verbose_name="Free Slots"),
+        ),
+        migrations.AddField(
+            model_name="parkingsection",
+            name="occupied_slots",
+            field=models.IntegerField(default=0, verbose_name="Occupied Slots"),
+        ),
+        migrations.AddField(
+            model_name="parkingsection",
+            name="reserved_slots",
+            field=models.IntegerField(default=0, verbose_name="Reserved Slots"),
+        ),
+        migrations.RunPython(count_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_section_occupancy_counters"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="parkingslot",
+            index=models.Index(
+                fields=["section", "is_available", "type"],
+                name="slot_section_avail_type_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="parkingslot",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_available", True), ("is_booked", False), ("is_reserved", False)
+                ),
+                fields=["section", "type", "is_charging_available"],
+                name="slot_free_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="passes",
+            index=models.Index(
+                fields=["vehicle", "start_date", "end_date"],
+                name="passes_vehicle_dates_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                condition=models.Q(("exit_time__isnull", True)),
+                fields=["vehicle"],
+                name="ticket_open_vehicle_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TicketArchive",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                (
+                    "user_id",
+                    models.IntegerField(blank=True, null=True, verbose_name="User Id"),
+                ),
+                (
+                    "parking_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="Parking Id"
+                    ),
+                ),
+                (
+                    "parking_slot_id",
+                    models.UUIDField(
+                        blank=True, null=True, verbose_name="Parking Slot Id"
+                    ),
+                ),
+                (
+                    "vehicle_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="Vehicle Id"
+                    ),
+                ),
+                (
+                    "parking_price_id",
+                    models.UUIDField(
+                        blank=True, null=True, verbose_name="Parking Price Id"
+                    ),
+                ),
+                ("entry_time", models.DateTimeField(verbose_name="Entry Time")),
+                ("exit_time", models.DateTimeField(verbose_name="Exit Time")),
+                (
+                    "amount",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Amount Charged"
+                    ),
+                ),
+                (
+                    "archived_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Archived At"),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Ticket Archive",
+                "indexes": [
+                    models.Index(
+                        fields=["entry_time"], name="ticket_archive_entry_idx"
+                    ),
+                    models.Index(
+                        fields=["parking_id", "entry_time"],
+                        name="ticket_archive_parking_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:42
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_ticket_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PricingRule",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        blank=True, max_length=100, null=True, verbose_name="Rule Name"
+                    ),
+                ),
+                (
+                    "days",
+                    models.CharField(
+                        choices=[
+                            ("ALL", "All Days"),
+                            ("WEEKDAY", "Weekday"),
+                            ("WEEKEND", "Weekend"),
+                        ],
+                        default="ALL",
+                        max_length=20,
+                        verbose_name="Days",
+                    ),
+                ),
+                (
+                    "start_hour",
+                    models.IntegerField(default=0, verbose_name="Start Hour"),
+                ),
+                ("end_hour", models.IntegerField(default=24, verbose_name="End Hour")),
+                (
+                    "min_minutes",
+                    models.IntegerField(default=0, verbose_name="Minimum Stay Minutes"),
+                ),
+                (
+                    "max_minutes",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="Maximum Stay Minutes"
+                    ),
+                ),
+                (
+                    "multiplier",
+                    models.FloatField(default=1, verbose_name="Rate Multiplier"),
+                ),
+                (
+                    "cap",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Maximum Charge"
+                    ),
+                ),
+                (
+                    "parking_price",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pricing_rule",
+                        to="api.parkingprice",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Pricing Rule",
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_pricing_rule"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="passes",
+            name="passes_vehicle_dates_idx",
+        ),
+        migrations.AddIndex(
+            model_name="passes",
+            index=models.Index(
+                fields=["vehicle", "parking", "start_date", "end_date"],
+                name="passes_active_lookup_idx",
+            ),
+        ),
+    ]
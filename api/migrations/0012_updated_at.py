@@ -0,0 +1,80 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_passes_active_lookup_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parking",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Updated At",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="parkingsection",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Updated At",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="parkingprice",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Updated At",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="parkingslot",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Updated At",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="vehicle",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Updated At",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="passes",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Updated At",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:47
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                ("seq", models.BigAutoField(primary_key=True, serialize=False)),
+                ("model", models.CharField(max_length=50, verbose_name="Model")),
+                (
+                    "object_id",
+                    models.CharField(max_length=50, verbose_name="Object Id"),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("SAVE", "Save"), ("DELETE", "Delete")],
+                        default="SAVE",
+                        max_length=10,
+                        verbose_name="Action",
+                    ),
+                ),
+                (
+                    "parking_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="Parking Id"
+                    ),
+                ),
+                (
+                    "data",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                        verbose_name="Data",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, db_index=True, verbose_name="Created At"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Change Log",
+                "indexes": [
+                    models.Index(
+                        fields=["parking_id", "seq"], name="changelog_parking_seq_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:58
+
+from django.db import migrations, models
+from django.db.models import Count
+
+PERIOD_FIELDS = ("vehicle_id", "parking_id", "start_date", "end_date")
+
+
+def delete_duplicate_passes(apps, schema_editor):
+    """Keep one pass of every vehicle, parking and period before the constraint.
+
+    Copies without a price are deleted, keeping the paid one, else the
+    latest updated. Paid copies are never dropped: when a period has more
+    than one, the migration stops and lists them to be merged or refunded.
+    """
+    Passes = apps.get_model("api", "Passes")
+    # NULL dates never conflict under the constraint
+    duplicates = (
+        Passes.objects.filter(start_date__isnull=False, end_date__isnull=False)
+        .values(*PERIOD_FIELDS)
+        .annotate(copies=Count("id"))
+        .filter(copies__gt=1)
+    )
+    unpaid, paid = [], []
+    for row in duplicates:
+        period = {field: row[field] for field in PERIOD_FIELDS}
+        copies = list(
+            Passes.objects.filter(**period)
+            .order_by("-price", "-updated_at", "-id")
+            .values_list("id", "price", *PERIOD_FIELDS)
+        )
+        extra = copies[1:]
+        unpaid += [copy[0] for copy in extra if not copy[1]]
+        if any(copy[1] for copy in extra):
+            paid += [copy for copy in copies if copy[1]]
+    if paid:
+        listing = "\n".join(
+            f"  pass {pk}: vehicle {vehicle_id}, parking {parking_id}, {start} to {end}, price {price}"
+            for pk, price, vehicle_id, parking_id, start, end in paid
+        )
+        raise RuntimeError(
+            "Several paid passes cover the same vehicle, parking and period. Merge or refund them "
+            f"so at most one is left per period, then migrate again:\n{listing}"
+        )
+    if unpaid:
+        Passes.objects.filter(pk__in=unpaid).delete()
+        print(
+            f"\n  Deleted {len(unpaid)} duplicate passes without a price: {', '.join(map(str, unpaid))}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_change_log"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_passes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="passes",
+            constraint=models.UniqueConstraint(
+                fields=("vehicle", "parking", "start_date", "end_date"),
+                name="passes_vehicle_period_uniq",
+            ),
+        ),
+        # The constraint's index replaces the lookup index, built first so lookups stay indexed
+        migrations.RemoveIndex(
+            model_name="passes",
+            name="passes_active_lookup_idx",
+        ),
+    ]
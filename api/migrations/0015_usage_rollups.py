@@ -0,0 +1,102 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_passes_period_unique"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Name",
+                    ),
+                ),
+                (
+                    "exit_time",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Exit Time"
+                    ),
+                ),
+                ("ticket_id", models.IntegerField(default=0, verbose_name="Ticket Id")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated At"),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UsageRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "grain",
+                    models.CharField(
+                        choices=[("HOUR", "Hour"), ("DAY", "Day")],
+                        max_length=10,
+                        verbose_name="Grain",
+                    ),
+                ),
+                ("period_start", models.DateTimeField(verbose_name="Period Start")),
+                ("parking_id", models.IntegerField(verbose_name="Parking Id")),
+                ("section_id", models.UUIDField(verbose_name="Section Id")),
+                (
+                    "vehicle_type",
+                    models.CharField(
+                        choices=[
+                            ("TWO", "Two"),
+                            ("FOUR-SMALL", "Four-Small"),
+                            ("FOUR-LARGE", "Four-Large"),
+                        ],
+                        max_length=50,
+                        verbose_name="Vehicle Type",
+                    ),
+                ),
+                ("tickets", models.IntegerField(default=0, verbose_name="Tickets")),
+                (
+                    "occupied_minutes",
+                    models.FloatField(default=0, verbose_name="Occupied Minutes"),
+                ),
+                ("revenue", models.FloatField(default=0, verbose_name="Revenue")),
+            ],
+            options={
+                "verbose_name_plural": "Usage Rollup",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(fields=["exit_time", "id"], name="ticket_exit_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="usagerollup",
+            index=models.Index(
+                fields=["grain", "parking_id", "period_start"],
+                name="usage_rollup_parking_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="usagerollup",
+            constraint=models.UniqueConstraint(
+                fields=("grain", "period_start", "section_id", "vehicle_type"),
+                name="usage_rollup_period_uniq",
+            ),
+        ),
+    ]
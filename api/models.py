@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from uuid import uuid4
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
 from parking.settings import AUTH_USER_MODEL
@@ -21,6 +22,22 @@ PARKING_TYPE_CHOICES = (
     ("MONTHLY", "Monthly"),
 )
 
+CHANGE_ACTION_CHOICES = (
+    ("SAVE", "Save"),
+    ("DELETE", "Delete"),
+)
+
+ROLLUP_GRAIN_CHOICES = (
+    ("HOUR", "Hour"),
+    ("DAY", "Day"),
+)
+
+DAY_CHOICES = (
+    ("ALL", "All Days"),
+    ("WEEKDAY", "Weekday"),
+    ("WEEKEND", "Weekend"),
+)
+
 
 class UserManager(BaseUserManager):
 
@@ -65,6 +82,7 @@ class Parking(models.Model):
     location = models.CharField('Parking Location', max_length=255, null=True, blank=True)
     description = models.TextField('Parking Description', null=True, blank=True)
     capacity = models.IntegerField('Parking Capacity', default=0)
+    updated_at = models.DateTimeField('Updated At', auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -80,6 +98,10 @@ class ParkingSection(models.Model):
     parking_type = models.CharField('Parking Type', max_length=50, choices=SIZE_CHOICES, default="FOUR-SMALL")
     name = models.CharField('Section Name', max_length=100, null=True, blank=True)
     capacity = models.IntegerField('Capacity', default=0)
+    free_slots = models.IntegerField('Free Slots', default=0)
+    occupied_slots = models.IntegerField('Occupied Slots', default=0)
+    reserved_slots = models.IntegerField('Reserved Slots', default=0)
+    updated_at = models.DateTimeField('Updated At', auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -95,6 +117,37 @@ class ParkingPrice(models.Model):
     price = models.FloatField('Parking Price', default=0)
     vehicle_size = models.CharField('Vehicle Size', max_length=50, choices=SIZE_CHOICES, default="FOUR-SMALL")
     has_charging = models.BooleanField('Has Charging', default=False)
+    updated_at = models.DateTimeField('Updated At', auto_now=True, db_index=True)
+
+
+OCCUPANCY_FIELDS = {"section_id", "is_booked", "is_reserved", "is_available"}
+
+
+class PricingRule(models.Model):
+    """Adjustment of a ParkingPrice for a time window and a duration tier.
+
+    Minutes of a stay that fall inside the window are charged at
+    ``multiplier`` times the base rate, for stays whose total length is in
+    ``[min_minutes, max_minutes)``. The window runs from ``start_hour`` to
+    ``end_hour`` local time and wraps past midnight when start is after end.
+    A ``cap`` limits the total charged for matching stays.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    parking_price = models.ForeignKey(ParkingPrice, on_delete=models.CASCADE, related_name='pricing_rule')
+    name = models.CharField('Rule Name', max_length=100, null=True, blank=True)
+    days = models.CharField('Days', max_length=20, choices=DAY_CHOICES, default="ALL")
+    start_hour = models.IntegerField('Start Hour', default=0)
+    end_hour = models.IntegerField('End Hour', default=24)
+    min_minutes = models.IntegerField('Minimum Stay Minutes', default=0)
+    max_minutes = models.IntegerField('Maximum Stay Minutes', null=True, blank=True)
+    multiplier = models.FloatField('Rate Multiplier', default=1)
+    cap = models.FloatField('Maximum Charge', null=True, blank=True)
+
+    def __str__(self):
+        return self.name or str(self.id)
+
+    class Meta:
+        verbose_name_plural = "Pricing Rule"
 
 
 class ParkingSlot(models.Model):
@@ -106,12 +159,40 @@ class ParkingSlot(models.Model):
     is_booked = models.BooleanField('Is Booked', default=False)
     is_reserved = models.BooleanField('Is Reserved', default=False)
     is_available = models.BooleanField('Is Available', default=True)
+    updated_at = models.DateTimeField('Updated At', auto_now=True, db_index=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember where the slot was counted so the section counters can be moved on save
+        if OCCUPANCY_FIELDS.issubset(field_names):
+            instance._loaded_occupancy = (instance.section_id, instance.occupancy_state)
+        return instance
+
+    @property
+    def occupancy_state(self):
+        """Name of the section counter this slot is counted in, if any"""
+        if self.is_booked:
+            return "occupied_slots"
+        if self.is_reserved:
+            return "reserved_slots"
+        if self.is_available:
+            return "free_slots"
+        return None
 
     def __str__(self):
         return self.slot_number
 
     class Meta:
         verbose_name_plural = "Parking Slot"
+        indexes = [
+            models.Index(fields=["section", "is_available", "type"], name="slot_section_avail_type_idx"),
+            models.Index(
+                fields=["section", "type", "is_charging_available"],
+                condition=models.Q(is_available=True, is_booked=False, is_reserved=False),
+                name="slot_free_idx",
+            ),
+        ]
 
 
 class Vehicle(models.Model):
@@ -120,6 +201,7 @@ class Vehicle(models.Model):
     vehicle_type = models.CharField('Vehicle Type', max_length=50, choices=SIZE_CHOICES, default="FOUR-SMALL")
     is_electric = models.BooleanField('Is Electric', default=False)
     is_active = models.BooleanField('Is Active', default=True)
+    updated_at = models.DateTimeField('Updated At', auto_now=True, db_index=True)
 
     def __str__(self):
         return self.vehicle_number
@@ -136,12 +218,19 @@ class Passes(models.Model):
     start_date = models.DateField('Start Date', null=True, blank=True)
     end_date = models.DateField('End Date', null=True, blank=True)
     price = models.FloatField('Pass Price', default=0)
+    updated_at = models.DateTimeField('Updated At', auto_now=True, db_index=True)
 
     def __str__(self):
         return str(self.start_date) + ' - ' + str(self.end_date)
 
     class Meta:
         verbose_name_plural = "Passes"
+        # Also serves the active pass lookup, and is the conflict target of bulk imports
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vehicle", "parking", "start_date", "end_date"], name="passes_vehicle_period_uniq"
+            ),
+        ]
 
 
 class Ticket(models.Model):
@@ -149,11 +238,114 @@ class Ticket(models.Model):
     parking_slot = models.ForeignKey(ParkingSlot, on_delete=models.CASCADE, related_name='parking_slot_ticket', null=True, blank=True)
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='vehicle_ticket', null=True, blank=True)
     entry_time = models.DateTimeField('Entry Time', auto_now_add=True)
-    exit_time = models.DateTimeField('Exit Time', auto_now=True)
+    exit_time = models.DateTimeField('Exit Time', null=True, blank=True)
     parking_price = models.ForeignKey(ParkingPrice, on_delete=models.CASCADE, related_name='parking_price_ticket', null=True, blank=True)
+    amount = models.FloatField('Amount Charged', null=True, blank=True)
 
     def __str__(self):
         return str(self.entry_time) + ' - ' + str(self.exit_time)
 
     class Meta:
         verbose_name_plural = "Ticket"
+        indexes = [
+            models.Index(fields=["vehicle"], condition=models.Q(exit_time__isnull=True), name="ticket_open_vehicle_idx"),
+            # Serves the rollup-usage watermark scan over closed tickets
+            models.Index(fields=["exit_time", "id"], name="ticket_exit_idx"),
+        ]
+
+
+class TicketArchive(models.Model):
+    """Closed tickets moved out of the Ticket table by archive-tickets.
+
+    Related rows may be deleted after a ticket is archived, so references
+    are kept as plain ids instead of foreign keys.
+    """
+    id = models.IntegerField(primary_key=True)
+    user_id = models.IntegerField('User Id', null=True, blank=True)
+    parking_id = models.IntegerField('Parking Id', null=True, blank=True)
+    parking_slot_id = models.UUIDField('Parking Slot Id', null=True, blank=True)
+    vehicle_id = models.IntegerField('Vehicle Id', null=True, blank=True)
+    parking_price_id = models.UUIDField('Parking Price Id', null=True, blank=True)
+    entry_time = models.DateTimeField('Entry Time')
+    exit_time = models.DateTimeField('Exit Time')
+    amount = models.FloatField('Amount Charged', null=True, blank=True)
+    archived_at = models.DateTimeField('Archived At', auto_now_add=True)
+
+    def __str__(self):
+        return str(self.entry_time) + ' - ' + str(self.exit_time)
+
+    class Meta:
+        verbose_name_plural = "Ticket Archive"
+        indexes = [
+            models.Index(fields=["entry_time"], name="ticket_archive_entry_idx"),
+            models.Index(fields=["parking_id", "entry_time"], name="ticket_archive_parking_idx"),
+        ]
+
+
+class ChangeLog(models.Model):
+    """Change feed of slots and tickets, read by /api/changes.
+
+    ``seq`` only grows, so a client that remembers the last ``seq`` it saw
+    can ask for everything after it. ``data`` holds the row as it was
+    after the change.
+    """
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField('Model', max_length=50)
+    object_id = models.CharField('Object Id', max_length=50)
+    action = models.CharField('Action', max_length=10, choices=CHANGE_ACTION_CHOICES, default="SAVE")
+    parking_id = models.IntegerField('Parking Id', null=True, blank=True)
+    data = models.JSONField('Data', null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField('Created At', auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.seq} {self.model} {self.object_id}'
+
+    class Meta:
+        verbose_name_plural = "Change Log"
+        indexes = [
+            models.Index(fields=["parking_id", "seq"], name="changelog_parking_seq_idx"),
+        ]
+
+
+class UsageRollup(models.Model):
+    """Closed ticket totals per hour or day, section and vehicle type.
+
+    Maintained by the rollup-usage command and read by /api/reports. Tickets
+    and revenue count in the period the ticket closed, occupied minutes in
+    every period the stay overlapped. Ids are plain columns like in
+    TicketArchive so history outlives deleted sections.
+    """
+    grain = models.CharField('Grain', max_length=10, choices=ROLLUP_GRAIN_CHOICES)
+    period_start = models.DateTimeField('Period Start')
+    parking_id = models.IntegerField('Parking Id')
+    section_id = models.UUIDField('Section Id')
+    vehicle_type = models.CharField('Vehicle Type', max_length=50, choices=SIZE_CHOICES)
+    tickets = models.IntegerField('Tickets', default=0)
+    occupied_minutes = models.FloatField('Occupied Minutes', default=0)
+    revenue = models.FloatField('Revenue', default=0)
+
+    def __str__(self):
+        return f'{self.grain} {self.period_start} {self.section_id} {self.vehicle_type}'
+
+    class Meta:
+        verbose_name_plural = "Usage Rollup"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["grain", "period_start", "section_id", "vehicle_type"], name="usage_rollup_period_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["grain", "parking_id", "period_start"], name="usage_rollup_parking_idx"),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """How far rollup-usage got, as the (exit_time, id) of the last ticket it counted"""
+    name = models.CharField('Name', max_length=50, primary_key=True)
+    exit_time = models.DateTimeField('Exit Time', null=True, blank=True)
+    ticket_id = models.IntegerField('Ticket Id', default=0)
+    updated_at = models.DateTimeField('Updated At', auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} {self.exit_time} {self.ticket_id}'
+
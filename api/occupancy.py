@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .cache import bump_version
+from .models import ParkingSection, ParkingSlot
+
+COUNTER_FIELDS = ("free_slots", "occupied_slots", "reserved_slots")
+
+
+def move_slot(old, new):
+    """Move a slot between section counters.
+
+    ``old`` and ``new`` are ``(section_id, counter)`` pairs as returned by
+    the slot's ``occupancy_state``, or None when the slot is not counted.
+    Counters are changed with F() expressions so concurrent updates of the
+    same section add up instead of overwriting each other.
+    """
+    if old == new:
+        return
+    changes = {}
+    if old is not None and old[1] is not None:
+        changes.setdefault(old[0], {})[old[1]] = F(old[1]) - 1
+    if new is not None and new[1] is not None:
+        changes.setdefault(new[0], {})[new[1]] = F(new[1]) + 1
+    for section_id, fields in changes.items():
+        ParkingSection.objects.filter(pk=section_id).update(updated_at=timezone.now(), **fields)
+        # Cached section details include the counters. Retiring every cached
+        # section list on each check-in would leave that cache useless, so
+        # lists show counters up to CATALOGUE_CACHE_SECONDS old
+        bump_version(ParkingSection._meta.label_lower, section_id, lists=False)
+
+
+def rebuild_counters(parking_id=None):
+    """Recount every section from its slots, returns the number of sections updated"""
+    sections = ParkingSection.objects.all()
+    slots = ParkingSlot.objects.all()
+    if parking_id is not None:
+        sections = sections.filter(parking_id=parking_id)
+        slots = slots.filter(section__parking_id=parking_id)
+
+    counts = slots.values("section_id").annotate(
+        occupied_slots=Count("id", filter=Q(is_booked=True)),
+        reserved_slots=Count("id", filter=Q(is_booked=False, is_reserved=True)),
+        free_slots=Count("id", filter=Q(is_booked=False, is_reserved=False, is_available=True)),
+    )
+    with transaction.atomic():
+        sections = list(sections.select_for_update().only("id", *COUNTER_FIELDS))
+        by_section = {row["section_id"]: row for row in counts}
+        now = timezone.now()
+        for section in sections:
+            section.updated_at = now
+            row = by_section.get(section.id, {})
+            for field in COUNTER_FIELDS:
+                setattr(section, field, row.get(field, 0))
+        ParkingSection.objects.bulk_update(sections, [*COUNTER_FIELDS, "updated_at"], batch_size=500)
+    bump_version(ParkingSection._meta.label_lower)
+    return len(sections)
+
+
+def section_counters(parking_id):
+    return (
+        ParkingSection.objects.filter(parking_id=parking_id)
+        .order_by("floor", "name")
+        .values("id", "name", "floor", *COUNTER_FIELDS)
+    )
+
+
+def occupancy_summary(parking_id, sections):
+    totals = {field: sum(section[field] for section in sections) for field in COUNTER_FIELDS}
+    return {"parking": parking_id, **totals, "sections": sections}
+
+
+def parking_occupancy(parking_id):
+    """Counters of a parking and each of its sections"""
+    return occupancy_summary(parking_id, list(section_counters(parking_id)))
+
+
+async def aparking_occupancy(parking_id):
+    return occupancy_summary(parking_id, [section async for section in section_counters(parking_id)])
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key.
+
+    Pages are fetched with ``WHERE id > <cursor> ORDER BY id LIMIT n`` on the
+    primary key index, so late pages cost the same as the first one.
+    """
+
+    ordering = "id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
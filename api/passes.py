@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Passes, Vehicle
+
+
+def active_pass_key(vehicle_number, day):
+    return f"active-pass:{day.isoformat()}:{vehicle_number}"
+
+
+def active_pass_rows(vehicle_number, day):
+    return Passes.objects.filter(
+        vehicle__vehicle_number=vehicle_number,
+        start_date__lte=day,
+        end_date__gte=day,
+    ).values("id", "parking_id", "vehicle_id", "start_date", "end_date")
+
+
+def active_passes(vehicle_number):
+    """Passes of a vehicle valid today, keyed by parking id.
+
+    Served from a short lived cache entry per vehicle number; on a miss the
+    passes are read with one query on the (vehicle, parking, dates) index.
+    """
+    today = timezone.localdate()
+    key = active_pass_key(vehicle_number, today)
+    passes = cache.get(key)
+    if passes is None:
+        passes = {row["parking_id"]: row for row in active_pass_rows(vehicle_number, today)}
+        cache.set(key, passes, getattr(settings, "ACTIVE_PASS_CACHE_SECONDS", 60))
+    return passes
+
+
+async def aactive_passes(vehicle_number):
+    """``active_passes`` for async views, using the async cache and ORM APIs"""
+    today = timezone.localdate()
+    key = active_pass_key(vehicle_number, today)
+    passes = await cache.aget(key)
+    if passes is None:
+        passes = {row["parking_id"]: row async for row in active_pass_rows(vehicle_number, today)}
+        await cache.aset(key, passes, getattr(settings, "ACTIVE_PASS_CACHE_SECONDS", 60))
+    return passes
+
+
+def pass_for_parking(passes, parking=None):
+    """The active pass for ``parking``, or any active pass without one"""
+    if parking is None:
+        return next(iter(passes.values()), None)
+    return passes.get(parking)
+
+
+def invalidate_active_passes(vehicle_id):
+    vehicle_number = Vehicle.objects.filter(pk=vehicle_id).values_list("vehicle_number", flat=True).first()
+    if vehicle_number is not None:
+        cache.delete(active_pass_key(vehicle_number, timezone.localdate()))
+
+
+def invalidate_active_pass_numbers(vehicle_numbers):
+    """Drop the cached lookups of many vehicles at once, for bulk writes"""
+    today = timezone.localdate()
+    cache.delete_many([active_pass_key(vehicle_number, today) for vehicle_number in vehicle_numbers])
+
@@ -10,4 +10,25 @@ class IsAdmin(permissions.BasePermission):
         return request.user.is_superuser
 
 
+def parking_scope(request):
+    """Parking ids a device token is limited to, None for unrestricted credentials"""
+    token = request.auth
+    if hasattr(token, "payload") and "parkings" in token.payload:
+        return set(token.payload["parkings"])
+    return None
+
+
+class InParkingScope(permissions.BasePermission):
+    """Device tokens may only act on the parkings in their claims.
+
+    The view names the parking a request touches with ``scoped_parking``.
+    """
+
+    message = 'This device is not allowed to act on this parking'
+
+    def has_permission(self, request, view):
+        scope = parking_scope(request)
+        if scope is None:
+            return True
+        return view.scoped_parking(request) in scope
 
@@ -0,0 +1,156 @@
+import math
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+from .models import ParkingPrice, ParkingSection, PricingRule
+
+# Length of one billing unit per ParkingPrice.type, in seconds
+BILLING_PERIODS = {
+    "HOURLY": 60 * 60,
+    "DAILY": 24 * 60 * 60,
+    "MONTHLY": 30 * 24 * 60 * 60,
+}
+
+
+def billable_units(billing_type, duration):
+    """Number of started billing periods in ``duration``, at least one"""
+    seconds = max(duration.total_seconds(), 0)
+    return max(math.ceil(seconds / BILLING_PERIODS[billing_type]), 1)
+
+
+def compute_fee(billing_type, price, duration):
+    """Amount owed for a stay of ``duration`` at ``price`` per billing period"""
+    return round(billable_units(billing_type, duration) * price, 2)
+
+
+class RateTables:
+    """ParkingPrice rows compiled into per-parking lookup tables.
+
+    Each table maps ``(section_id, vehicle_size, has_charging, type)`` to the
+    ``(price_id, price, rules)`` of the matching ParkingPrice, ``rules``
+    being its PricingRules. Tables are built with two queries per parking on
+    first use, dropped by signals when a price, rule or section changes in
+    this process, and rebuilt every ``PRICING_CACHE_SECONDS`` so changes
+    made by other workers are picked up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._section_parking = {}
+
+    @property
+    def ttl(self):
+        return getattr(settings, "PRICING_CACHE_SECONDS", 300)
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = {}
+            self._section_parking = {}
+
+    def invalidate_section(self, section_id, parking_id):
+        """Forget a section that was saved or deleted, and its parking's table"""
+        with self._lock:
+            self._tables.pop(self._section_parking.pop(section_id, None), None)
+            self._tables.pop(parking_id, None)
+
+    def invalidate_prices(self, section_id):
+        """Drop the table holding a section's prices after one of them changed"""
+        with self._lock:
+            parking_id = self._section_parking.get(section_id)
+            if parking_id is None:
+                self._tables = {}
+            else:
+                self._tables.pop(parking_id, None)
+
+    def parking_for_section(self, section_id):
+        with self._lock:
+            parking_id = self._section_parking.get(section_id)
+            if parking_id is None:
+                parking_id = ParkingSection.objects.filter(pk=section_id).values_list("parking_id", flat=True).first()
+                if parking_id is not None:
+                    self._section_parking[section_id] = parking_id
+            return parking_id
+
+    def table(self, parking_id):
+        with self._lock:
+            entry = self._tables.get(parking_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
+            rows = ParkingPrice.objects.filter(parking_section__parking_id=parking_id).values_list(
+                "parking_section_id", "vehicle_size", "has_charging", "type", "id", "price"
+            )
+            rules = {}
+            for rule in PricingRule.objects.filter(parking_price__parking_section__parking_id=parking_id):
+                rules.setdefault(rule.parking_price_id, []).append(rule)
+            table = {
+                (section, size, charging, billing): (pk, price, tuple(rules.get(pk, ())))
+                for section, size, charging, billing, pk, price in rows
+            }
+            self._tables[parking_id] = (time.monotonic(), table)
+            return table
+
+    def rate(self, section_id, vehicle_size, has_charging, billing_type):
+        """``(price_id, price, rules)`` for a section, or None when no price is set"""
+        parking_id = self.parking_for_section(section_id)
+        if parking_id is None:
+            return None
+        return self.table(parking_id).get((section_id, vehicle_size, has_charging, billing_type))
+
+
+rate_tables = RateTables()
+
+
+def confirmed_price_id(section_id, vehicle_size, has_charging, billing_type):
+    """Id of the ParkingPrice a new ticket is charged at, checked against the database.
+
+    Another worker's change may not have reached this worker's rate tables
+    yet, so the cached pick is confirmed with one query, and looked up
+    afresh when it no longer matches.
+    """
+    prices = ParkingPrice.objects.filter(
+        parking_section_id=section_id, vehicle_size=vehicle_size, has_charging=has_charging, type=billing_type
+    )
+    rate = rate_tables.rate(section_id, vehicle_size, has_charging, billing_type)
+    if rate is not None and prices.filter(pk=rate[0]).exists():
+        return rate[0]
+    rate_tables.invalidate_prices(section_id)
+    return prices.values_list("id", flat=True).first()
+
+
+def quote(vehicle, section, duration, billing_type=None, has_charging=None, start=None):
+    """Price a stay of ``duration`` from ``start`` (now) for ``vehicle`` in ``section``.
+
+    ``vehicle`` only needs ``vehicle_type`` and ``is_electric``, so an unsaved
+    Vehicle works. Charging defaults to the vehicle being electric. Without
+    a ``billing_type`` the cheapest available billing type is quoted. The
+    amount goes through the same PricingRules as check-out. Returns None
+    when the section has no matching price.
+    """
+    # pricing_rules builds on BILLING_PERIODS from this module
+    from .pricing_rules import price_intervals
+
+    section_id = getattr(section, "pk", section)
+    if has_charging is None:
+        has_charging = vehicle.is_electric
+    entry = int((start or timezone.now()).timestamp())
+    exit = entry + int(max(duration.total_seconds(), 0))
+    billing_types = [billing_type] if billing_type else list(BILLING_PERIODS)
+    quotes = []
+    for billing in billing_types:
+        rate = rate_tables.rate(section_id, vehicle.vehicle_type, has_charging, billing)
+        if rate is None:
+            continue
+        price_id, price, rules = rate
+        quotes.append(
+            {
+                "section": section_id,
+                "parking_price": price_id,
+                "type": billing,
+                "price": price,
+                "units": billable_units(billing, duration),
+                "amount": float(price_intervals([entry], [exit], billing, price, rules)[0]),
+            }
+        )
+    return min(quotes, key=lambda item: item["amount"], default=None)
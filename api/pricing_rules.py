@@ -0,0 +1,194 @@
+from datetime import datetime
+import numpy as np
+from django.utils import timezone
+from .analytics import Epoch
+from .models import ParkingPrice, Passes, PricingRule
+from .pricing import BILLING_PERIODS
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# 1970-01-01 was a Thursday, shift epoch minutes so that 0 is a Monday
+EPOCH_WEEKDAY_SHIFT = 3 * MINUTES_PER_DAY
+# UTC offsets only change on quarter hours
+OFFSET_STEP = 15 * 60
+
+
+def window_mask(rule):
+    """Boolean array over the minutes of a week (Monday 00:00 first) inside the rule's window"""
+    minutes = np.arange(MINUTES_PER_WEEK)
+    day = minutes // MINUTES_PER_DAY
+    hour = (minutes % MINUTES_PER_DAY) / 60
+    if rule.start_hour < rule.end_hour:
+        mask = (hour >= rule.start_hour) & (hour < rule.end_hour)
+    else:
+        mask = (hour >= rule.start_hour) | (hour < rule.end_hour)
+    if rule.days == "WEEKDAY":
+        mask &= day < 5
+    elif rule.days == "WEEKEND":
+        mask &= day >= 5
+    return mask
+
+
+def minutes_in_window(mask, start, end):
+    """Minutes between epoch minute arrays ``start`` and ``end`` that fall in ``mask``.
+
+    Uses a prefix sum over one week, so the cost is independent of how long
+    each stay is.
+    """
+    cumulative = np.concatenate(([0], np.cumsum(mask)))
+    per_week = cumulative[-1]
+
+    def upto(t):
+        t = t + EPOCH_WEEKDAY_SHIFT
+        return (t // MINUTES_PER_WEEK) * per_week + cumulative[t % MINUTES_PER_WEEK]
+
+    return upto(end) - upto(start)
+
+
+def local_offsets(epochs):
+    """UTC offset of TIME_ZONE in seconds at each of the epoch seconds, looked up once per quarter hour"""
+    steps, positions = np.unique(np.asarray(epochs, dtype=np.int64) // OFFSET_STEP, return_inverse=True)
+    zone = timezone.get_current_timezone()
+    offsets = np.array(
+        [datetime.fromtimestamp(step * OFFSET_STEP, tz=zone).utcoffset().total_seconds() for step in steps.tolist()],
+        dtype=np.int64,
+    )
+    return offsets[positions.reshape(-1)]
+
+
+def price_intervals(entry, exit, billing_type, price, rules=()):
+    """Amounts for stays given as epoch-second arrays, all at one ParkingPrice.
+
+    The base charge is the number of started billing periods times
+    ``price``; every matching rule then re-prices the minutes inside its
+    window and caps are applied last.
+    """
+    entry = np.asarray(entry, dtype=np.int64)
+    exit = np.asarray(exit, dtype=np.int64)
+    seconds = np.maximum(exit - entry, 0)
+    period = BILLING_PERIODS[billing_type]
+    amount = np.maximum(np.ceil(seconds / period), 1) * price
+
+    duration = seconds / 60
+    # Windows are local wall clock times, at the offset of TIME_ZONE on each side of the stay
+    start = (entry + local_offsets(entry)) // 60
+    end = (exit + local_offsets(exit)) // 60
+    per_minute = price * 60 / period
+    caps = np.full(len(entry), np.inf)
+    for rule in rules:
+        applies = duration >= rule.min_minutes
+        if rule.max_minutes is not None:
+            applies &= duration < rule.max_minutes
+        if rule.multiplier != 1:
+            inside = minutes_in_window(window_mask(rule), start, end)
+            amount += np.where(applies, inside * per_minute * (rule.multiplier - 1), 0)
+        if rule.cap is not None:
+            caps = np.where(applies, np.minimum(caps, rule.cap), caps)
+    return np.round(np.minimum(amount, caps), 2)
+
+
+def load_rules(price_ids):
+    rules = {}
+    for rule in PricingRule.objects.filter(parking_price_id__in=price_ids):
+        rules.setdefault(rule.parking_price_id, []).append(rule)
+    return rules
+
+
+def ticket_fee(ticket, has_pass=False):
+    """Amount owed for a closed ticket; vehicles holding a pass pay nothing"""
+    parking_price = ticket.parking_price
+    if has_pass or parking_price is None:
+        return 0
+    return float(
+        price_intervals(
+            [int(ticket.entry_time.timestamp())],
+            [int(ticket.exit_time.timestamp())],
+            parking_price.type,
+            parking_price.price,
+            list(parking_price.pricing_rule.all()),
+        )[0]
+    )
+
+
+def pass_periods(tickets):
+    """Columns ``(vehicle_ids, parking_ids, first_days, last_days)`` of the passes of the tickets' vehicles.
+
+    Days are counted from 1970-01-01.
+    """
+    rows = Passes.objects.filter(
+        vehicle_id__in=tickets.values("vehicle_id"), start_date__isnull=False, end_date__isnull=False
+    ).values_list("vehicle_id", "parking_id", "start_date", "end_date")
+    vehicle_ids, parking_ids, starts, ends = tuple(zip(*rows)) or ((), (), (), ())
+    return (
+        np.array(vehicle_ids, dtype=np.int64),
+        np.array(parking_ids, dtype=np.int64),
+        np.array(starts, dtype="datetime64[D]").astype(np.int64),
+        np.array(ends, dtype="datetime64[D]").astype(np.int64),
+    )
+
+
+def covered_by_passes(vehicle_ids, parking_ids, days, passes):
+    """Whether a pass of the same vehicle and parking spans each day.
+
+    Passes are sorted by vehicle and parking, every stay is paired with the
+    run of passes sharing its key, and the pairs are checked at once.
+    """
+    pass_vehicles, pass_parkings, first_days, last_days = passes
+    covered = np.zeros(len(days), dtype=bool)
+    if not len(first_days):
+        return covered
+    width = max(int(parking_ids.max(initial=0)), int(pass_parkings.max())) + 1
+    pass_keys = pass_vehicles * width + pass_parkings
+    order = np.argsort(pass_keys, kind="stable")
+    pass_keys, first_days, last_days = pass_keys[order], first_days[order], last_days[order]
+
+    keys = vehicle_ids * width + parking_ids
+    left = np.searchsorted(pass_keys, keys, "left")
+    counts = np.searchsorted(pass_keys, keys, "right") - left
+    stays = np.repeat(np.arange(len(keys)), counts)
+    candidates = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(left, counts)
+    inside = (first_days[candidates] <= days[stays]) & (days[stays] <= last_days[candidates])
+    covered[stays[inside]] = True
+    return covered
+
+
+def reprice_tickets(tickets):
+    """Price a queryset of closed tickets in one pass.
+
+    Returns ``(ids, amounts, stored)`` arrays, ``stored`` holding the amounts
+    currently on the tickets (NaN when unset). Tickets are loaded as columns
+    with their epochs computed by the database, grouped by ParkingPrice and
+    every group is priced with array operations. Like check-out, tickets of
+    vehicles holding a pass for the parking on the exit date are priced at 0.
+    """
+    tickets = tickets.filter(exit_time__isnull=False, parking_price__isnull=False)
+    passes = pass_periods(tickets)
+    rows = tickets.annotate(entry=Epoch("entry_time"), exit=Epoch("exit_time")).values_list(
+        "id", "entry", "exit", "parking_price_id", "amount", "vehicle_id", "parking_slot__section__parking_id"
+    )
+    columns = tuple(zip(*rows.iterator(chunk_size=10000))) or ((),) * 7
+    ids, entries, exits, price_ids, stored, vehicle_ids, parking_ids = columns
+    ids = np.array(ids, dtype=np.int64)
+    # Unset amounts, vehicles and parkings arrive as None, which NumPy reads as NaN
+    stored = np.array(stored, dtype=float)
+    amounts = np.zeros(len(ids))
+    if not len(ids):
+        return ids, amounts, stored
+
+    entries = np.floor(np.array(entries, dtype=float)).astype(np.int64)
+    exits = np.floor(np.array(exits, dtype=float)).astype(np.int64)
+    unique_prices, groups = np.unique(np.array(price_ids, dtype=object).astype(str), return_inverse=True)
+    prices = {str(price.id): price for price in ParkingPrice.objects.filter(id__in=set(price_ids))}
+    rules = {str(key): value for key, value in load_rules(prices.keys()).items()}
+    for index, price_id in enumerate(unique_prices):
+        members = groups == index
+        price = prices[price_id]
+        amounts[members] = price_intervals(
+            entries[members], exits[members], price.type, price.price, rules.get(price_id, ())
+        )
+
+    exit_days = (exits + local_offsets(exits)) // 86400
+    vehicle_ids = np.nan_to_num(np.array(vehicle_ids, dtype=float), nan=-1).astype(np.int64)
+    parking_ids = np.nan_to_num(np.array(parking_ids, dtype=float), nan=-1).astype(np.int64)
+    amounts[covered_by_passes(vehicle_ids, parking_ids, exit_days, passes)] = 0
+    return ids, amounts, stored
@@ -0,0 +1,180 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import RollupWatermark, Ticket, TicketArchive, UsageRollup
+
+ROLLUP_GRAINS = ("HOUR", "DAY")
+WATERMARK_NAME = "usage"
+
+
+def period_start(moment, grain):
+    """Start of the local hour or day containing ``moment``"""
+    local = timezone.localtime(moment)
+    if grain == "DAY":
+        return timezone.make_aware(datetime.combine(local.date(), time.min))
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def next_period(start, grain):
+    if grain == "DAY":
+        return timezone.make_aware(datetime.combine(timezone.localdate(start) + timedelta(days=1), time.min))
+    return start + timedelta(hours=1)
+
+
+def split_stay(entry, exit, grain):
+    """``(period_start, minutes)`` for every period a stay overlaps"""
+    start = period_start(entry, grain)
+    while start < exit:
+        end = next_period(start, grain)
+        minutes = (min(end, exit) - max(start, entry)).total_seconds() / 60
+        if minutes > 0:
+            yield start, minutes
+        start = end
+
+
+def closed_tickets(watermark, upto, batch_size, through=None):
+    """Next tickets closed after the watermark and up to ``upto``, oldest first.
+
+    With ``through``, another watermark, only tickets it has already passed are returned.
+    """
+    tickets = Ticket.objects.filter(exit_time__isnull=False, exit_time__lte=upto, parking_slot__isnull=False)
+    if watermark.exit_time is not None:
+        tickets = tickets.filter(
+            Q(exit_time__gt=watermark.exit_time) | Q(exit_time=watermark.exit_time, id__gt=watermark.ticket_id)
+        )
+    if through is not None:
+        tickets = tickets.filter(
+            Q(exit_time__lt=through.exit_time) | Q(exit_time=through.exit_time, id__lte=through.ticket_id)
+        )
+    return list(
+        tickets.annotate(
+            kind=Coalesce("vehicle__vehicle_type", "parking_price__vehicle_size", Value("FOUR-SMALL"))
+        )
+        .order_by("exit_time", "id")
+        .values_list(
+            "id",
+            "entry_time",
+            "exit_time",
+            "amount",
+            "parking_slot__section_id",
+            "parking_slot__section__parking_id",
+            "kind",
+        )[:batch_size]
+    )
+
+
+def aggregate(rows, after=None):
+    """Totals per (grain, period_start, section_id, vehicle_type) of a batch of tickets.
+
+    ``after`` maps grains to the first period to count, earlier periods are skipped.
+    """
+    totals = {}
+    for _, entry, exit, amount, section_id, parking_id, kind in rows:
+        for grain in ROLLUP_GRAINS:
+            first = (after or {}).get(grain)
+            exit_period = period_start(exit, grain)
+            if first is None or exit_period >= first:
+                closed = totals.setdefault((grain, exit_period, section_id, kind), [parking_id, 0, 0, 0])
+                closed[1] += 1
+                closed[3] += amount or 0
+            for start, minutes in split_stay(entry, exit, grain):
+                if first is None or start >= first:
+                    totals.setdefault((grain, start, section_id, kind), [parking_id, 0, 0, 0])[2] += minutes
+    return totals
+
+
+def add_totals(totals):
+    """Add a batch's totals onto the stored rollups with one read and one upsert"""
+    existing = UsageRollup.objects.filter(
+        grain__in={key[0] for key in totals},
+        period_start__in={key[1] for key in totals},
+        section_id__in={key[2] for key in totals},
+    ).values_list("grain", "period_start", "section_id", "vehicle_type", "tickets", "occupied_minutes", "revenue")
+    stored = {tuple(row[:4]): row[4:] for row in existing}
+    rollups = []
+    for key, (parking_id, tickets, minutes, revenue) in totals.items():
+        old_tickets, old_minutes, old_revenue = stored.get(key, (0, 0, 0))
+        rollups.append(
+            UsageRollup(
+                grain=key[0],
+                period_start=key[1],
+                section_id=key[2],
+                vehicle_type=key[3],
+                parking_id=parking_id,
+                tickets=old_tickets + tickets,
+                occupied_minutes=old_minutes + minutes,
+                revenue=round(old_revenue + revenue, 2),
+            )
+        )
+    UsageRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=["grain", "period_start", "section_id", "vehicle_type"],
+        update_fields=["parking_id", "tickets", "occupied_minutes", "revenue"],
+        batch_size=1000,
+    )
+
+
+def roll_up(batch_size=5000, upto=None):
+    """Count tickets closed since the watermark into the rollups.
+
+    Every batch is added and the watermark advanced in one transaction with
+    the watermark row locked, so concurrent runs cannot count a ticket
+    twice. Tickets closing in the last ``ROLLUP_LAG_SECONDS`` are left for
+    the next run, giving check-outs still in flight time to commit. Returns
+    the number of tickets counted.
+    """
+    if upto is None:
+        upto = timezone.now() - timedelta(seconds=getattr(settings, "ROLLUP_LAG_SECONDS", 60))
+    RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    counted = 0
+    while True:
+        with transaction.atomic():
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+            rows = closed_tickets(watermark, upto, batch_size)
+            if not rows:
+                return counted
+            add_totals(aggregate(rows))
+            watermark.ticket_id, watermark.exit_time = rows[-1][0], rows[-1][2]
+            watermark.save()
+        counted += len(rows)
+        if len(rows) < batch_size:
+            return counted
+
+
+def rebuild_rollups(batch_size=5000, upto=None):
+    """Recount the rollups of every period the Ticket table still fully covers.
+
+    Tickets moved to TicketArchive only count in periods up to the last
+    archived exit, and those rollups are kept as they are. Later periods
+    are deleted and recounted from the tickets the watermark has passed,
+    after a normal run has brought it up to date. The recount runs in one
+    transaction, so an interrupted rebuild leaves the rollups untouched.
+    Returns the number of tickets recounted.
+    """
+    roll_up(batch_size, upto)
+    recounted = 0
+    with transaction.atomic():
+        watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+        archived = TicketArchive.objects.aggregate(last=Max("exit_time"))["last"]
+        after = {
+            grain: None if archived is None else next_period(period_start(archived, grain), grain)
+            for grain in ROLLUP_GRAINS
+        }
+        for grain, first in after.items():
+            rollups = UsageRollup.objects.filter(grain=grain)
+            if first is not None:
+                rollups = rollups.filter(period_start__gte=first)
+            rollups.delete()
+        if watermark.exit_time is None:
+            return recounted
+
+        cursor = RollupWatermark(name=WATERMARK_NAME)
+        while rows := closed_tickets(cursor, watermark.exit_time, batch_size, through=watermark):
+            add_totals(aggregate(rows, after))
+            cursor.ticket_id, cursor.exit_time = rows[-1][0], rows[-1][2]
+            recounted += len(rows)
+    return recounted
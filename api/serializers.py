@@ -1,5 +1,9 @@
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from .models import (
+    PARKING_TYPE_CHOICES,
+    SIZE_CHOICES,
     CustomUser,
     Parking,
     Ticket,
@@ -8,10 +12,64 @@ from .models import (
     ParkingSlot,
     Vehicle,
     Passes,
+    TicketArchive,
+    PricingRule,
 )
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+def parse_expand(value):
+    """Turn ``"a,b.c"`` into the tree ``{"a": {}, "b": {"c": {}}}``"""
+    tree = {}
+    for path in (value or "").split(","):
+        node = tree
+        for name in path.strip().split("."):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer that only renders the fields listed in ``?fields=``
+    and nests the relations listed in ``?expand=``.
+
+    ``expandable_fields`` maps a foreign key to the name of the serializer
+    used to render it when expanded.
+    """
+
+    expandable_fields = {}
+
+    def __init__(self, *args, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if expand is None:
+            if request is None or request.method != "GET":
+                return
+            expand = parse_expand(request.query_params.get("expand"))
+            requested = request.query_params.get("fields")
+            if requested:
+                allowed = {name.strip() for name in requested.split(",")}
+                for name in set(self.fields) - allowed:
+                    self.fields.pop(name)
+        for name, nested in expand.items():
+            if name in self.expandable_fields and name in self.fields:
+                serializer_class = globals()[self.expandable_fields[name]]
+                self.fields[name] = serializer_class(read_only=True, expand=nested, context=self.context)
+
+    @classmethod
+    def select_related_paths(cls, expand, prefix=""):
+        """ORM paths to join so that rendering ``expand`` runs no extra queries"""
+        paths = []
+        for name, nested in expand.items():
+            if name not in cls.expandable_fields:
+                continue
+            serializer_class = globals()[cls.expandable_fields[name]]
+            path = prefix + name
+            paths.append(path)
+            paths += serializer_class.select_related_paths(nested, prefix=path + "__")
+        return paths
+
+
+class CustomUserSerializer(DynamicFieldsModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -26,7 +84,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
         return user
 
 
-class ParkingSerializer(serializers.ModelSerializer):
+class ParkingSerializer(DynamicFieldsModelSerializer):
 
     class Meta:
         model = Parking
@@ -34,15 +92,27 @@ class ParkingSerializer(serializers.ModelSerializer):
         read_only_fields = ["user",]
 
 
-class TicketSerializer(serializers.ModelSerializer):
+class TicketSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {
+        "vehicle": "VehicleSerializer",
+        "parking_slot": "ParkingSlotSerializer",
+        "parking_price": "ParkingPriceSerializer",
+    }
 
     class Meta:
         model = Ticket
         fields = "__all__"
-        read_only_fields = ["user"]
+        read_only_fields = ["user", "exit_time", "amount"]
         
 
-class VehicleSerializer(serializers.ModelSerializer):
+class TicketArchiveSerializer(DynamicFieldsModelSerializer):
+
+    class Meta:
+        model = TicketArchive
+        fields = "__all__"
+
+
+class VehicleSerializer(DynamicFieldsModelSerializer):
 
     class Meta:
         model = Vehicle
@@ -50,7 +120,8 @@ class VehicleSerializer(serializers.ModelSerializer):
         read_only_fields = ["user"]
 
 
-class ParkingPriceSerializer(serializers.ModelSerializer):
+class ParkingPriceSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {"parking_section": "ParkingSectionSerializer"}
 
     class Meta:
         model = ParkingPrice
@@ -62,14 +133,41 @@ class ParkingPriceSerializer(serializers.ModelSerializer):
         return data
 
 
-class ParkingSectionSerializer(serializers.ModelSerializer):
+class PricingRuleSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {"parking_price": "ParkingPriceSerializer"}
+
+    class Meta:
+        model = PricingRule
+        fields = "__all__"
+
+    def validate(self, data):
+        if not 0 <= data.get("start_hour", 0) <= 23:
+            raise serializers.ValidationError("Start hour must be between 0 and 23.")
+        if not 1 <= data.get("end_hour", 24) <= 24:
+            raise serializers.ValidationError("End hour must be between 1 and 24.")
+        if data.get("min_minutes", 0) < 0:
+            raise serializers.ValidationError("Minimum stay cannot be negative.")
+        if data.get("max_minutes") is not None and data["max_minutes"] <= data.get("min_minutes", 0):
+            raise serializers.ValidationError("Maximum stay must be longer than the minimum stay.")
+        if data.get("multiplier", 1) < 0:
+            raise serializers.ValidationError("Multiplier cannot be negative.")
+        if data.get("cap") is not None and data["cap"] < 0:
+            raise serializers.ValidationError("Cap cannot be negative.")
+        return data
+
+
+class ParkingSectionSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {"parking": "ParkingSerializer"}
 
     class Meta:
         model = ParkingSection
         fields = "__all__"
+        read_only_fields = ["free_slots", "occupied_slots", "reserved_slots"]
+
 
+class ParkingSlotSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {"section": "ParkingSectionSerializer"}
 
-class ParkingSlotSerializer(serializers.ModelSerializer):
     class Meta:
         model = ParkingSlot
         fields = "__all__"
@@ -80,15 +178,113 @@ class ParkingSlotSerializer(serializers.ModelSerializer):
         return data
 
 
-class PassesSerializer(serializers.ModelSerializer):
+def validate_pass_period(data):
+    if data["start_date"] >= data["end_date"]:
+        raise serializers.ValidationError("Start date must be before end date.")
+    if data["price"] < 0:
+        raise serializers.ValidationError("Price cannot be negative.")
+    return data
+
+
+class PassesSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {"vehicle": "VehicleSerializer", "parking": "ParkingSerializer"}
+
     class Meta:
         model = Passes
         fields = "__all__"
         read_only_fields = ["user",]
 
     def validate(self, data):
-        if data["start_date"] >= data["end_date"]:
-            raise serializers.ValidationError("Start date must be before end date.")
-        if data["price"] < 0:
-            raise serializers.ValidationError("Price cannot be negative.")
+        return validate_pass_period(data)
+
+
+class CheckInSerializer(serializers.Serializer):
+    parking = serializers.IntegerField()
+    section = serializers.UUIDField(required=False)
+    vehicle_number = serializers.CharField(max_length=50)
+    type = serializers.ChoiceField(choices=PARKING_TYPE_CHOICES, default="HOURLY")
+
+
+class DeviceTokenSerializer(serializers.Serializer):
+    device = serializers.CharField(max_length=100)
+    parkings = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    def validate_parkings(self, value):
+        user = self.context["request"].user
+        parkings = Parking.objects.filter(pk__in=value)
+        if not user.is_superuser:
+            parkings = parkings.filter(user=user)
+        if parkings.count() != len(set(value)):
+            raise serializers.ValidationError("You can only scope a device to your own parkings.")
+        return sorted(set(value))
+
+
+class DeviceTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that also rejects tokens of users deactivated since issue"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        if not CustomUser.objects.filter(pk=user_id, is_active=True).exists():
+            raise exceptions.AuthenticationFailed("User is inactive")
+        return super().validate(attrs)
+
+
+class VehicleImportSerializer(serializers.Serializer):
+    """One row of a vehicle import, checked without touching the database"""
+
+    vehicle_number = serializers.CharField(max_length=50)
+    vehicle_type = serializers.ChoiceField(choices=SIZE_CHOICES, default="FOUR-SMALL")
+    is_electric = serializers.BooleanField(default=False)
+    is_active = serializers.BooleanField(default=True)
+
+
+class PassImportSerializer(serializers.Serializer):
+    """One row of a pass import; the vehicle is given by its number"""
+
+    vehicle_number = serializers.CharField(max_length=50)
+    parking = serializers.IntegerField()
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    price = serializers.FloatField(default=0)
+
+    def validate(self, data):
+        return validate_pass_period(data)
+
+
+class BulkSlotSerializer(serializers.Serializer):
+    """Spec for a run of slot numbers such as A001-A500"""
+
+    MAX_SLOTS = 10000
+
+    prefix = serializers.CharField(max_length=20, allow_blank=True, default="")
+    start = serializers.IntegerField(min_value=0)
+    end = serializers.IntegerField(min_value=0)
+    padding = serializers.IntegerField(min_value=0, max_value=10, default=3)
+    type = serializers.ChoiceField(choices=SIZE_CHOICES, default="FOUR-SMALL")
+    is_charging_available = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data["start"] > data["end"]:
+            raise serializers.ValidationError("Start must not be after end.")
+        if data["end"] - data["start"] + 1 > self.MAX_SLOTS:
+            raise serializers.ValidationError(f"At most {self.MAX_SLOTS} slots can be created at once.")
         return data
+
+    def slot_numbers(self):
+        data = self.validated_data
+        return [
+            f"{data['prefix']}{number:0{data['padding']}d}"
+            for number in range(data["start"], data["end"] + 1)
+        ]
+
+
+class QuoteSerializer(serializers.Serializer):
+    section = serializers.UUIDField()
+    vehicle_number = serializers.CharField(max_length=50, required=False)
+    vehicle_size = serializers.ChoiceField(choices=SIZE_CHOICES, default="FOUR-SMALL")
+    has_charging = serializers.BooleanField(required=False, allow_null=True, default=None)
+    minutes = serializers.IntegerField(min_value=0, default=60)
+    start = serializers.DateTimeField(required=False)
+    type = serializers.ChoiceField(choices=PARKING_TYPE_CHOICES, required=False)
+
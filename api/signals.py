@@ -0,0 +1,93 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import token_cache
+from .allocation import slot_allocator
+from .occupancy import move_slot
+from .cache import bump_version
+from .changes import record_change
+from .models import CustomUser, Parking, ParkingPrice, ParkingSection, ParkingSlot, Passes, PricingRule, Ticket
+from .passes import invalidate_active_passes
+from .pricing import rate_tables
+
+
+@receiver(post_save, sender=ParkingSlot)
+def update_occupancy_counters(sender, instance, created, **kwargs):
+    current = (instance.section_id, instance.occupancy_state)
+    move_slot(None if created else getattr(instance, "_loaded_occupancy", None), current)
+    instance._loaded_occupancy = current
+
+
+@receiver(post_delete, sender=ParkingSlot)
+def release_occupancy_counters(sender, instance, **kwargs):
+    move_slot(getattr(instance, "_loaded_occupancy", (instance.section_id, instance.occupancy_state)), None)
+
+
+@receiver(post_save, sender=ParkingSlot)
+def sync_slot_allocator(sender, instance, **kwargs):
+    slot_allocator.sync(instance)
+
+
+@receiver(post_delete, sender=ParkingSlot)
+def remove_slot_from_allocator(sender, instance, **kwargs):
+    slot_allocator.remove(instance.id)
+
+
+@receiver(post_save, sender=ParkingPrice)
+@receiver(post_delete, sender=ParkingPrice)
+def invalidate_rate_table(sender, instance, **kwargs):
+    rate_tables.invalidate_prices(instance.parking_section_id)
+
+
+# Rules change rarely and finding their section would cost a query
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+def invalidate_rule_rates(sender, instance, **kwargs):
+    rate_tables.invalidate()
+
+
+@receiver(post_save, sender=ParkingSection)
+@receiver(post_delete, sender=ParkingSection)
+def invalidate_section_rates(sender, instance, **kwargs):
+    rate_tables.invalidate_section(instance.pk, instance.parking_id)
+
+
+@receiver(post_save, sender=Passes)
+@receiver(post_delete, sender=Passes)
+def invalidate_active_pass_cache(sender, instance, **kwargs):
+    invalidate_active_passes(instance.vehicle_id)
+
+
+@receiver(post_save, sender=Parking)
+@receiver(post_delete, sender=Parking)
+@receiver(post_save, sender=ParkingSection)
+@receiver(post_delete, sender=ParkingSection)
+@receiver(post_save, sender=ParkingPrice)
+@receiver(post_delete, sender=ParkingPrice)
+def bump_catalogue_version(sender, instance, **kwargs):
+    bump_version(sender._meta.label_lower, instance.pk)
+
+
+@receiver(post_save, sender=ParkingSlot)
+@receiver(post_save, sender=Ticket)
+def record_saved_change(sender, instance, **kwargs):
+    record_change(instance)
+
+
+# Ticket deletes are logged by the view: a post_delete receiver would stop
+# Django from fast-deleting tickets in the purge and archive commands
+@receiver(post_delete, sender=ParkingSlot)
+def record_deleted_slot(sender, instance, **kwargs):
+    record_change(instance, "DELETE")
+
+
+# Password changes, deactivation and logout must not be outlived by cached tokens
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.user_id)
+
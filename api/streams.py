@@ -0,0 +1,148 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from .broker import broker
+from .changes import changes_since, feed_position
+from .occupancy import parking_occupancy
+
+
+def format_event(event, data, event_id=None):
+    """One Server-Sent Events message"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, cls=DjangoJSONEncoder)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def format_change(change):
+    return format_event(change["model"], change, change["seq"])
+
+
+def read_feed(cursor, parking_id, limit=None):
+    """Changes after ``cursor`` the feed serves, the new cursor, and False when ``limit`` cut them short"""
+    changes, has_more = [], True
+    batch_size = 500 if limit is None else min(500, limit + 1)
+    while has_more:
+        batch, cursor, has_more = changes_since(cursor, parking_id=parking_id, limit=batch_size)
+        changes += batch
+        if limit is not None and len(changes) > limit:
+            return changes, cursor, False
+    return changes, cursor, True
+
+
+def run_query(function, *args):
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+async def database(function, *args):
+    """Run ``function`` in the thread pool rather than the thread the sync views share"""
+    return await sync_to_async(run_query, thread_sensitive=False)(function, *args)
+
+
+class StreamState:
+    """Which changes a stream has passed on.
+
+    ``cursor`` is the change feed position it has caught up to, ``sent`` the
+    newest seq per object delivered live beyond it. A change is only passed
+    on when it is newer than both, so feed and broker deliveries of the
+    same change are not repeated and an older state never follows a newer
+    one.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.sent = {}
+
+    def unseen(self, changes):
+        fresh = []
+        for change in changes:
+            key = (change["model"], change["object_id"])
+            if change["seq"] > self.cursor and change["seq"] > self.sent.get(key, 0):
+                self.sent[key] = change["seq"]
+                fresh.append(change)
+        return fresh
+
+    def advance(self, cursor):
+        self.cursor = max(self.cursor, cursor)
+        self.sent = {key: seq for key, seq in self.sent.items() if seq > self.cursor}
+
+
+async def poll_feed(broker, subscription):
+    """Bring the changes other workers wrote to this worker's listeners of one parking.
+
+    The broker runs one per parking with listeners. Every
+    ``STREAM_POLL_SECONDS`` it reads the change feed and publishes the
+    changes this worker has not published itself. After every burst that
+    touched slots it publishes one occupancy snapshot for all listeners.
+    """
+    parking_id = subscription.channel
+    poll = getattr(settings, "STREAM_POLL_SECONDS", 5)
+    loop = asyncio.get_running_loop()
+    state = StreamState(await database(feed_position, parking_id))
+    next_poll = loop.time() + poll
+    while True:
+        try:
+            events = [await subscription.get(timeout=max(next_poll - loop.time(), 0)), *subscription.drain()]
+        except asyncio.TimeoutError:
+            events = []
+        changes = state.unseen([event for event in events if "seq" in event])
+        if loop.time() >= next_poll:
+            polled, cursor, _ = await database(read_feed, state.cursor, parking_id)
+            polled = state.unseen(polled)
+            state.advance(cursor)
+            for change in polled:
+                broker.publish(parking_id, change)
+            changes += polled
+            next_poll = loop.time() + poll
+        if any(change["model"] == "parking_slot" for change in changes):
+            broker.publish(parking_id, {"occupancy": await database(parking_occupancy, parking_id)})
+
+
+async def parking_events(parking_id, since=None):
+    """Server-Sent Events for one parking: slot and ticket changes plus occupancy.
+
+    The listener subscribes before anything is read, then replays the change
+    feed after ``since`` (the browser's Last-Event-ID) so reconnecting loses
+    nothing. A listener further behind than ``STREAM_REPLAY_LIMIT`` changes
+    gets a ``reset`` event instead and should reload. After that everything
+    comes from the broker, including the changes of other workers and the
+    occupancy snapshots ``poll_feed`` publishes. A comment is sent when
+    nothing was sent for ``STREAM_HEARTBEAT_SECONDS`` to keep proxies from
+    closing the stream.
+    """
+    heartbeat = getattr(settings, "STREAM_HEARTBEAT_SECONDS", 15)
+    subscription = broker.subscribe(parking_id)
+    try:
+        state = StreamState(0)
+        if since is not None:
+            limit = getattr(settings, "STREAM_REPLAY_LIMIT", 5000)
+            changes, cursor, complete = await database(read_feed, since, parking_id, limit)
+            if complete:
+                state = StreamState(since)
+                for change in state.unseen(changes):
+                    yield format_change(change)
+                state.advance(cursor)
+            else:
+                yield format_event("reset", {"parking": parking_id})
+        yield format_event("occupancy", await database(parking_occupancy, parking_id))
+
+        while True:
+            try:
+                events = [await subscription.get(timeout=heartbeat), *subscription.drain()]
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            for change in state.unseen([event for event in events if "seq" in event]):
+                yield format_change(change)
+            snapshots = [event["occupancy"] for event in events if "occupancy" in event]
+            if snapshots:
+                yield format_event("occupancy", snapshots[-1])
+    finally:
+        subscription.close()
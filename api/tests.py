@@ -1,18 +1,43 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
 
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 
-from . models import Area
-from . serializers import AreaSerializer
+from . models import Parking, ParkingPrice, Passes, PricingRule, ParkingSection, ParkingSlot, Ticket, TicketArchive, UsageRollup, Vehicle
+from . allocation import slot_allocator
+from . analytics import dwell_stats, load_intervals, peak_occupancy
+from . forecast import get_model, hourly_occupancy, model_key, parking_forecast, refit_lock_key
+from . authentication import token_cache
+from . broker import Broker
+from . cache import get_version
+from . pricing import rate_tables
+from . pricing_rules import covered_by_passes, price_intervals
+from . streams import StreamState, parking_events
 
 
 CREATE_USER_URL = reverse('api:signup')
 TOKEN_URL = reverse('api:signin')
 ME_URL = reverse('api:me')
-AREA_URL = reverse('api:area-create-list')
+CHECK_IN_URL = reverse('api:check-in')
 
 
 def create_user(**params):
@@ -81,4 +106,1391 @@ class PublicUserApiTests(TestCase):
 
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-        
\ No newline at end of file
+
+
+class SlotAllocationApiTests(TestCase):
+    """Test allocating slots from the in-memory free lists"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        self.section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        self.vehicle = Vehicle.objects.create(user=self.user, vehicle_number='KA01', vehicle_type='FOUR-SMALL')
+        slot_allocator.invalidate()
+
+    def allocate(self):
+        return self.client.post(
+            reverse('api:parking-slot-allocate', args=[self.parking.id]),
+            {'vehicle': self.vehicle.id},
+        )
+
+    def test_allocates_best_fitting_slot(self):
+        """Test the smallest fitting slot without charging is preferred"""
+        ParkingSlot.objects.create(section=self.section, slot_number='L1', type='FOUR-LARGE')
+        ParkingSlot.objects.create(section=self.section, slot_number='C1', type='FOUR-SMALL', is_charging_available=True)
+        ParkingSlot.objects.create(section=self.section, slot_number='S1', type='FOUR-SMALL')
+
+        res = self.allocate()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['data']['slot_number'], 'S1')
+        self.assertTrue(ParkingSlot.objects.get(slot_number='S1').is_booked)
+
+    def test_released_slot_is_allocated_again(self):
+        """Test a slot returns to the free list once it is released"""
+        slot = ParkingSlot.objects.create(section=self.section, slot_number='S1', type='FOUR-SMALL')
+        self.assertEqual(self.allocate().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.allocate().status_code, status.HTTP_404_NOT_FOUND)
+
+        slot.refresh_from_db()
+        slot.is_booked = False
+        slot.save()
+
+        res = self.allocate()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['data']['slot_number'], 'S1')
+
+    def test_stale_slot_is_skipped(self):
+        """Test a slot booked behind the allocator's back is not handed out"""
+        ParkingSlot.objects.create(section=self.section, slot_number='S1', type='FOUR-SMALL')
+        ParkingSlot.objects.create(section=self.section, slot_number='S2', type='FOUR-SMALL')
+        self.assertEqual(self.allocate().status_code, status.HTTP_200_OK)
+        ParkingSlot.objects.filter(is_booked=False).update(is_booked=True)
+
+        self.assertEqual(self.allocate().status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_failed_booking_is_rolled_back_and_slot_kept(self):
+        """Test a failure after the UPDATE leaves neither a booked slot nor moved counters behind"""
+        ParkingSlot.objects.create(section=self.section, slot_number='S1', type='FOUR-SMALL')
+
+        with patch('api.allocation.record_slot_changes', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                slot_allocator.allocate(self.vehicle, parking_id=self.parking.id)
+
+        self.assertFalse(ParkingSlot.objects.get().is_booked)
+        self.section.refresh_from_db()
+        self.assertEqual((self.section.free_slots, self.section.occupied_slots), (1, 0))
+        self.assertEqual(slot_allocator.allocate(self.vehicle, parking_id=self.parking.id)['slot_number'], 'S1')
+
+
+class CheckInApiTests(TestCase):
+    """Test checking vehicles in at the gate"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        self.section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        self.slot = ParkingSlot.objects.create(section=self.section, slot_number='S1', type='FOUR-SMALL')
+        self.price = ParkingPrice.objects.create(parking_section=self.section, price=20, vehicle_size='FOUR-SMALL')
+        Vehicle.objects.create(user=self.user, vehicle_number='KA01', vehicle_type='FOUR-SMALL')
+        Vehicle.objects.create(user=self.user, vehicle_number='KA02', vehicle_type='FOUR-SMALL')
+
+    def test_check_in_books_slot_and_issues_ticket(self):
+        """Test check-in books the slot and prices the ticket"""
+        res = self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.slot.refresh_from_db()
+        self.assertTrue(self.slot.is_booked)
+        ticket = Ticket.objects.get(vehicle__vehicle_number='KA01')
+        self.assertEqual(ticket.parking_slot, self.slot)
+        self.assertEqual(ticket.parking_price, self.price)
+
+    def test_check_in_does_not_double_book(self):
+        """Test a booked slot is not handed to the next vehicle"""
+        self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+        res = self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA02'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_vehicle_with_open_ticket_cannot_check_in_again(self):
+        """Test a vehicle already parked is refused before another slot is booked"""
+        ParkingSlot.objects.create(section=self.section, slot_number='S2', type='FOUR-SMALL')
+        self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+        res = self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.assertFalse(ParkingSlot.objects.get(slot_number='S2').is_booked)
+
+    def test_slot_without_price_is_refused(self):
+        """Test no ticket is issued, and no slot booked, when nothing prices the stay"""
+        self.price.delete()
+
+        res = self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Ticket.objects.exists())
+        self.slot.refresh_from_db()
+        self.assertFalse(self.slot.is_booked)
+
+    def test_check_in_confirms_cached_price(self):
+        """Test a price changed by another worker is not taken from the stale rate table"""
+        replacement = ParkingPrice.objects.create(parking_section=self.section, price=30, vehicle_size='TWO')
+        rate_tables.invalidate()
+        self.assertEqual(rate_tables.rate(self.section.id, 'FOUR-SMALL', False, 'HOURLY')[0], self.price.pk)
+        # Changes made elsewhere reach this worker's tables without signals
+        ParkingPrice.objects.filter(pk=self.price.pk).update(vehicle_size='TWO')
+        ParkingPrice.objects.filter(pk=replacement.pk).update(vehicle_size='FOUR-SMALL')
+
+        self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+
+        self.assertEqual(Ticket.objects.get().parking_price, replacement)
+
+
+class CheckOutApiTests(TestCase):
+    """Test checking vehicles out and charging the ticket"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        self.slot = ParkingSlot.objects.create(section=section, slot_number='S1', is_booked=True)
+        price = ParkingPrice.objects.create(parking_section=section, price=20, type='HOURLY')
+        self.vehicle = Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+        self.ticket = Ticket.objects.create(
+            user=self.user, parking_slot=self.slot, vehicle=self.vehicle, parking_price=price
+        )
+        Ticket.objects.filter(pk=self.ticket.pk).update(entry_time=timezone.now() - timedelta(minutes=150))
+
+    def check_out(self):
+        return self.client.post(reverse('api:ticket-check-out', args=[self.ticket.id]))
+
+    def test_check_out_charges_started_hours(self):
+        """Test the fee is charged per started hour and the slot is freed"""
+        res = self.check_out()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.amount, 60)
+        self.assertIsNotNone(self.ticket.exit_time)
+        self.slot.refresh_from_db()
+        self.assertFalse(self.slot.is_booked)
+
+    def test_check_out_with_active_pass_is_free(self):
+        """Test a vehicle holding a valid pass is not charged"""
+        today = timezone.localdate()
+        Passes.objects.create(
+            user=self.user, parking=self.parking, vehicle=self.vehicle,
+            start_date=today - timedelta(days=1), end_date=today + timedelta(days=1),
+        )
+        self.check_out()
+
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.amount, 0)
+
+    def test_check_out_only_once(self):
+        """Test the exit time cannot be overwritten by a second check-out"""
+        self.check_out()
+        exit_time = Ticket.objects.get(pk=self.ticket.pk).exit_time
+
+        res = self.check_out()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).exit_time, exit_time)
+
+
+class OccupancyApiTests(TestCase):
+    """Test the live occupancy counters"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        self.section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        for number in ('S1', 'S2', 'S3'):
+            ParkingSlot.objects.create(section=self.section, slot_number=number)
+        ParkingSlot.objects.create(section=self.section, slot_number='R1', is_reserved=True)
+        ParkingPrice.objects.create(parking_section=self.section, price=20)
+        Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+
+    def occupancy(self):
+        return self.client.get(reverse('api:parking-occupancy', args=[self.parking.id])).data
+
+    def test_counters_follow_check_in_and_check_out(self):
+        """Test counters move as vehicles come and go"""
+        self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+        data = self.occupancy()
+        self.assertEqual((data['free_slots'], data['occupied_slots'], data['reserved_slots']), (2, 1, 1))
+
+        ticket = Ticket.objects.get()
+        self.client.post(reverse('api:ticket-check-out', args=[ticket.id]))
+        data = self.occupancy()
+        self.assertEqual((data['free_slots'], data['occupied_slots']), (3, 0))
+
+    def test_unknown_parking_is_not_found(self):
+        """Test occupancy of a parking that does not exist is a 404, not empty counters"""
+        res = self.client.get(reverse('api:parking-occupancy', args=[self.parking.id + 100]))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        empty = Parking.objects.create(user=self.user, name='Empty', capacity=0)
+        res = self.client.get(reverse('api:parking-occupancy', args=[empty.id]))
+        self.assertEqual((res.status_code, res.data['sections']), (status.HTTP_200_OK, []))
+
+    def test_counter_change_keeps_cached_section_lists(self):
+        """Test a check-in only retires the section's own cached responses"""
+        label = ParkingSection._meta.label_lower
+        list_version, section_version = get_version(label), get_version(label, self.section.pk)
+
+        self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+
+        self.assertEqual(get_version(label), list_version)
+        self.assertNotEqual(get_version(label, self.section.pk), section_version)
+
+    def test_rebuild_command_recounts_slots(self):
+        """Test the reconciliation command repairs drifted counters"""
+        ParkingSlot.objects.filter(slot_number='S1').update(is_booked=True)
+        ParkingSection.objects.update(free_slots=0, occupied_slots=0, reserved_slots=0)
+
+        call_command('rebuild-occupancy', stdout=StringIO())
+
+        data = self.occupancy()
+        self.assertEqual((data['free_slots'], data['occupied_slots'], data['reserved_slots']), (2, 1, 1))
+
+
+class ListPaginationApiTests(TestCase):
+    """Test cursor pagination and field selection on list endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        for number in range(5):
+            ParkingSlot.objects.create(section=section, slot_number=f'S{number}')
+
+    def test_cursor_pages_cover_every_row_once(self):
+        """Test following next links returns each slot exactly once"""
+        url = reverse('api:parking-slot-create-list') + '?page_size=2'
+        seen = []
+        while url:
+            res = self.client.get(url)
+            self.assertLessEqual(len(res.data['results']), 2)
+            seen += [slot['id'] for slot in res.data['results']]
+            url = res.data['next']
+
+        self.assertEqual(sorted(seen), sorted(str(pk) for pk in ParkingSlot.objects.values_list('id', flat=True)))
+
+    def test_fields_limits_serialized_columns(self):
+        """Test only the requested fields are returned"""
+        res = self.client.get(reverse('api:parking-slot-create-list'), {'fields': 'id,slot_number'})
+
+        self.assertEqual(set(res.data['results'][0]), {'id', 'slot_number'})
+
+
+class ExpandApiTests(TestCase):
+    """Test nested representations requested with ?expand="""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        for number in range(12):
+            slot = ParkingSlot.objects.create(section=section, slot_number=f'S{number}', is_booked=True)
+            vehicle = Vehicle.objects.create(user=self.user, vehicle_number=f'KA{number}')
+            Ticket.objects.create(user=self.user, parking_slot=slot, vehicle=vehicle)
+
+    def list_tickets(self, page_size):
+        return self.client.get(
+            reverse('api:ticket-create-list'),
+            {'expand': 'vehicle,parking_slot.section', 'page_size': page_size},
+        )
+
+    def test_expand_nests_related_objects(self):
+        """Test expanded relations are rendered as nested objects"""
+        ticket = self.list_tickets(1).data['results'][0]
+
+        self.assertEqual(ticket['vehicle']['vehicle_number'], 'KA0')
+        self.assertEqual(ticket['parking_slot']['section']['name'], 'A')
+        self.assertIsNone(ticket['parking_price'])
+
+    def test_expand_query_count_does_not_grow_with_page_size(self):
+        """Test expanded lists are fetched with a constant number of queries"""
+        with self.assertNumQueries(1):
+            self.list_tickets(2)
+        with self.assertNumQueries(1):
+            self.list_tickets(12)
+
+
+class BulkSlotApiTests(TestCase):
+    """Test provisioning a run of slots in one request"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=600)
+        self.section = ParkingSection.objects.create(parking=parking, name='A', capacity=500)
+        self.url = reverse('api:parking-section-slots-bulk-create', args=[self.section.id])
+
+    def test_bulk_create_slots(self):
+        """Test A001-A500 are created and counted as free"""
+        res = self.client.post(self.url, {'prefix': 'A', 'start': 1, 'end': 500, 'is_charging_available': True})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        slots = ParkingSlot.objects.filter(section=self.section)
+        self.assertEqual(slots.count(), 500)
+        self.assertTrue(slots.filter(slot_number='A001', is_charging_available=True).exists())
+        self.section.refresh_from_db()
+        self.assertEqual(self.section.free_slots, 500)
+
+    def test_bulk_create_rejects_batch_over_capacity_or_duplicated(self):
+        """Test the whole batch is refused when any slot does not fit"""
+        ParkingSlot.objects.create(section=self.section, slot_number='A002')
+
+        res = self.client.post(self.url, {'prefix': 'A', 'start': 1, 'end': 500})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['errors']), 2)
+        self.assertEqual(ParkingSlot.objects.count(), 1)
+
+
+class ClearTicketsCommandTests(TestCase):
+    """Test the chunked clear-tickets command"""
+
+    def setUp(self):
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        for _ in range(5):
+            Ticket.objects.create(user=self.user)
+        Ticket.objects.filter(pk__in=Ticket.objects.values('pk')[:3]).update(
+            entry_time=timezone.now() - timedelta(days=30)
+        )
+
+    def test_dry_run_only_counts(self):
+        out = StringIO()
+        call_command('clear-tickets', '--dry-run', stdout=out)
+
+        self.assertIn('5 Ticket rows would be deleted', out.getvalue())
+        self.assertEqual(Ticket.objects.count(), 5)
+
+    def test_before_deletes_old_tickets_in_batches(self):
+        before = (timezone.now() - timedelta(days=1)).date().isoformat()
+        out = StringIO()
+        call_command('clear-tickets', '--before', before, '--batch-size', '2', stdout=out)
+
+        self.assertEqual(Ticket.objects.count(), 2)
+        self.assertIn('Deleted 2/3', out.getvalue())
+
+
+class TicketArchiveTests(TestCase):
+    """Test moving old closed tickets to the archive"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        slot = ParkingSlot.objects.create(section=section, slot_number='S1')
+        self.parking = parking
+        long_ago = timezone.now() - timedelta(days=200)
+        self.old = Ticket.objects.create(user=self.user, parking_slot=slot, exit_time=long_ago, amount=40)
+        Ticket.objects.filter(pk=self.old.pk).update(entry_time=long_ago - timedelta(hours=2))
+        self.recent = Ticket.objects.create(user=self.user, parking_slot=slot, exit_time=timezone.now())
+        self.open = Ticket.objects.create(user=self.user, parking_slot=slot)
+
+    def test_archive_moves_only_old_closed_tickets(self):
+        call_command('archive-tickets', '--days', '90', stdout=StringIO())
+
+        self.assertEqual(set(Ticket.objects.values_list('pk', flat=True)), {self.recent.pk, self.open.pk})
+        archived = TicketArchive.objects.get()
+        self.assertEqual((archived.id, archived.parking_id, archived.amount), (self.old.pk, self.parking.pk, 40))
+
+    def test_archive_can_be_queried_by_date_range(self):
+        call_command('archive-tickets', '--days', '90', stdout=StringIO())
+        url = reverse('api:ticket-archive-list')
+        start = (timezone.now() - timedelta(days=201)).date().isoformat()
+
+        self.assertEqual(len(self.client.get(url, {'from': start, 'parking': self.parking.pk}).data['results']), 1)
+        self.assertEqual(len(self.client.get(url, {'to': start}).data['results']), 0)
+        self.assertEqual(self.client.get(url, {'from': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'parking': 'abc'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QuoteApiTests(TestCase):
+    """Test quoting from the compiled rate tables"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        self.section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        self.hourly = ParkingPrice.objects.create(parking_section=self.section, type='HOURLY', price=20)
+        ParkingPrice.objects.create(parking_section=self.section, type='DAILY', price=100)
+        rate_tables.invalidate()
+
+    def get_quote(self, minutes):
+        return self.client.get(reverse('api:quote'), {'section': self.section.id, 'minutes': minutes})
+
+    def test_quote_picks_cheapest_billing_type(self):
+        self.assertEqual(self.get_quote(90).data['data']['amount'], 40)
+        self.assertEqual(self.get_quote(600).data['data']['type'], 'DAILY')
+
+    def test_warm_quote_does_not_query_and_price_changes_invalidate(self):
+        self.get_quote(90)
+        with self.assertNumQueries(0):
+            self.get_quote(90)
+
+        self.hourly.price = 10
+        self.hourly.save()
+
+        self.assertEqual(self.get_quote(90).data['data']['amount'], 20)
+
+    def test_quote_applies_pricing_rules(self):
+        """Test quotes go through the same rules as check-out"""
+        PricingRule.objects.create(parking_price=self.hourly, min_minutes=60, cap=25)
+
+        self.assertEqual(self.get_quote(150).data['data']['amount'], 25)
+        self.assertEqual(self.get_quote(30).data['data']['amount'], 20)
+
+
+class PricingRuleEngineTests(SimpleTestCase):
+    """Test evaluating pricing rules on arrays of stays"""
+
+    def price(self, start, end, rules):
+        entry = datetime(2024, 1, 1, start, tzinfo=dt_timezone.utc).timestamp()
+        exit = datetime(2024, 1, 1, end, tzinfo=dt_timezone.utc).timestamp()
+        return price_intervals([int(entry)], [int(exit)], 'HOURLY', 10, rules)[0]
+
+    def test_night_window_multiplies_minutes_inside_it(self):
+        """Test only the hour after 22:00 on a Monday is charged double"""
+        night = PricingRule(start_hour=22, end_hour=6, multiplier=2)
+        self.assertEqual(self.price(20, 23, [night]), 40)
+
+    def test_weekend_rule_does_not_apply_on_weekdays(self):
+        weekend = PricingRule(days='WEEKEND', multiplier=3)
+        self.assertEqual(self.price(20, 23, [weekend]), 30)
+
+    @override_settings(TIME_ZONE='Europe/Berlin')
+    def test_windows_follow_daylight_saving_time(self):
+        """Test a window keeps its local hours in winter and in summer"""
+        night = PricingRule(start_hour=22, end_hour=6, multiplier=2)
+        for month in (1, 7):
+            entry = int(datetime(2024, month, 1, 20, tzinfo=ZoneInfo('Europe/Berlin')).timestamp())
+            self.assertEqual(price_intervals([entry], [entry + 3 * 3600], 'HOURLY', 10, [night])[0], 40)
+
+    def test_pass_coverage_pairs_every_pass_of_a_vehicle(self):
+        """Test a stay is covered by any of several passes of its vehicle and parking only"""
+        passes = (np.array([7, 7, 8]), np.array([1, 1, 1]), np.array([10, 20, 0]), np.array([12, 25, 99]))
+        covered = covered_by_passes(np.array([7, 7, 7, 9]), np.array([1, 1, 2, 1]), np.array([21, 15, 21, 21]), passes)
+        self.assertEqual(covered.tolist(), [True, False, False, False])
+
+    def test_duration_tier_and_cap(self):
+        """Test a cap only applies to stays in its duration tier"""
+        cap = PricingRule(min_minutes=120, cap=25)
+        self.assertEqual(self.price(20, 23, [cap]), 25)
+        self.assertEqual(self.price(20, 21, [cap]), 10)
+
+
+class RepriceTicketsCommandTests(TestCase):
+    """Test re-pricing stored tickets in one pass"""
+
+    def test_reprice_applies_current_rules(self):
+        user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        parking = Parking.objects.create(user=user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        price = ParkingPrice.objects.create(parking_section=section, type='HOURLY', price=10)
+        PricingRule.objects.create(parking_price=price, cap=15)
+        exit_time = timezone.now()
+        for hours in (1, 3):
+            ticket = Ticket.objects.create(user=user, parking_price=price, exit_time=exit_time, amount=hours * 10)
+            Ticket.objects.filter(pk=ticket.pk).update(entry_time=exit_time - timedelta(hours=hours))
+
+        out = StringIO()
+        call_command('reprice-tickets', '--apply', stdout=out)
+
+        self.assertIn('1 amounts differ', out.getvalue())
+        self.assertEqual(sorted(Ticket.objects.values_list('amount', flat=True)), [10, 15])
+
+    def test_reprice_keeps_pass_holders_free(self):
+        """Test tickets of vehicles with a pass stay at 0 like at check-out"""
+        user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        parking = Parking.objects.create(user=user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        slot = ParkingSlot.objects.create(section=section, slot_number='S1')
+        price = ParkingPrice.objects.create(parking_section=section, type='HOURLY', price=10)
+        holder = Vehicle.objects.create(user=user, vehicle_number='KA01')
+        other = Vehicle.objects.create(user=user, vehicle_number='KA02')
+        today = timezone.localdate()
+        Passes.objects.create(
+            user=user, parking=parking, vehicle=holder,
+            start_date=today - timedelta(days=1), end_date=today + timedelta(days=1),
+        )
+        exit_time = timezone.now()
+        for vehicle in (holder, other):
+            ticket = Ticket.objects.create(
+                user=user, vehicle=vehicle, parking_slot=slot, parking_price=price, exit_time=exit_time, amount=0
+            )
+            Ticket.objects.filter(pk=ticket.pk).update(entry_time=exit_time - timedelta(hours=2))
+
+        call_command('reprice-tickets', '--apply', stdout=StringIO())
+
+        self.assertEqual(Ticket.objects.get(vehicle=holder).amount, 0)
+        self.assertEqual(Ticket.objects.get(vehicle=other).amount, 20)
+
+
+class ActivePassApiTests(TestCase):
+    """Test the cached active pass lookup used at the gate"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        vehicle = Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+        today = timezone.localdate()
+        self.pass_ = Passes.objects.create(
+            user=self.user, parking=self.parking, vehicle=vehicle,
+            start_date=today - timedelta(days=1), end_date=today + timedelta(days=1),
+        )
+
+    def lookup(self):
+        return self.client.get(
+            reverse('api:passes-active'), {'vehicle_number': 'KA01', 'parking': self.parking.id}
+        ).data
+
+    def test_lookup_is_cached_until_passes_change(self):
+        self.assertTrue(self.lookup()['active'])
+        with self.assertNumQueries(0):
+            self.assertTrue(self.lookup()['active'])
+
+        self.pass_.delete()
+
+        self.assertFalse(self.lookup()['active'])
+
+
+class CatalogueCacheTests(TestCase):
+    """Test cached catalogue responses and conditional requests"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        self.url = reverse('api:parking-crud', args=[self.parking.id])
+
+    def test_repeat_reads_skip_the_database(self):
+        self.client.get(reverse('api:parking-create-list'))
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse('api:parking-create-list'))
+        self.assertEqual(res.data['results'][0]['name'], 'Central')
+
+    def test_etag_answers_not_modified_until_object_changes(self):
+        etag = self.client.get(self.url)['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.parking.name = 'North'
+        self.parking.save()
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['name'], 'North')
+
+    def test_truncate_retires_cached_responses(self):
+        list_url = reverse('api:parking-create-list')
+        self.client.get(list_url)
+        self.client.get(self.url)
+
+        def truncate(command):
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {Parking._meta.db_table}')
+
+        with patch('api.management.commands._purge.PurgeCommand.truncate', truncate):
+            call_command('clear-parkings', '--truncate', stdout=StringIO())
+
+        self.assertEqual(self.client.get(list_url).data['results'], [])
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalSlotListTests(TestCase):
+    """Test ETag and Last-Modified on the polled slot list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='gate@amitpr.com', username='gate', password='testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        self.slot = ParkingSlot.objects.create(section=section, slot_number='S1')
+        self.url = reverse('api:parking-slot-create-list')
+
+    def test_unchanged_list_is_not_modified(self):
+        res = self.client.get(self.url)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(self.url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_slot_change_and_delete_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.slot.is_booked = True
+        self.slot.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        etag = self.client.get(self.url)['ETag']
+        self.slot.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+
+
+@override_settings(CHANGE_FEED_LAG_SECONDS=0)
+class ChangeFeedApiTests(TestCase):
+    """Test the slot and ticket change feed"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='sync@amitpr.com', username='sync', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        self.slot = ParkingSlot.objects.create(section=section, slot_number='S1', type='FOUR-SMALL')
+        ParkingPrice.objects.create(parking_section=section, price=20, vehicle_size='FOUR-SMALL')
+        Vehicle.objects.create(user=self.user, vehicle_number='KA01', vehicle_type='FOUR-SMALL')
+
+    def changes(self, since=0):
+        res = self.client.get(reverse('api:changes'), {'since': since, 'parking': self.parking.id})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_feed_returns_latest_state_once(self):
+        """Test check-in shows up as one booked slot entry and one ticket entry"""
+        self.client.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+        data = self.changes()
+
+        slots = [change for change in data['changes'] if change['model'] == 'parking_slot']
+        tickets = [change for change in data['changes'] if change['model'] == 'ticket']
+        self.assertEqual(len(slots), 1)
+        self.assertTrue(slots[0]['data']['is_booked'])
+        self.assertEqual(len(tickets), 1)
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.changes(data['last_seq'])['changes'], [])
+
+    def test_feed_reports_deletes(self):
+        """Test deleting a slot is sent as a DELETE after the cursor"""
+        last_seq = self.changes()['last_seq']
+        self.slot.delete()
+
+        changes = self.changes(last_seq)['changes']
+        self.assertEqual([change['action'] for change in changes], ['DELETE'])
+
+    def test_limit_is_clamped(self):
+        """Test a zero or negative limit still moves the cursor forward"""
+        res = self.client.get(reverse('api:changes'), {'limit': 0})
+        self.assertEqual(len(res.data['changes']), 1)
+        self.assertGreater(res.data['last_seq'], 0)
+
+        res = self.client.get(reverse('api:changes'), {'limit': 'all'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recent_changes_are_held_back(self):
+        """Test changes younger than the lag are not served yet"""
+        with self.settings(CHANGE_FEED_LAG_SECONDS=60):
+            data = self.changes()
+        self.assertEqual((data['changes'], data['last_seq'], data['has_more']), ([], 0, False))
+
+
+class BrokerTests(SimpleTestCase):
+    """Test the in-process event broker"""
+
+    def test_publish_from_thread_reaches_every_listener(self):
+        """Test one publish from a worker thread fans out to all listeners of the channel"""
+        broker = Broker()
+
+        async def listen():
+            first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+            publisher = threading.Thread(target=broker.publish, args=(1, {'seq': 1}))
+            publisher.start()
+            received = [await first.get(timeout=1), await second.get(timeout=1)]
+            publisher.join()
+            for subscription in (first, second, other):
+                subscription.close()
+            return received, other.drain()
+
+        received, other = asyncio.run(listen())
+        self.assertEqual(received, [{'seq': 1}, {'seq': 1}])
+        self.assertEqual(other, [])
+        self.assertEqual(broker.listeners(1), 0)
+
+    def test_one_poller_per_channel(self):
+        """Test a channel's poller starts with its first listener and stops with its last"""
+        broker = Broker(poller='api.tests.idle_poller')
+
+        async def listen():
+            first, second = broker.subscribe(1), broker.subscribe(1)
+            (task, _), = broker._pollers.values()
+            counted = broker.listeners(1)
+            first.close()
+            second.close()
+            await asyncio.gather(task, return_exceptions=True)
+            return counted, task.cancelled(), broker._pollers
+
+        counted, cancelled, pollers = asyncio.run(listen())
+        self.assertEqual(counted, 2)
+        self.assertTrue(cancelled)
+        self.assertEqual(pollers, {})
+
+
+async def idle_poller(broker, subscription):
+    await asyncio.Event().wait()
+
+
+class ParkingStreamTests(TransactionTestCase):
+    """Test the live parking event stream"""
+
+    def setUp(self):
+        self.user = create_user(email='signage@amitpr.com', username='signage', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        self.url = reverse('api:parking-stream', args=[self.parking.id])
+
+    def test_stream_requires_token(self):
+        """Test anonymous listeners are rejected"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_stream_starts_with_occupancy(self):
+        """Test a new listener first receives the current occupancy"""
+        res = await self.async_client.get(self.url, {'token': self.token.key})
+
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        content = res.streaming_content
+        first = await anext(content)
+        await content.aclose()
+        self.assertTrue(first.startswith(b'event: occupancy'))
+
+    @override_settings(STREAM_POLL_SECONDS=0, CHANGE_FEED_LAG_SECONDS=0)
+    async def test_stream_reads_changes_of_other_workers(self):
+        """Test a change that never went through this worker's broker still reaches the stream"""
+        section = await ParkingSection.objects.aget(parking=self.parking)
+        slot = await ParkingSlot.objects.acreate(section=section, slot_number='S1', type='FOUR-SMALL')
+        events = parking_events(self.parking.id)
+        await anext(events)
+
+        with patch('api.changes.publish_changes'):
+            slot.is_booked = True
+            await slot.asave()
+        received = await anext(events)
+        await events.aclose()
+
+        self.assertTrue(received.startswith('event: parking_slot'))
+        self.assertIn(str(slot.id), received)
+
+    @override_settings(STREAM_REPLAY_LIMIT=1, CHANGE_FEED_LAG_SECONDS=0)
+    async def test_stream_resets_listeners_too_far_behind(self):
+        """Test a replay longer than the limit is replaced by a reset event"""
+        section = await ParkingSection.objects.aget(parking=self.parking)
+        for number in ('S1', 'S2'):
+            await ParkingSlot.objects.acreate(section=section, slot_number=number, type='FOUR-SMALL')
+        events = parking_events(self.parking.id, since=0)
+
+        first, second = await anext(events), await anext(events)
+        await events.aclose()
+
+        self.assertTrue(first.startswith('event: reset'))
+        self.assertTrue(second.startswith('event: occupancy'))
+
+    def test_stream_never_sends_an_older_state(self):
+        """Test a feed entry superseded by a change already sent live is skipped"""
+        state = StreamState(cursor=10)
+        live = {'seq': 15, 'model': 'parking_slot', 'object_id': 'a'}
+        polled = {'seq': 12, 'model': 'parking_slot', 'object_id': 'a'}
+
+        self.assertEqual(state.unseen([live]), [live])
+        self.assertEqual(state.unseen([polled, live]), [])
+        state.advance(15)
+        self.assertEqual(state.sent, {})
+
+
+class AsyncReadViewTests(TestCase):
+    """Test the async variants of the hot read endpoints"""
+
+    def setUp(self):
+        self.user = create_user(email='async@amitpr.com', username='async', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        ParkingSlot.objects.create(section=section, slot_number='S1', type='FOUR-SMALL')
+        self.slot = ParkingSlot.objects.create(section=section, slot_number='S2', type='FOUR-SMALL', is_booked=True)
+        vehicle = Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+        self.ticket = Ticket.objects.create(user=self.user, parking_slot=self.slot, vehicle=vehicle)
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    async def test_async_views_require_token(self):
+        """Test anonymous requests are rejected"""
+        res = await self.async_client.get(reverse('api:async-ticket', args=[self.ticket.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_query_token_only_on_stream(self):
+        """Test ?token= is not accepted outside the event stream"""
+        res = await self.async_client.get(
+            reverse('api:async-ticket', args=[self.ticket.id]), {'token': self.token.key}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_availability_matches_sync(self):
+        """Test both availability endpoints count the one free slot"""
+        sync_res = await self.async_client.get(
+            reverse('api:parking-availability', args=[self.parking.id]), headers=self.headers
+        )
+        async_res = await self.async_client.get(
+            reverse('api:async-parking-availability', args=[self.parking.id]), headers=self.headers
+        )
+
+        self.assertEqual(async_res.status_code, status.HTTP_200_OK)
+        self.assertEqual(async_res.json(), sync_res.json())
+        self.assertEqual(async_res.json()['availability'][0]['free'], 1)
+
+    async def test_async_occupancy_and_ticket(self):
+        """Test occupancy counters and ticket lookup are served asynchronously"""
+        occupancy = await self.async_client.get(
+            reverse('api:async-parking-occupancy', args=[self.parking.id]), headers=self.headers
+        )
+        ticket = await self.async_client.get(reverse('api:async-ticket', args=[self.ticket.id]), headers=self.headers)
+
+        self.assertEqual(occupancy.json()['occupied_slots'], 1)
+        self.assertEqual(ticket.json()['parking_slot'], str(self.slot.id))
+
+
+@override_settings(TOKEN_CACHE_SECONDS=300)
+class CachedTokenAuthenticationTests(TestCase):
+    """Test token authentication served from the token cache"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+        self.user = create_user(email='token@amitpr.com', username='token', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_skips_queries(self):
+        """Test a repeated request resolves the token without queries"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deactivation_invalidates_cached_token(self):
+        """Test a deactivated user is rejected despite a cached token"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_sign_out_revokes_token(self):
+        """Test signing out deletes the token and rejects it afterwards"""
+        self.client.post(reverse('api:signout'))
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    @override_settings(TOKEN_CACHE_SECONDS=0)
+    def test_cache_off_without_shared_backend(self):
+        """Test tokens are looked up every time when the token cache is off"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+
+@override_settings(API_TOKEN_ONLY=True)
+class TokenOnlyApiTests(TestCase):
+    """Test /api/ skips session and CSRF handling in token only mode"""
+
+    def test_api_response_sets_no_session_cookie(self):
+        """Test token clients get no session or CSRF cookies"""
+        user = create_user(email='kiosk@amitpr.com', username='kiosk', password='testpass')
+        token = Token.objects.create(user=user)
+
+        res = self.client.get(ME_URL, HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('sessionid', res.cookies)
+        self.assertNotIn('csrftoken', res.cookies)
+
+
+class DeviceTokenTests(TestCase):
+    """Test scoped JWTs for gate devices"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='owner@amitpr.com', username='owner', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        self.other = Parking.objects.create(user=self.user, name='North', capacity=10)
+        section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        ParkingSlot.objects.create(section=section, slot_number='S1', type='FOUR-SMALL')
+        ParkingPrice.objects.create(parking_section=section, price=20, vehicle_size='FOUR-SMALL')
+        Vehicle.objects.create(user=self.user, vehicle_number='KA01', vehicle_type='FOUR-SMALL')
+
+    def device_client(self):
+        res = self.client.post(
+            reverse('api:device-token'), {'device': 'gate-1', 'parkings': [self.parking.id]}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        device = APIClient()
+        device.credentials(HTTP_AUTHORIZATION=f'Bearer {res.data["access"]}')
+        return device, res.data['refresh']
+
+    def test_device_checks_in_within_scope(self):
+        """Test a device token checks vehicles in to its own parking only"""
+        device, _ = self.device_client()
+
+        res = device.post(CHECK_IN_URL, {'parking': self.parking.id, 'vehicle_number': 'KA01'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Ticket.objects.get().user, self.user)
+
+        res = device.post(CHECK_IN_URL, {'parking': self.other.id, 'vehicle_number': 'KA01'})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_device_cannot_allocate_in_another_parkings_section(self):
+        """Test a section of another parking is refused instead of booked"""
+        device, _ = self.device_client()
+        section = ParkingSection.objects.create(parking=self.other, name='B', capacity=10)
+        ParkingSlot.objects.create(section=section, slot_number='P2S1', type='FOUR-SMALL')
+        slot_allocator.invalidate()
+
+        res = device.post(
+            reverse('api:parking-slot-allocate', args=[self.parking.id]),
+            {'vehicle': Vehicle.objects.get().id, 'section': section.id},
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ParkingSlot.objects.get(slot_number='P2S1').is_booked)
+
+    def test_refresh_keeps_scope(self):
+        """Test refreshed access tokens carry the device claims"""
+        _, refresh = self.device_client()
+
+        res = APIClient().post(reverse('api:device-token-refresh'), {'refresh': refresh})
+        device = APIClient()
+        device.credentials(HTTP_AUTHORIZATION=f'Bearer {res.data["access"]}')
+        res = device.get(reverse('api:parking-occupancy', args=[self.other.id]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_device_scope_applies_to_async_views(self):
+        """Test device tokens authenticate on the async views within their scope only"""
+        device, _ = self.device_client()
+
+        res = device.get(reverse('api:async-parking-occupancy', args=[self.parking.id]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = device.get(reverse('api:async-parking-occupancy', args=[self.other.id]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_device_scope_of_async_ticket_and_pass_lookups(self):
+        """Test async ticket and pass lookups are scoped by the ticket's and the requested parking"""
+        device, _ = self.device_client()
+        vehicle = Vehicle.objects.get()
+        section = ParkingSection.objects.create(parking=self.other, name='B', capacity=10)
+        # The foreign ticket shares the id of the device's parking, the own one matches no parking
+        foreign = Ticket.objects.create(
+            pk=self.parking.pk, user=self.user, vehicle=vehicle,
+            parking_slot=ParkingSlot.objects.create(section=section, slot_number='P2S1'),
+        )
+        own = Ticket.objects.create(
+            pk=self.parking.pk + self.other.pk + 100, user=self.user, vehicle=vehicle,
+            parking_slot=ParkingSlot.objects.get(slot_number='S1'),
+        )
+
+        res = device.get(reverse('api:async-ticket', args=[own.pk]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = device.get(reverse('api:async-ticket', args=[foreign.pk]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        res = device.get(reverse('api:async-passes-active'), {'vehicle_number': 'KA01', 'parking': self.parking.id})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = device.get(reverse('api:async-passes-active'), {'vehicle_number': 'KA01', 'parking': self.other.id})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cannot_scope_device_to_foreign_parking(self):
+        """Test devices can only be scoped to the user's own parkings"""
+        stranger = create_user(email='stranger@amitpr.com', username='stranger', password='testpass')
+        foreign = Parking.objects.create(user=stranger, name='Elsewhere', capacity=10)
+
+        res = self.client.post(
+            reverse('api:device-token'), {'device': 'gate-1', 'parkings': [foreign.id]}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportTests(TestCase):
+    """Test the streaming ticket and pass exports"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_superuser('finance@amitpr.com', 'finance', 'testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=parking, name='A', capacity=10)
+        slot = ParkingSlot.objects.create(section=section, slot_number='S1')
+        vehicle = Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+        for _ in range(3):
+            Ticket.objects.create(user=self.user, parking_slot=slot, vehicle=vehicle)
+        self.parking = parking
+
+    def test_csv_export_streams_rows(self):
+        """Test the CSV export has a header and one line per ticket"""
+        res = self.client.get(reverse('api:export', args=['tickets']), {'parking': self.parking.id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('id,user,vehicle,vehicle_number'))
+        self.assertEqual(len(lines), 4)
+
+    def test_malformed_parking_filter_is_rejected(self):
+        """Test a non-integer ?parking= is a 400 instead of an unfiltered export"""
+        res = self.client.get(reverse('api:export', args=['tickets']), {'parking': 'abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_gzipped_ndjson_export(self):
+        """Test the NDJSON export can be gzipped"""
+        res = self.client.get(reverse('api:export', args=['tickets']), {'output': 'ndjson', 'gzip': 'true'})
+
+        rows = gzip.decompress(b''.join(res.streaming_content)).decode().splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(json.loads(rows[0])['vehicle_number'], 'KA01')
+
+    def test_export_command_writes_file(self):
+        """Test the export command writes every ticket to a file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tickets.csv')
+            call_command('export-data', 'tickets', '--output', path, '--chunk-size', '2', stderr=StringIO())
+            with open(path) as export:
+                self.assertEqual(len(export.read().splitlines()), 4)
+
+    async def test_asgi_export_streams_asynchronously(self):
+        """Test the export is served chunk by chunk under ASGI"""
+        await self.async_client.aforce_login(self.user)
+        res = await self.async_client.get(reverse('api:export', args=['passes']))
+
+        self.assertTrue(res.is_async)
+        content = b''.join([chunk async for chunk in res.streaming_content])
+        self.assertTrue(content.startswith(b'id,user,parking'))
+
+
+class BulkImportTests(TestCase):
+    """Test bulk importing vehicles and passes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='fleet@amitpr.com', username='fleet', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+
+    def upload(self, kind, name, content):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse('api:import', args=[kind]), {'file': upload}, format='multipart')
+
+    def test_vehicle_csv_upserts_and_reports_errors(self):
+        """Test vehicles are created or updated and bad rows are reported"""
+        Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+        res = self.upload(
+            'vehicles', 'fleet.csv',
+            'vehicle_number,vehicle_type,is_electric\nKA01,FOUR-LARGE,true\nKA02,,\nKA03,BUS,false\n',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 2)
+        self.assertEqual([error['row'] for error in res.data['errors']], [4])
+        vehicle = Vehicle.objects.get(vehicle_number='KA01')
+        self.assertEqual(vehicle.vehicle_type, 'FOUR-LARGE')
+        self.assertTrue(vehicle.is_electric)
+        self.assertTrue(Vehicle.objects.filter(vehicle_number='KA02', user=self.user).exists())
+
+    def test_vehicle_of_other_user_is_not_overwritten(self):
+        """Test a vehicle registered to someone else is reported, not updated"""
+        stranger = create_user(email='stranger@amitpr.com', username='stranger', password='testpass')
+        Vehicle.objects.create(user=stranger, vehicle_number='KA09')
+
+        res = self.upload('vehicles', 'fleet.csv', 'vehicle_number,vehicle_type\nKA09,TWO\n')
+        self.assertEqual(res.data['failed'], 1)
+        self.assertEqual(Vehicle.objects.get(vehicle_number='KA09').vehicle_type, 'FOUR-SMALL')
+
+    def test_pass_ndjson_import_is_idempotent(self):
+        """Test importing the same passes twice updates them in place"""
+        Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+        period = {'parking': self.parking.id, 'start_date': '2026-01-01', 'end_date': '2026-12-31'}
+        rows = [{'vehicle_number': 'KA01', 'price': 100, **period}, {'vehicle_number': 'KA99', **period}]
+        self.upload('passes', 'passes.ndjson', '\n'.join(json.dumps(row) for row in rows))
+        rows[0]['price'] = 120
+        res = self.upload('passes', 'passes.ndjson', '\n'.join(json.dumps(row) for row in rows))
+
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual(res.data['errors'][0]['row'], 2)
+        self.assertEqual(Passes.objects.get().price, 120)
+
+    def test_pass_on_other_users_vehicle_is_refused(self):
+        """Test passes cannot be created on, or repriced for, another user's vehicle"""
+        stranger = create_user(email='victim@amitpr.com', username='victim', password='testpass')
+        vehicle = Vehicle.objects.create(user=stranger, vehicle_number='KA09')
+        Passes.objects.create(
+            user=stranger, vehicle=vehicle, parking=self.parking,
+            start_date='2026-01-01', end_date='2026-12-31', price=500,
+        )
+        Vehicle.objects.create(user=self.user, vehicle_number='KA01')
+        shared = Vehicle.objects.create(user=self.user, vehicle_number='KA02')
+        Passes.objects.create(
+            user=stranger, vehicle=shared, parking=self.parking,
+            start_date='2026-01-01', end_date='2026-12-31', price=300,
+        )
+
+        res = self.upload(
+            'passes', 'passes.csv',
+            f'vehicle_number,parking,start_date,end_date,price\n'
+            f'KA09,{self.parking.id},2026-01-01,2026-12-31,0\n'
+            f'KA02,{self.parking.id},2026-01-01,2026-12-31,0\n'
+            f'KA01,{self.parking.id},2026-01-01,2026-12-31,50\n',
+        )
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual([error['row'] for error in res.data['errors']], [2, 3])
+        self.assertEqual(Passes.objects.get(vehicle=vehicle).price, 500)
+        self.assertEqual(Passes.objects.get(vehicle=shared).price, 300)
+
+    def test_import_command(self):
+        """Test the import command reads a file for a user"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'fleet.ndjson')
+            with open(path, 'w') as rows:
+                rows.write('{"vehicle_number": "KA05"}\nnot json\n')
+            out = StringIO()
+            call_command('import-data', 'vehicles', path, '--user', self.user.email, stdout=out, stderr=StringIO())
+
+        self.assertIn('Imported 1 of 2 vehicles rows, 1 failed', out.getvalue())
+
+
+class UsageRollupTests(TestCase):
+    """Test the hourly and daily usage rollups and their reports"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='reports@amitpr.com', username='reports', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=10)
+        self.slot = ParkingSlot.objects.create(section=section, slot_number='S1')
+        self.vehicle = Vehicle.objects.create(user=self.user, vehicle_number='KA01', vehicle_type='TWO')
+
+    def close_ticket(self, entry, exit, amount):
+        ticket = Ticket.objects.create(user=self.user, parking_slot=self.slot, vehicle=self.vehicle)
+        Ticket.objects.filter(pk=ticket.pk).update(entry_time=entry, exit_time=exit, amount=amount)
+
+    def test_rollup_splits_minutes_and_is_incremental(self):
+        """Test minutes are split per hour and a rerun only adds new tickets"""
+        day = timezone.make_aware(datetime(2026, 3, 2))
+        self.close_ticket(day + timedelta(hours=10, minutes=30), day + timedelta(hours=12, minutes=15), 30)
+        call_command('rollup-usage', stdout=StringIO())
+        call_command('rollup-usage', stdout=StringIO())
+
+        hours = UsageRollup.objects.filter(grain='HOUR').order_by('period_start')
+        self.assertEqual([row.occupied_minutes for row in hours], [30, 60, 15])
+        self.assertEqual([row.tickets for row in hours], [0, 0, 1])
+        self.assertEqual(hours[2].revenue, 30)
+
+        self.close_ticket(day + timedelta(hours=11), day + timedelta(hours=13), 20)
+        call_command('rollup-usage', stdout=StringIO())
+        daily = UsageRollup.objects.get(grain='DAY')
+        self.assertEqual((daily.tickets, daily.occupied_minutes, daily.revenue), (2, 225, 50))
+
+    def test_reports_read_rollups_of_own_parkings(self):
+        """Test the totals report sums the rollups of the user's parkings"""
+        day = timezone.make_aware(datetime(2026, 3, 2))
+        self.close_ticket(day + timedelta(hours=9), day + timedelta(hours=10), 20)
+        call_command('rollup-usage', stdout=StringIO())
+
+        res = self.client.get(reverse('api:reports-totals'), {'grain': 'day', 'by': 'vehicle_type'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['data'], [{'vehicle_type': 'TWO', 'tickets': 1, 'occupied_minutes': 60, 'revenue': 20}]
+        )
+
+        stranger = create_user(email='stranger@amitpr.com', username='stranger', password='testpass')
+        self.client.force_authenticate(stranger)
+        res = self.client.get(reverse('api:reports-usage'), {'grain': 'hour'})
+        self.assertEqual(res.data['data'], [])
+
+    def test_rebuild_keeps_archived_history(self):
+        """Test a rebuild recounts recent periods and keeps those of archived tickets"""
+        now = timezone.now()
+        self.close_ticket(now - timedelta(days=101), now - timedelta(days=100), 10)
+        self.close_ticket(now - timedelta(days=2, hours=1), now - timedelta(days=2), 20)
+        call_command('rollup-usage', stdout=StringIO())
+        call_command('archive-tickets', '--days', '90', stdout=StringIO())
+        Ticket.objects.update(amount=30)
+
+        call_command('rollup-usage', '--rebuild', stdout=StringIO())
+
+        daily = UsageRollup.objects.filter(grain='DAY', tickets__gt=0).order_by('period_start')
+        self.assertEqual([row.revenue for row in daily], [10, 30])
+        self.assertEqual(sum(UsageRollup.objects.filter(grain='HOUR').values_list('tickets', flat=True)), 2)
+
+    def test_reports_reject_bad_filters(self):
+        for params in ({'parking': 'abc'}, {'section': 'zz'}):
+            res = self.client.get(reverse('api:reports-usage'), params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TicketAnalyticsTests(TestCase):
+    """Test the dwell time, peak occupancy and turnover analytics"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='analytics@amitpr.com', username='analytics', password='testpass')
+        self.client.force_authenticate(self.user)
+        parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        self.section = ParkingSection.objects.create(parking=parking, name='A', capacity=2)
+        self.slots = [ParkingSlot.objects.create(section=self.section, slot_number=f'S{i}') for i in range(2)]
+
+    def stay(self, slot, entry, exit):
+        ticket = Ticket.objects.create(user=self.user, parking_slot=slot)
+        Ticket.objects.filter(pk=ticket.pk).update(entry_time=entry, exit_time=exit)
+
+    def test_peak_counts_exits_before_entries_at_the_same_time(self):
+        """Test back to back stays do not overlap and groups are independent"""
+        entry = np.array([0, 60, 0, 10, 20], dtype=float)
+        exit = np.array([60, 120, 30, 40, 50], dtype=float)
+        peaks, peak_at = peak_occupancy(entry, exit, np.array([0, 0, 1, 1, 1]), 3)
+        self.assertEqual(peaks.tolist(), [1, 3, 0])
+        self.assertEqual(peak_at[:2].tolist(), [0, 20])
+        self.assertTrue(np.isnan(peak_at[2]))
+
+    def test_dwell_stats_histogram(self):
+        """Test stay lengths are binned in minutes"""
+        stats = dwell_stats(np.zeros(3), np.array([600, 2400, 90000], dtype=float))
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['percentiles']['p50'], 40)
+        counts = {row['from']: row['count'] for row in stats['histogram']}
+        self.assertEqual((counts[0], counts[30], counts[1440]), (1, 1, 1))
+
+    def test_intervals_are_loaded_as_epoch_seconds(self):
+        """Test the database computed epochs keep microseconds and open tickets leave at the window end"""
+        entry = timezone.make_aware(datetime(2026, 3, 2, 9, 15, 30, 250001))
+        end = entry + timedelta(hours=3)
+        exit = entry + timedelta(minutes=5, microseconds=7)
+        self.stay(self.slots[0], entry, exit)
+        self.stay(self.slots[1], entry, None)
+
+        entries, exits, closed, _, sections = load_intervals(entry - timedelta(hours=1), end)
+        self.assertEqual(entries.tolist(), [entry.timestamp()] * 2)
+        self.assertEqual(sorted(exits.tolist()), [exit.timestamp(), end.timestamp()])
+        self.assertEqual(sorted(closed.tolist()), [False, True])
+        self.assertEqual(sections.tolist(), [str(self.section.id)])
+
+    def test_analytics_endpoint(self):
+        """Test the report covers own sections and clips stays to the window"""
+        day = timezone.make_aware(datetime(2026, 3, 2))
+        self.stay(self.slots[0], day + timedelta(hours=9), day + timedelta(hours=11))
+        self.stay(self.slots[1], day + timedelta(hours=10), day + timedelta(hours=10, minutes=30))
+        self.stay(self.slots[0], day - timedelta(hours=1), day + timedelta(hours=1))
+
+        res = self.client.get(reverse('api:reports-analytics'), {'from': '2026-03-02', 'to': '2026-03-02'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['dwell']['count'], 2)
+        section = res.data['sections'][0]
+        self.assertEqual((section['tickets'], section['peak_occupancy']), (2, 2))
+        self.assertEqual(section['peak_at'], day + timedelta(hours=10))
+        self.assertEqual(section['turnover_per_slot_day'], 1)
+
+        stranger = create_user(email='outsider@amitpr.com', username='outsider', password='testpass')
+        self.client.force_authenticate(stranger)
+        res = self.client.get(reverse('api:reports-analytics'), {'from': '2026-03-02', 'to': '2026-03-02'})
+        self.assertEqual(res.data['sections'], [])
+        res = self.client.get(reverse('api:reports-analytics'), {'parking': 'abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(FORECAST_REFIT_IN_BACKGROUND=False)
+class ForecastTests(TestCase):
+    """Test the hour-of-week occupancy forecasts"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user(email='forecast@amitpr.com', username='forecast', password='testpass')
+        self.client.force_authenticate(self.user)
+        self.parking = Parking.objects.create(user=self.user, name='Central', capacity=10)
+        section = ParkingSection.objects.create(parking=self.parking, name='A', capacity=2)
+        self.slots = [ParkingSlot.objects.create(section=section, slot_number=f'S{i}') for i in range(2)]
+        self.now = timezone.make_aware(datetime(2026, 3, 16, 8, 30))
+        for days in range(1, 29):
+            day = self.now.replace(hour=0, minute=0) - timedelta(days=days)
+            for slot in self.slots:
+                ticket = Ticket.objects.create(user=self.user, parking_slot=slot)
+                Ticket.objects.filter(pk=ticket.pk).update(
+                    entry_time=day + timedelta(hours=10), exit_time=day + timedelta(hours=12)
+                )
+
+    def test_hourly_occupancy(self):
+        """Test stays are spread over the hours they overlap"""
+        boundaries = np.arange(0, 3 * 3600 + 1, 3600.0)
+        observed = hourly_occupancy(
+            np.array([1800.0, -600.0]), np.array([9000.0, 3600.0]), np.array([0, 1]), 2, boundaries
+        )
+        self.assertEqual(observed.tolist(), [[0.5, 1, 0.5], [1, 0, 0]])
+
+    def test_forecast_follows_daily_pattern(self):
+        """Test the busy hours of past days are forecast as busy"""
+        forecast = parking_forecast(self.parking.id, hours=4, now=self.now)
+        occupied = [hour['occupied'] for hour in forecast['sections'][0]['forecast']]
+        self.assertEqual(forecast['forecast'][0]['from'], self.now.replace(hour=9, minute=0))
+        self.assertLess(occupied[0], 0.5)
+        self.assertGreater(occupied[1], 1.5)
+        self.assertGreater(occupied[2], 1.5)
+        self.assertLess(occupied[3], 0.5)
+        self.assertTrue(all(0 <= value <= 2 for value in occupied))
+
+    def test_model_is_cached_and_refitted_incrementally(self):
+        """Test the cached model only advances once an hour completes"""
+        first = get_model(self.parking.id, now=self.now)
+        with self.assertNumQueries(0):
+            get_model(self.parking.id, now=self.now + timedelta(minutes=20))
+        later = get_model(self.parking.id, now=self.now + timedelta(hours=2))
+        self.assertEqual(later['fitted_until'] - first['fitted_until'], 7200)
+
+    def test_stale_model_is_served_while_another_request_refits(self):
+        """Test only the request holding the refit lock fits, the others get the model as it is"""
+        first = get_model(self.parking.id, now=self.now)
+        cache.add(refit_lock_key(self.parking.id), True)
+
+        with self.assertNumQueries(0):
+            stale = get_model(self.parking.id, now=self.now + timedelta(hours=2))
+        self.assertEqual(stale['fitted_until'], first['fitted_until'])
+
+        cache.delete(model_key(self.parking.id))
+        res = self.client.get(reverse('api:parking-forecast', args=[self.parking.id]))
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_forecast_endpoint(self):
+        res = self.client.get(reverse('api:parking-forecast', args=[self.parking.id]), {'hours': 3})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['forecast']), 3)
+        self.assertEqual(res.data['sections'][0]['free_slots'], 2)
+
+        res = self.client.get(reverse('api:parking-forecast', args=[self.parking.id]), {'hours': 100})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_parking_is_not_found_nor_cached(self):
+        res = self.client.get(reverse('api:parking-forecast', args=[self.parking.id + 100]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(cache.get(model_key(self.parking.id + 100)))
@@ -19,16 +19,73 @@ from .views import (
     ParkingPriceUpdateDeleteView,
     PassesCreateListApiView,
     PassesUpdateDeleteView,
+    SlotAllocateApiView,
+    CheckInApiView,
+    TicketCheckOutApiView,
+    ParkingOccupancyApiView,
+    ParkingSlotBulkCreateApiView,
+    TicketArchiveListApiView,
+    QuoteApiView,
+    PricingRuleCreateListApiView,
+    PricingRuleUpdateDeleteView,
+    ActivePassApiView,
+    ChangeFeedApiView,
+    ParkingStreamView,
+    ParkingForecastApiView,
+    ParkingAvailabilityApiView,
+    AsyncParkingAvailabilityView,
+    AsyncParkingOccupancyView,
+    AsyncActivePassView,
+    AsyncTicketView,
+    SignOutApiView,
+    DeviceTokenApiView,
+    DeviceTokenRefreshApiView,
+    ExportApiView,
+    ImportApiView,
+    UsageReportApiView,
+    TicketAnalyticsApiView,
 )
 from rest_framework.authtoken.views import obtain_auth_token
 
 urlpatterns = [
     path("signup", CreateCustomUserApiView.as_view(), name="signup"),
     path("signin", obtain_auth_token, name="signin"),
+    path("signout", SignOutApiView.as_view(), name="signout"),
+    path("device-token", DeviceTokenApiView.as_view(), name="device-token"),
+    path(
+        "device-token/refresh",
+        DeviceTokenRefreshApiView.as_view(),
+        name="device-token-refresh",
+    ),
     path("me/", ManageUserView.as_view(), name="me"),
     path("users", ListCustomUsersApiView.as_view(), name="users"),
     path("parking", ParkingCreateListApiView.as_view(), name="parking-create-list"),
     path("parking/<int:pk>", ParkingUpdateDeleteView.as_view(), name="parking-crud"),
+    path(
+        "parking/<int:pk>/allocate",
+        SlotAllocateApiView.as_view(),
+        name="parking-slot-allocate",
+    ),
+    path(
+        "parking/<int:pk>/occupancy",
+        ParkingOccupancyApiView.as_view(),
+        name="parking-occupancy",
+    ),
+    path(
+        "parking/<int:pk>/availability",
+        ParkingAvailabilityApiView.as_view(),
+        name="parking-availability",
+    ),
+    path(
+        "parking/<int:pk>/stream",
+        ParkingStreamView.as_view(),
+        name="parking-stream",
+    ),
+    path(
+        "parking/<int:pk>/forecast",
+        ParkingForecastApiView.as_view(),
+        name="parking-forecast",
+    ),
     path(
         "parking-section",
         ParkingSectionCreateListApiView.as_view(),
@@ -39,6 +96,11 @@ urlpatterns = [
         ParkingSectionUpdateDeleteView.as_view(),
         name="parking-section-crud",
     ),
+    path(
+        "parking-section/<uuid:pk>/slots",
+        ParkingSlotBulkCreateApiView.as_view(),
+        name="parking-section-slots-bulk-create",
+    ),
     path(
         "parking-slot",
         ParkingSlotCreateListApiView.as_view(),
@@ -59,10 +121,48 @@ urlpatterns = [
         ParkingPriceUpdateDeleteView.as_view(),
         name="parking-price-crud",
     ),
+    path(
+        "pricing-rule",
+        PricingRuleCreateListApiView.as_view(),
+        name="pricing-rule-create-list",
+    ),
+    path(
+        "pricing-rule/<uuid:pk>",
+        PricingRuleUpdateDeleteView.as_view(),
+        name="pricing-rule-crud",
+    ),
     path("passes", PassesCreateListApiView.as_view(), name="passes-create-list"),
+    path("passes/active", ActivePassApiView.as_view(), name="passes-active"),
     path("passes/<uuid:pk>", PassesUpdateDeleteView.as_view(), name="passes-crud"),
     path("ticket", TicketCreateListApiView.as_view(), name="ticket-create-list"),
     path("ticket/<int:pk>", TicketUpdateDeleteView.as_view(), name="ticket-crud"),
+    path(
+        "ticket/<int:pk>/check-out",
+        TicketCheckOutApiView.as_view(),
+        name="ticket-check-out",
+    ),
+    path("ticket-archive", TicketArchiveListApiView.as_view(), name="ticket-archive-list"),
+    # Async variants of the hot read endpoints, for ASGI deployments
+    path(
+        "async/parking/<int:pk>/availability",
+        AsyncParkingAvailabilityView.as_view(),
+        name="async-parking-availability",
+    ),
+    path(
+        "async/parking/<int:pk>/occupancy",
+        AsyncParkingOccupancyView.as_view(),
+        name="async-parking-occupancy",
+    ),
+    path("async/passes/active", AsyncActivePassView.as_view(), name="async-passes-active"),
+    path("async/ticket/<int:pk>", AsyncTicketView.as_view(), name="async-ticket"),
+    path("export/<str:kind>", ExportApiView.as_view(), name="export"),
+    path("import/<str:kind>", ImportApiView.as_view(), name="import"),
+    path("reports/usage", UsageReportApiView.as_view(), name="reports-usage"),
+    path("reports/totals", UsageReportApiView.as_view(series=False), name="reports-totals"),
+    path("reports/analytics", TicketAnalyticsApiView.as_view(), name="reports-analytics"),
+    path("changes", ChangeFeedApiView.as_view(), name="changes"),
+    path("quote", QuoteApiView.as_view(), name="quote"),
+    path("check-in", CheckInApiView.as_view(), name="check-in"),
     path("vehicle", VehicleCreateListApiView.as_view(), name="vehicle-create-list"),
     path("vehicle/<int:pk>", VehicleUpdateDeleteView.as_view(), name="vehicle-crud"),
 ]
@@ -0,0 +1,23 @@
+from datetime import datetime, time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_moment(value, end_of_day=False):
+    """Parse a date or datetime string into an aware datetime, None if invalid.
+
+    A bare date means the start of that day, or its end with ``end_of_day``.
+    """
+    # parse_datetime also accepts bare dates on Python 3.11+, so try a date first
+    try:
+        day = parse_date(value)
+        parsed = None if day is not None else parse_datetime(value)
+    except ValueError:
+        return None
+    if day is not None:
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    elif parsed is None:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
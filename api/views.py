@@ -1,4 +1,7 @@
+import io
 import logging
+from datetime import timedelta
+from uuid import UUID
 from rest_framework.generics import (
     ListAPIView,
     CreateAPIView,
@@ -6,9 +9,24 @@ from rest_framework.generics import (
     RetrieveUpdateDestroyAPIView,
     RetrieveUpdateAPIView,
 )
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F, Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.utils import timezone
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied, ValidationError
+from rest_framework.request import Request
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from .permissions import IsAdmin
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
+from .authentication import CachedTokenAuthentication
+from rest_framework.authtoken.models import Token
+from .permissions import IsAdmin, InParkingScope
 from rest_framework import status
 from rest_framework.response import Response
 from .serializers import (
@@ -19,7 +37,15 @@ from .serializers import (
     ParkingSectionSerializer,
     PassesSerializer,
     ParkingSlotSerializer,
-    ParkingPriceSerializer
+    ParkingPriceSerializer,
+    CheckInSerializer,
+    DeviceTokenSerializer,
+    DeviceTokenRefreshSerializer,
+    BulkSlotSerializer,
+    TicketArchiveSerializer,
+    QuoteSerializer,
+    PricingRuleSerializer,
+    parse_expand,
 )
 from .models import (
     CustomUser,
@@ -30,19 +56,68 @@ from .models import (
     ParkingSlot,
     ParkingSection,
     Passes,
+    TicketArchive,
+    PricingRule,
+    UsageRollup,
 )
+from .allocation import candidate_slots, slot_allocator, slot_availability
+from .pricing import confirmed_price_id, quote, rate_tables
+from .pricing_rules import ticket_fee
+from .utils import parse_moment
+from .passes import aactive_passes, active_passes, pass_for_parking
+from .cache import CatalogueCacheMixin, ConditionalGetMixin, bump_version
+from .changes import changes_since, record_change, record_slot_changes
+from .occupancy import aparking_occupancy, parking_occupancy
+from .streams import parking_events
+from .exports import EXPORT_FORMATS, EXPORTS, export_chunks, iterate_in_thread
+from .imports import IMPORT_FORMATS, IMPORTERS, read_rows
+from .rollups import ROLLUP_GRAINS
+from .analytics import ticket_analytics
+from .forecast import parking_forecast
 
 # Get an instance of a logger
 api_errors_logger = logging.getLogger("api_errors")
 parking_logger = logging.getLogger(__name__)  # General logger for this module
 
 
+def parse_date_param(request, name, end_of_day=False):
+    """Read a date or datetime query parameter, None when it is missing"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_moment(value, end_of_day=end_of_day)
+    if parsed is None:
+        raise ValidationError({name: "Enter a valid date or datetime."})
+    return parsed
+
+
+class FieldSelectionMixin:
+    """Only load the columns requested with ``?fields=`` and join the
+    relations requested with ``?expand=`` in the same query"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != "GET":
+            return queryset
+        expand = parse_expand(self.request.query_params.get("expand"))
+        requested = self.request.query_params.get("fields")
+        if requested:
+            names = {name.strip() for name in requested.split(",")}
+            expand = {name: nested for name, nested in expand.items() if name in names}
+            concrete = {field.name for field in queryset.model._meta.concrete_fields}
+            queryset = queryset.only(queryset.model._meta.pk.name, *(names & concrete))
+        paths = self.get_serializer_class().select_related_paths(expand)
+        if paths:
+            queryset = queryset.select_related(*paths)
+        return queryset
+
+
 class CreateCustomUserApiView(CreateAPIView):
     serializer_class = CustomUserSerializer
     queryset = CustomUser.objects.all()
 
 
-class ListCustomUsersApiView(ListAPIView):
+class ListCustomUsersApiView(FieldSelectionMixin, ListAPIView):
     serializer_class = CustomUserSerializer
     queryset = CustomUser.objects.all()
 
@@ -51,7 +126,7 @@ class ManageUserView(RetrieveUpdateAPIView):
     """Manage the authenticated user"""
 
     serializer_class = CustomUserSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_object(self):
@@ -59,7 +134,53 @@ class ManageUserView(RetrieveUpdateAPIView):
         return self.request.user
 
 
-class ParkingCreateListApiView(ListCreateAPIView):
+class SignOutApiView(APIView):
+    """Revoke the token of the authenticated user"""
+
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        # Deleting the token also drops it from every worker's token cache
+        Token.objects.filter(user=request.user).delete()
+        parking_logger.info(f"User {request.user.id} signed out")
+        return Response(
+            {
+                "message": "Signed out",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class DeviceTokenApiView(APIView):
+    """Issue a JWT pair for a gate device, scoped to some of the user's parkings"""
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = DeviceTokenSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        refresh = RefreshToken.for_user(request.user)
+        # Custom claims are copied into every access token refreshed from this one
+        refresh["device"] = serializer.validated_data["device"]
+        refresh["parkings"] = serializer.validated_data["parkings"]
+        parking_logger.info(
+            f"Device token for {refresh['device']} issued by user {request.user.id} for parkings {refresh['parkings']}"
+        )
+        return Response(
+            {
+                "refresh": str(refresh),
+                "access": str(refresh.access_token),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class DeviceTokenRefreshApiView(TokenRefreshView):
+    serializer_class = DeviceTokenRefreshSerializer
+
+
+class ParkingCreateListApiView(CatalogueCacheMixin, FieldSelectionMixin, ListCreateAPIView):
     serializer_class = ParkingSerializer
     queryset = Parking.objects.all()
     permission_classes = [IsAuthenticated]
@@ -118,7 +239,7 @@ class ParkingCreateListApiView(ListCreateAPIView):
             )
 
 
-class ParkingUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class ParkingUpdateDeleteView(CatalogueCacheMixin, RetrieveUpdateDestroyAPIView):
     serializer_class = ParkingSerializer
     queryset = Parking.objects.all()
 
@@ -172,7 +293,7 @@ class ParkingUpdateDeleteView(RetrieveUpdateDestroyAPIView):
             )
 
 
-class ParkingSectionCreateListApiView(ListCreateAPIView):
+class ParkingSectionCreateListApiView(CatalogueCacheMixin, FieldSelectionMixin, ListCreateAPIView):
     serializer_class = ParkingSectionSerializer
     queryset = ParkingSection.objects.all()
     permission_classes = [IsAuthenticated]
@@ -206,7 +327,7 @@ class ParkingSectionCreateListApiView(ListCreateAPIView):
             )
 
 
-class ParkingSectionUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class ParkingSectionUpdateDeleteView(CatalogueCacheMixin, FieldSelectionMixin, RetrieveUpdateDestroyAPIView):
     serializer_class = ParkingSectionSerializer
     queryset = ParkingSection.objects.all()
 
@@ -243,7 +364,7 @@ class ParkingSectionUpdateDeleteView(RetrieveUpdateDestroyAPIView):
         return super().get(request, *args, **kwargs)
 
 
-class ParkingSlotCreateListApiView(ListCreateAPIView):
+class ParkingSlotCreateListApiView(ConditionalGetMixin, FieldSelectionMixin, ListCreateAPIView):
     serializer_class = ParkingSlotSerializer
     queryset = ParkingSlot.objects.all()
     permission_classes = [IsAuthenticated]
@@ -280,7 +401,7 @@ class ParkingSlotCreateListApiView(ListCreateAPIView):
             )
 
 
-class ParkingSlotUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class ParkingSlotUpdateDeleteView(ConditionalGetMixin, FieldSelectionMixin, RetrieveUpdateDestroyAPIView):
     serializer_class = ParkingSlotSerializer
     queryset = ParkingSlot.objects.all()
 
@@ -329,7 +450,7 @@ class ParkingSlotUpdateDeleteView(RetrieveUpdateDestroyAPIView):
             )
 
 
-class TicketCreateListApiView(ListCreateAPIView):
+class TicketCreateListApiView(FieldSelectionMixin, ListCreateAPIView):
     serializer_class = TicketSerializer
     queryset = Ticket.objects.all()
     permission_classes = [IsAuthenticated]
@@ -349,12 +470,13 @@ class TicketCreateListApiView(ListCreateAPIView):
         )
 
 
-class TicketUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class TicketUpdateDeleteView(FieldSelectionMixin, RetrieveUpdateDestroyAPIView):
     serializer_class = TicketSerializer
     queryset = Ticket.objects.all()
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
+        record_change(instance, "DELETE")
         self.perform_destroy(instance)
         return Response(
             {
@@ -367,7 +489,7 @@ class TicketUpdateDeleteView(RetrieveUpdateDestroyAPIView):
         return super().put(request, *args, **kwargs)
 
 
-class VehicleCreateListApiView(ListCreateAPIView):
+class VehicleCreateListApiView(ConditionalGetMixin, FieldSelectionMixin, ListCreateAPIView):
     serializer_class = VehicleSerializer
     queryset = Vehicle.objects.all()
     permission_classes = [IsAuthenticated]
@@ -406,7 +528,7 @@ class VehicleCreateListApiView(ListCreateAPIView):
             )
 
 
-class VehicleUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class VehicleUpdateDeleteView(ConditionalGetMixin, RetrieveUpdateDestroyAPIView):
     serializer_class = VehicleSerializer
     queryset = Vehicle.objects.all()
 
@@ -455,7 +577,7 @@ class VehicleUpdateDeleteView(RetrieveUpdateDestroyAPIView):
             )
 
 
-class ParkingPriceCreateListApiView(ListCreateAPIView):
+class ParkingPriceCreateListApiView(CatalogueCacheMixin, FieldSelectionMixin, ListCreateAPIView):
     serializer_class = ParkingPriceSerializer
     queryset = ParkingPrice.objects.all()
     permission_classes = [IsAuthenticated]
@@ -496,7 +618,7 @@ class ParkingPriceCreateListApiView(ListCreateAPIView):
             )
 
 
-class ParkingPriceUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class ParkingPriceUpdateDeleteView(CatalogueCacheMixin, FieldSelectionMixin, RetrieveUpdateDestroyAPIView):
     serializer_class = ParkingPriceSerializer
     queryset = ParkingPrice.objects.all()
 
@@ -545,7 +667,43 @@ class ParkingPriceUpdateDeleteView(RetrieveUpdateDestroyAPIView):
             )
 
 
-class PassesCreateListApiView(ListCreateAPIView):
+class PricingRuleCreateListApiView(FieldSelectionMixin, ListCreateAPIView):
+    serializer_class = PricingRuleSerializer
+    queryset = PricingRule.objects.all()
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        parking_logger.info(f"Pricing Rule created by user: {request.user.id}")
+        return Response(
+            {
+                "message": "Pricing Rule created",
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class PricingRuleUpdateDeleteView(FieldSelectionMixin, RetrieveUpdateDestroyAPIView):
+    serializer_class = PricingRuleSerializer
+    queryset = PricingRule.objects.all()
+
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.perform_destroy(instance)
+        parking_logger.info(
+            f"Pricing Rule with id {instance.id} deleted by user {request.user.id}"
+        )
+        return Response(
+            {
+                "message": "Pricing Rule successfully deleted",
+            },
+            status=status.HTTP_204_NO_CONTENT,
+        )
+
+
+class PassesCreateListApiView(ConditionalGetMixin, FieldSelectionMixin, ListCreateAPIView):
     serializer_class = PassesSerializer
     queryset = Passes.objects.all()
     permission_classes = [IsAuthenticated]
@@ -584,7 +742,7 @@ class PassesCreateListApiView(ListCreateAPIView):
             )
 
 
-class PassesUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class PassesUpdateDeleteView(ConditionalGetMixin, FieldSelectionMixin, RetrieveUpdateDestroyAPIView):
     serializer_class = PassesSerializer
     queryset = Passes.objects.all()
 
@@ -631,3 +789,857 @@ class PassesUpdateDeleteView(RetrieveUpdateDestroyAPIView):
                 },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+
+def int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GateApiView(APIView):
+    """Base for the gate endpoints, which also accept device JWTs.
+
+    Device access tokens are checked by signature alone, with no user query,
+    and ``request.user`` is then a TokenUser: these views only use its id.
+    Scoped tokens are limited to the parking ``scoped_parking`` returns.
+    """
+
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated, InParkingScope]
+
+    def scoped_parking(self, request):
+        return self.kwargs.get("pk")
+
+
+class SlotAllocateApiView(GateApiView):
+    """Book the best free slot in a parking for the given vehicle"""
+
+    def post(self, request, pk, *args, **kwargs):
+        vehicle_id = request.data.get("vehicle")
+        section_id = request.data.get("section")
+        try:
+            section_id = UUID(str(section_id)) if section_id else None
+            vehicle = Vehicle.objects.get(pk=vehicle_id)
+        except (Vehicle.DoesNotExist, ValueError, TypeError):
+            return Response(
+                {
+                    "message": "A valid vehicle and section are required",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if section_id is not None and slot_allocator.parking_for_section(section_id) != pk:
+            return Response(
+                {
+                    "message": "Section does not belong to this parking",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        slot = slot_allocator.allocate(vehicle, parking_id=pk, section_id=section_id)
+        if slot is None:
+            parking_logger.info(
+                f"No free slot in parking {pk} for vehicle {vehicle.vehicle_number}"
+            )
+            return Response(
+                {
+                    "message": "No free slot available",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        parking_logger.info(
+            f"Parking Slot {slot['id']} allocated to vehicle {vehicle.vehicle_number} by user {request.user.id}"
+        )
+        return Response({"message": "Parking Slot allocated", "data": slot})
+
+
+class CheckInApiView(GateApiView):
+    """Book a free slot and issue a ticket for a vehicle in one transaction"""
+
+    def scoped_parking(self, request):
+        return int_or_none(request.data.get("parking"))
+
+    def post(self, request, *args, **kwargs):
+        serializer = CheckInSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        vehicle = Vehicle.objects.filter(vehicle_number=data["vehicle_number"]).first()
+        if vehicle is None:
+            return Response(
+                {
+                    "message": "Vehicle not found",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        slots = candidate_slots(vehicle).filter(section__parking_id=data["parking"])
+        if data.get("section"):
+            slots = slots.filter(section_id=data["section"])
+
+        try:
+            with transaction.atomic():
+                # Check-ins of the same vehicle queue on its row, so the second
+                # one sees the ticket of the first (ticket_open_vehicle_idx)
+                vehicle = Vehicle.objects.select_for_update().get(pk=vehicle.pk)
+                if Ticket.objects.filter(vehicle=vehicle, exit_time__isnull=True).exists():
+                    return Response(
+                        {
+                            "message": "Vehicle is already checked in",
+                        },
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                # Concurrent gates skip rows another transaction has locked
+                # instead of queueing on them, so no slot is booked twice.
+                slot = slots.select_for_update(skip_locked=True, of=("self",)).first()
+                if slot is None:
+                    return Response(
+                        {
+                            "message": "No free slot available",
+                        },
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+                price_id = confirmed_price_id(
+                    slot.section_id, vehicle.vehicle_type, slot.is_charging_available, data["type"]
+                )
+                if price_id is None:
+                    # An unpriced ticket would be charged nothing at check-out
+                    return Response(
+                        {
+                            "message": "No price is set for this slot",
+                        },
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                slot.is_booked = True
+                slot.save(update_fields=["is_booked", "updated_at"])
+
+                ticket = Ticket.objects.create(
+                    # Device JWTs carry a TokenUser, so only the id is used
+                    user_id=request.user.id,
+                    parking_slot=slot,
+                    vehicle=vehicle,
+                    parking_price_id=price_id,
+                )
+            parking_logger.info(
+                f"Vehicle {vehicle.vehicle_number} checked in to slot {slot.id} by user {request.user.id}"
+            )
+            return Response(
+                {
+                    "message": "Vehicle checked in",
+                    "data": TicketSerializer(ticket).data,
+                },
+                status=status.HTTP_201_CREATED,
+            )
+        except Exception as e:
+            api_errors_logger.exception(
+                f"Unhandled error in CheckInApiView.post for user {request.user.id}: {str(e)}"
+            )
+            return Response(
+                {
+                    "message": "An error occurred while checking in the vehicle.",
+                    "error": "Please try again later or contact support.",
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class TicketCheckOutApiView(GateApiView):
+    """Close a ticket, charge it and free its slot in one transaction"""
+
+    def scoped_parking(self, request):
+        return (
+            Ticket.objects.filter(pk=self.kwargs["pk"])
+            .values_list("parking_slot__section__parking_id", flat=True)
+            .first()
+        )
+
+    def post(self, request, pk, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                ticket = (
+                    Ticket.objects.select_for_update(of=("self",))
+                    .select_related("parking_price", "parking_slot__section")
+                    .prefetch_related("parking_price__pricing_rule")
+                    .filter(pk=pk)
+                    .first()
+                )
+                if ticket is None:
+                    return Response(
+                        {
+                            "message": "Parking Ticket not found",
+                        },
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+                if ticket.exit_time is not None:
+                    return Response(
+                        {
+                            "message": "Parking Ticket is already checked out",
+                        },
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+
+                ticket.exit_time = timezone.now()
+                slot = ticket.parking_slot
+                has_pass = False
+                if slot is not None and ticket.vehicle_id is not None:
+                    today = timezone.localdate(ticket.exit_time)
+                    has_pass = Passes.objects.filter(
+                        vehicle_id=ticket.vehicle_id,
+                        parking_id=slot.section.parking_id,
+                        start_date__lte=today,
+                        end_date__gte=today,
+                    ).exists()
+                ticket.amount = ticket_fee(ticket, has_pass=has_pass)
+                ticket.save(update_fields=["exit_time", "amount"])
+
+                if slot is not None:
+                    slot.is_booked = False
+                    slot.save(update_fields=["is_booked", "updated_at"])
+
+            parking_logger.info(
+                f"Parking Ticket {ticket.id} checked out with amount {ticket.amount} by user {request.user.id}"
+            )
+            return Response(
+                {
+                    "message": "Vehicle checked out",
+                    "data": TicketSerializer(ticket).data,
+                }
+            )
+        except Exception as e:
+            api_errors_logger.exception(
+                f"Error checking out Parking Ticket with id {pk} by user {request.user.id}: {str(e)}"
+            )
+            return Response(
+                {
+                    "message": "An error occurred while checking out the Parking Ticket.",
+                    "error": "Please try again later or contact support.",
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class ParkingOccupancyApiView(GateApiView):
+    """Live slot counters of a parking and each of its sections"""
+
+    def get(self, request, pk, *args, **kwargs):
+        occupancy = parking_occupancy(pk)
+        # A parking without sections is told apart from a missing one only then
+        if not occupancy["sections"] and not Parking.objects.filter(pk=pk).exists():
+            return Response(
+                {
+                    "message": "Parking not found",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(occupancy)
+
+
+class ParkingSlotBulkCreateApiView(APIView):
+    """Create a numbered run of slots in a section in one request"""
+
+    permission_classes = [IsAuthenticated]
+    batch_size = 1000
+
+    def post(self, request, pk, *args, **kwargs):
+        serializer = BulkSlotSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        numbers = serializer.slot_numbers()
+        spec = serializer.validated_data
+
+        try:
+            with transaction.atomic():
+                section = ParkingSection.objects.select_for_update().filter(pk=pk).first()
+                if section is None:
+                    return Response(
+                        {
+                            "message": "Parking Section not found",
+                        },
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+                # Lock the parking too so concurrent provisioning cannot overshoot its capacity
+                parking = Parking.objects.select_for_update().get(pk=section.parking_id)
+
+                section_slots = ParkingSlot.objects.filter(section=section).count()
+                parking_slots = ParkingSlot.objects.filter(section__parking=parking).count()
+                errors = []
+                if section_slots + len(numbers) > section.capacity:
+                    errors.append(
+                        f"Section capacity is {section.capacity} and it already has {section_slots} slots."
+                    )
+                if parking_slots + len(numbers) > parking.capacity:
+                    errors.append(
+                        f"Parking capacity is {parking.capacity} and it already has {parking_slots} slots."
+                    )
+                duplicates = list(
+                    ParkingSlot.objects.filter(section=section, slot_number__in=numbers)
+                    .values_list("slot_number", flat=True)[:20]
+                )
+                if duplicates:
+                    errors.append(f"Slot numbers already exist: {', '.join(duplicates)}")
+                if errors:
+                    return Response(
+                        {
+                            "message": "Parking Slots could not be created",
+                            "errors": errors,
+                        },
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+
+                slots = ParkingSlot.objects.bulk_create(
+                    (
+                        ParkingSlot(
+                            section=section,
+                            slot_number=number,
+                            type=spec["type"],
+                            is_charging_available=spec["is_charging_available"],
+                        )
+                        for number in numbers
+                    ),
+                    batch_size=self.batch_size,
+                )
+                # bulk_create sends no signals, so log the slots and move the counters here
+                record_slot_changes(slots)
+                ParkingSection.objects.filter(pk=section.pk).update(
+                    free_slots=F("free_slots") + len(numbers), updated_at=timezone.now()
+                )
+            bump_version(ParkingSection._meta.label_lower, section.pk)
+            slot_allocator.invalidate()
+            parking_logger.info(
+                f"{len(numbers)} Parking Slots created in section {section.id} by user {request.user.id}"
+            )
+            return Response(
+                {
+                    "message": f"{len(numbers)} Parking Slots created",
+                },
+                status=status.HTTP_201_CREATED,
+            )
+        except Exception as e:
+            api_errors_logger.exception(
+                f"Unhandled error in ParkingSlotBulkCreateApiView.post for user {request.user.id}: {str(e)}"
+            )
+            return Response(
+                {
+                    "message": "An error occurred while creating the Parking Slots.",
+                    "error": "Please try again later or contact support.",
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class TicketArchiveListApiView(FieldSelectionMixin, ListAPIView):
+    """Archived tickets, filtered by ?from=, ?to= (entry time) and ?parking="""
+
+    serializer_class = TicketArchiveSerializer
+    queryset = TicketArchive.objects.all()
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        start = parse_date_param(self.request, "from")
+        end = parse_date_param(self.request, "to", end_of_day=True)
+        parking = self.request.query_params.get("parking")
+        if parking and int_or_none(parking) is None:
+            raise ValidationError({"parking": "Enter a valid parking id."})
+        if start is not None:
+            queryset = queryset.filter(entry_time__gte=start)
+        if end is not None:
+            queryset = queryset.filter(entry_time__lte=end)
+        if parking:
+            queryset = queryset.filter(parking_id=int(parking))
+        return queryset
+
+
+class ExportApiView(APIView):
+    """Stream tickets or passes as CSV or NDJSON, optionally gzipped.
+
+    Filtered by ?from=, ?to= and ?parking=; ``?output=`` picks the format
+    (``?format=`` belongs to DRF's renderer negotiation).
+    """
+
+    permission_classes = [IsAuthenticated, IsAdmin]
+    content_types = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+    def get(self, request, kind, *args, **kwargs):
+        output = request.query_params.get("output", "csv")
+        if kind not in EXPORTS or output not in EXPORT_FORMATS:
+            return Response(
+                {
+                    "message": f"Export one of {', '.join(EXPORTS)} as {' or '.join(EXPORT_FORMATS)}",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        parking = request.query_params.get("parking")
+        if parking and int_or_none(parking) is None:
+            return Response(
+                {
+                    "message": "parking must be an integer id",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        compress = request.query_params.get("gzip", "").lower() in ("1", "true")
+        chunks = export_chunks(
+            kind,
+            output,
+            compress,
+            start=parse_date_param(request, "from"),
+            end=parse_date_param(request, "to", end_of_day=True),
+            parking=int(parking) if parking else None,
+        )
+        if isinstance(request._request, ASGIRequest):
+            chunks = iterate_in_thread(chunks)
+
+        filename = f"{kind}.{output}" + (".gz" if compress else "")
+        response = StreamingHttpResponse(
+            chunks, content_type="application/gzip" if compress else self.content_types[output]
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        parking_logger.info(f"{kind} export as {filename} started by user {request.user.id}")
+        return response
+
+
+class ImportApiView(APIView):
+    """Upsert vehicles or passes from an uploaded CSV or NDJSON ``file``.
+
+    The format follows ``?input=`` or the file extension. Rows are validated
+    and written in chunks; the response reports every row that failed.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, kind, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if kind not in IMPORTERS or upload is None:
+            return Response(
+                {
+                    "message": f"Upload a file to import one of {', '.join(IMPORTERS)}",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        input_format = request.query_params.get("input") or upload.name.rsplit(".", 1)[-1].lower()
+        if input_format not in IMPORT_FORMATS:
+            return Response(
+                {
+                    "message": f"Files must be {' or '.join(IMPORT_FORMATS)}",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            lines = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+            report = IMPORTERS[kind](request.user).run(read_rows(lines, input_format))
+        except UnicodeDecodeError:
+            return Response(
+                {
+                    "message": "Files must be UTF-8 encoded",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            api_errors_logger.exception(f"Error importing {kind} by user {request.user.id}: {str(e)}")
+            return Response(
+                {
+                    "message": f"An error occurred while importing {kind}.",
+                    "error": "Please try again later or contact support.",
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        parking_logger.info(
+            f"Imported {report['imported']} of {report['rows']} {kind} rows for user {request.user.id}"
+        )
+        return Response({"message": f"Imported {kind}", **report})
+
+
+class UsageReportApiView(APIView):
+    """Tickets, occupied minutes and revenue read from the usage rollups.
+
+    ``?grain=hour|day`` picks the rollup, ``?from=``/``?to=`` bound the
+    periods and ``?parking=``, ``?section=`` and ``?vehicle_type=`` filter
+    them. ``?by=`` groups by parking, section and/or vehicle_type. The
+    series view returns one row per period, the totals view sums the range.
+    Users other than superusers only see their own parkings.
+    """
+
+    permission_classes = [IsAuthenticated]
+    series = True
+    group_fields = {"parking": "parking_id", "section": "section_id", "vehicle_type": "vehicle_type"}
+
+    def get(self, request, *args, **kwargs):
+        grain = request.query_params.get("grain", "day").upper()
+        by = [name for name in request.query_params.get("by", "").split(",") if name]
+        if grain not in ROLLUP_GRAINS or any(name not in self.group_fields for name in by):
+            return Response(
+                {
+                    "message": f"grain must be hour or day and by a list of {', '.join(self.group_fields)}",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rollups = UsageRollup.objects.filter(grain=grain)
+        start = parse_date_param(request, "from")
+        end = parse_date_param(request, "to", end_of_day=True)
+        if start is not None:
+            rollups = rollups.filter(period_start__gte=start)
+        if end is not None:
+            rollups = rollups.filter(period_start__lte=end)
+        filters = {name: request.query_params.get(name) for name in self.group_fields}
+        try:
+            if filters["parking"]:
+                filters["parking"] = int(filters["parking"])
+            if filters["section"]:
+                filters["section"] = UUID(filters["section"])
+        except ValueError:
+            return Response(
+                {
+                    "message": "parking must be an integer and section a UUID",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        for name, field in self.group_fields.items():
+            if filters[name]:
+                rollups = rollups.filter(**{field: filters[name]})
+        if not request.user.is_superuser:
+            rollups = rollups.filter(parking_id__in=Parking.objects.filter(user=request.user).values("id"))
+
+        columns = (["period_start"] if self.series else []) + [self.group_fields[name] for name in by]
+        rows = (
+            rollups.values(*columns)
+            .annotate(tickets=Sum("tickets"), occupied_minutes=Sum("occupied_minutes"), revenue=Sum("revenue"))
+            .order_by(*columns)
+        )
+        return Response({"grain": grain.lower(), "data": list(rows)})
+
+
+class TicketAnalyticsApiView(APIView):
+    """Dwell time distribution, peak occupancy and turnover per section.
+
+    Covers stays overlapping ?from= to ?to= (the last 7 days by default),
+    optionally for one ?parking= or ?section=. Users other than superusers
+    only see their own parkings.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        end = parse_date_param(request, "to", end_of_day=True) or timezone.now()
+        start = parse_date_param(request, "from") or end - timedelta(days=7)
+        if start >= end:
+            return Response(
+                {
+                    "message": "from must be before to",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        tickets = Ticket.objects.all()
+        if not request.user.is_superuser:
+            tickets = tickets.filter(parking_slot__section__parking__user=request.user)
+        try:
+            section = request.query_params.get("section")
+            section = UUID(section) if section else None
+        except ValueError:
+            return Response(
+                {
+                    "message": "section must be a UUID",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        parking = request.query_params.get("parking")
+        if parking and int_or_none(parking) is None:
+            return Response(
+                {
+                    "message": "parking must be an integer id",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            ticket_analytics(start, end, parking=int(parking) if parking else None, section=section, tickets=tickets)
+        )
+
+
+class QuoteApiView(GateApiView):
+    """Price a stay starting at ?start= (now) from the cached rate tables and rules"""
+
+    def scoped_parking(self, request):
+        section = request.query_params.get("section")
+        try:
+            return rate_tables.parking_for_section(UUID(section)) if section else None
+        except ValueError:
+            return None
+
+    def get(self, request, *args, **kwargs):
+        serializer = QuoteSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if data.get("vehicle_number"):
+            vehicle = Vehicle.objects.filter(vehicle_number=data["vehicle_number"]).first()
+            if vehicle is None:
+                return Response(
+                    {
+                        "message": "Vehicle not found",
+                    },
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+        else:
+            # An unsaved vehicle is enough to quote, and keeps a warm quote off the database
+            vehicle = Vehicle(vehicle_type=data["vehicle_size"], is_electric=bool(data["has_charging"]))
+
+        result = quote(
+            vehicle,
+            data["section"],
+            timedelta(minutes=data["minutes"]),
+            billing_type=data.get("type"),
+            has_charging=data["has_charging"],
+            start=data.get("start"),
+        )
+        if result is None:
+            return Response(
+                {
+                    "message": "No price is set for this section and vehicle",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response({"message": "Quote", "data": result})
+
+
+class ActivePassApiView(GateApiView):
+    """Whether a vehicle holds a pass valid today, for one parking or any"""
+
+    def scoped_parking(self, request):
+        return int_or_none(request.query_params.get("parking"))
+
+    def get(self, request, *args, **kwargs):
+        vehicle_number = request.query_params.get("vehicle_number")
+        if not vehicle_number:
+            return Response(
+                {
+                    "message": "vehicle_number is required",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        parking = request.query_params.get("parking")
+        try:
+            parking = int(parking) if parking else None
+        except ValueError:
+            return Response(
+                {
+                    "message": "parking must be an integer id",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        active = pass_for_parking(active_passes(vehicle_number), parking)
+        return Response({"active": active is not None, "data": active})
+
+
+class ChangeFeedApiView(APIView):
+    """Slot and ticket changes after ?since=<seq>, optionally for one ?parking="""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get("since", 0))
+            parking = request.query_params.get("parking")
+            parking = int(parking) if parking else None
+            limit = min(max(int(request.query_params.get("limit", 500)), 1), 5000)
+        except ValueError:
+            return Response(
+                {
+                    "message": "since, parking and limit must be integers",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        changes, last_seq, has_more = changes_since(since, parking_id=parking, limit=limit)
+        return Response({"changes": changes, "last_seq": last_seq, "has_more": has_more})
+
+
+class AsyncApiView(View):
+    """Base for the async read views served under ASGI.
+
+    These are plain async Django views, DRF views are sync only, so requests
+    waiting on the database or a slow client hold no worker thread. Requests
+    are authenticated and authorized with the classes of GateApiView, so
+    device JWTs work and stay within their parking scope.
+    """
+
+    authentication_classes = GateApiView.authentication_classes
+    permission_classes = GateApiView.permission_classes
+    # Accept the DRF token as ?token= for clients that cannot send headers
+    query_token = False
+
+    def scoped_parking(self, request):
+        return self.kwargs.get("pk")
+
+    def check_access(self, request):
+        """The DRF exception refusing the request, or None after setting ``request.user``"""
+        key = request.GET.get("token")
+        if self.query_token and key and "HTTP_AUTHORIZATION" not in request.META:
+            request.META["HTTP_AUTHORIZATION"] = f"Token {key}"
+        drf_request = Request(request, authenticators=[auth() for auth in self.authentication_classes])
+        try:
+            user = drf_request.user
+        except APIException as exc:
+            return exc
+        for permission in (permission() for permission in self.permission_classes):
+            if not permission.has_permission(drf_request, self):
+                if not user.is_authenticated:
+                    return NotAuthenticated()
+                return PermissionDenied(getattr(permission, "message", None))
+        request.user, request.auth = user, drf_request.auth
+        return None
+
+    async def dispatch(self, request, *args, **kwargs):
+        refused = await sync_to_async(self.check_access)(request)
+        if refused is not None:
+            return JsonResponse(
+                {
+                    "message": str(refused.detail),
+                },
+                status=refused.status_code,
+            )
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class ParkingAvailabilityApiView(GateApiView):
+    """Free slots of a parking per section, slot type and charging"""
+
+    def get(self, request, pk, *args, **kwargs):
+        return Response({"parking": pk, "availability": list(slot_availability(pk))})
+
+
+class ParkingForecastApiView(GateApiView):
+    """Expected occupancy of a parking and its sections for the next ?hours= hours"""
+
+    max_hours = 48
+
+    def get(self, request, pk, *args, **kwargs):
+        hours = int_or_none(request.query_params.get("hours", 6))
+        if hours is None or not 1 <= hours <= self.max_hours:
+            return Response(
+                {
+                    "message": f"hours must be between 1 and {self.max_hours}",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Checked first so unknown ids never get a model cached
+        if not Parking.objects.filter(pk=pk).exists():
+            return Response(
+                {
+                    "message": "Parking not found",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        forecast = parking_forecast(pk, hours)
+        if forecast is None:
+            return Response(
+                {
+                    "message": "The forecast of this parking is being prepared, try again shortly",
+                },
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "30"},
+            )
+        return Response(forecast)
+
+
+class AsyncParkingAvailabilityView(AsyncApiView):
+    async def get(self, request, pk, *args, **kwargs):
+        availability = [row async for row in slot_availability(pk)]
+        return JsonResponse({"parking": pk, "availability": availability})
+
+
+class AsyncParkingOccupancyView(AsyncApiView):
+    async def get(self, request, pk, *args, **kwargs):
+        occupancy = await aparking_occupancy(pk)
+        if not occupancy["sections"] and not await Parking.objects.filter(pk=pk).aexists():
+            return JsonResponse(
+                {
+                    "message": "Parking not found",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return JsonResponse(occupancy)
+
+
+class AsyncActivePassView(AsyncApiView):
+    def scoped_parking(self, request):
+        return int_or_none(request.GET.get("parking"))
+
+    async def get(self, request, *args, **kwargs):
+        vehicle_number = request.GET.get("vehicle_number")
+        if not vehicle_number:
+            return JsonResponse(
+                {
+                    "message": "vehicle_number is required",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        parking = request.GET.get("parking")
+        try:
+            parking = int(parking) if parking else None
+        except ValueError:
+            return JsonResponse(
+                {
+                    "message": "parking must be an integer id",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        active = pass_for_parking(await aactive_passes(vehicle_number), parking)
+        return JsonResponse({"active": active is not None, "data": active})
+
+
+class AsyncTicketView(AsyncApiView):
+    def scoped_parking(self, request):
+        # Runs in check_access, on a sync thread
+        return (
+            Ticket.objects.filter(pk=self.kwargs["pk"])
+            .values_list("parking_slot__section__parking_id", flat=True)
+            .first()
+        )
+
+    async def get(self, request, pk, *args, **kwargs):
+        ticket = await Ticket.objects.filter(pk=pk).afirst()
+        if ticket is None:
+            return JsonResponse(
+                {
+                    "message": "Ticket not found",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        # Without ?expand= the serializer only reads columns, so it is safe in the event loop
+        return JsonResponse(TicketSerializer(ticket).data)
+
+
+class ParkingStreamView(AsyncApiView):
+    """Server-Sent Events stream of slot, ticket and occupancy changes of a parking.
+
+    EventSource cannot send headers, so the token may also be passed as
+    ``?token=``.
+    """
+
+    query_token = True
+
+    async def get(self, request, pk, *args, **kwargs):
+        if not await Parking.objects.filter(pk=pk).aexists():
+            return JsonResponse(
+                {
+                    "message": "Parking not found",
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        since = request.headers.get("Last-Event-ID") or request.GET.get("since")
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            return JsonResponse(
+                {
+                    "message": "Last-Event-ID must be an integer",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        response = StreamingHttpResponse(parking_events(pk, since), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
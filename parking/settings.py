@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
 
@@ -45,13 +46,17 @@ INSTALLED_APPS = [
     "api",
 ]
 
+# Only token clients call /api/: skip sessions, CSRF and messages there
+API_TOKEN_ONLY = os.getenv("API_TOKEN_ONLY", "False").lower() == "true"
+
+# The session, CSRF, auth and message middleware are bypassed on /api/ with API_TOKEN_ONLY
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "api.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
+    "api.middleware.CsrfViewMiddleware",
+    "api.middleware.AuthenticationMiddleware",
+    "api.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -107,6 +112,22 @@ DATABASES = {
 #     }
 # }
 
+# Cache
+# Local memory by default. Point CACHE_BACKEND at
+# django.core.cache.backends.filebased.FileBasedCache or
+# django.core.cache.backends.redis.RedisCache (needs the redis package) and
+# CACHE_LOCATION at a directory or redis:// URL to share it between workers.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "parking-lot"),
+    }
+}
+
+# Cached Parking, ParkingSection and ParkingPrice responses expire after this
+CATALOGUE_CACHE_SECONDS = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -213,16 +234,25 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
-        "rest_framework.authentication.SessionAuthentication",
-    ],
+    "DEFAULT_AUTHENTICATION_CLASSES": ["api.authentication.CachedTokenAuthentication"]
+    + ([] if API_TOKEN_ONLY else ["rest_framework.authentication.SessionAuthentication"]),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.IdCursorPagination",
+    "PAGE_SIZE": 50,
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
     # ]
 }
 
+# Gate device JWTs: access tokens are verified without a database lookup,
+# so keep them short lived; devices refresh them from their refresh token
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
+    "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
+    "AUTH_HEADER_TYPES": ("Bearer",),
+    "UPDATE_LAST_LOGIN": False,
+}
+
 # Docs settings
 SPECTACULAR_SETTINGS = {
     "TITLE": "Parking Lot API",
@@ -241,6 +271,46 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Free slot lists held by api.allocation are rebuilt from the database this often
+SLOT_ALLOCATOR_REFRESH_SECONDS = 30
+
+# Closed tickets older than this are moved to TicketArchive by archive-tickets
+TICKET_ARCHIVE_AFTER_DAYS = 90
+
+# Compiled ParkingPrice rate tables held by api.pricing are rebuilt this often
+PRICING_CACHE_SECONDS = 300
+
+# How long the active pass lookup used at the gate is cached per vehicle
+ACTIVE_PASS_CACHE_SECONDS = 60
+
+# /api/changes holds back changes younger than this, so transactions still committing are not skipped
+CHANGE_FEED_LAG_SECONDS = 5
+
+# Live parking streams: seconds between keep-alive comments, between the reads of
+# the change feed each worker makes per parking for changes of other workers, events
+# buffered per listener and changes replayed after Last-Event-ID before a reset
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_POLL_SECONDS = 5
+STREAM_QUEUE_SIZE = 1000
+STREAM_REPLAY_LIMIT = 5000
+
+# rollup-usage leaves tickets closed in the last ROLLUP_LAG_SECONDS for its next run
+ROLLUP_LAG_SECONDS = 60
+
+# Days of tickets the occupancy forecasts of api.forecast are first fitted on. A
+# request finding a model stale refits it in a background thread, holding a lock
+# in the cache for at most FORECAST_REFIT_LOCK_SECONDS, or in the request itself
+# without FORECAST_REFIT_IN_BACKGROUND. Run refit-forecasts hourly to avoid both
+FORECAST_HISTORY_DAYS = 28
+FORECAST_REFIT_LOCK_SECONDS = 600
+FORECAST_REFIT_IN_BACKGROUND = True
+
+# Token -> user lookups kept per worker by api.authentication. Logouts reach the
+# other workers through the cache above, so with a per-process backend it is off
+PROCESS_LOCAL_CACHES = ("django.core.cache.backends.locmem.LocMemCache", "django.core.cache.backends.dummy.DummyCache")
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_SECONDS = 0 if CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHES else 300
+
 SITE_URL = "http://127.0.0.1:8000"
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')